@@ -1,5 +1,55 @@
-from django.contrib import admin
-from .models import Block, Floor, Room, UserProfile
+from django import forms
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connection, transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import availability
+from .models import (
+    AllocationRound, ArchivedBooking, Block, Booking, BookingEvent, Floor, Room, RoomPreference, RoomRequest,
+    UserProfile,
+)
+from .services import booking, journal, lottery, occupancy
+
+
+# Unfiltered changelists of tables at least this big show the planner's row estimate instead of COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimated_row_count(model):
+    """Row count from the database's statistics (PostgreSQL, or SQLite after ANALYZE), or None"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            try:
+                # The first number of each row is the table's row count at the last ANALYZE
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            except DatabaseError:  # never analyzed, so there is no sqlite_stat1
+                return None
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Skips COUNT(*) over a whole large table, which scans it; filtered lists are still counted exactly"""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
 
 
 @admin.register(UserProfile)
@@ -23,17 +73,272 @@ class BlockAdmin(admin.ModelAdmin):
 @admin.register(Floor)
 class FloorAdmin(admin.ModelAdmin):
     list_display = ['block', 'floor_number']
+    list_select_related = ['block']
     list_filter = ['block']
     search_fields = ['block__block_name', 'floor_number']
 
 
+class BookingInlineFormSet(forms.BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        active = sum(
+            1 for form in self.forms
+            if form.cleaned_data and not form.cleaned_data.get('DELETE')
+            and form.cleaned_data.get('status') == Booking.ACTIVE
+        )
+        if active > self.instance.capacity:
+            raise forms.ValidationError('More active bookings than the room capacity.')
+
+
+class BookingAdminForm(forms.ModelForm):
+    class Meta:
+        model = Booking
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        room = cleaned_data.get('room')
+        if room is None or cleaned_data.get('status') != Booking.ACTIVE:
+            return cleaned_data
+        others = Booking.objects.active().filter(room=room).exclude(pk=self.instance.pk).count()
+        if others >= room.capacity:
+            self.add_error('room', f'{room} is full ({others} of {room.capacity} beds taken).')
+        return cleaned_data
+
+
+class BookingInline(admin.TabularInline):
+    model = Booking
+    formset = BookingInlineFormSet
+    fields = ['user', 'term', 'status', 'created_at', 'cancelled_at']
+    raw_id_fields = ['user']
+    extra = 0
+
+    def get_queryset(self, request):
+        # History stays on the Booking changelist; the room page shows who lives there now
+        return super().get_queryset(request).active().select_related('user')
+
+
+class OccupancyStatusFilter(admin.SimpleListFilter):
+    title = 'occupancy'
+    parameter_name = 'occupancy_status'
+
+    def lookups(self, request, model_admin):
+        return [('empty', 'Empty'), ('partial', 'Partially booked'), ('full', 'Full')]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(occupancy_status=self.value())
+        return queryset
+
+
+class FloorNumberFilter(admin.SimpleListFilter):
+    # Listing every Floor by its __str__ would cost a block query per floor
+    title = 'floor'
+    parameter_name = 'floor_number'
+
+    def lookups(self, request, model_admin):
+        numbers = Floor.objects.order_by('floor_number').values_list('floor_number', flat=True).distinct()
+        return [(str(number), f'Floor {number}') for number in numbers]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(floor__floor_number=self.value())
+        return queryset
+
+
+class CapacityForm(forms.Form):
+    capacity = forms.IntegerField(min_value=1, max_value=20)
+
+
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ['room_number', 'block_name', 'floor', 'capacity', 'is_booked', 'booked_by']
-    list_filter = ['is_booked', 'floor__block', 'floor']
+    list_display = ['room_number', 'block_name', 'floor', 'capacity', 'occupancy', 'free_spots', 'is_booked', 'booked_by']
+    list_filter = [OccupancyStatusFilter, 'is_booked', 'floor__block', FloorNumberFilter]
+    list_select_related = ['floor__block', 'booked_by']
     search_fields = ['room_number', 'floor__block__block_name']
     readonly_fields = ['is_booked', 'booked_by']
-    
+    inlines = [BookingInline]
+    actions = ['evict_occupants', 'change_capacity']
+    paginator = EstimatedCountPaginator
+    # The "N total" link would COUNT the whole table again on every filtered page
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Free spots and status come from the stored counter: no per-row COUNT of bookings
+        return super().get_queryset(request).with_occupancy()
+
+    @admin.display(description='Block', ordering='floor__block__block_name')
     def block_name(self, obj):
         return obj.floor.block.block_name
-    block_name.short_description = 'Block'
+
+    @admin.display(description='Occupancy', ordering='occupancy')
+    def occupancy(self, obj):
+        return f'{obj.occupancy}/{obj.capacity}'
+
+    @admin.display(description='Free spots', ordering='free_spots')
+    def free_spots(self, obj):
+        return obj.free_spots
+
+    def save_related(self, request, form, formsets, change):
+        occupants = Booking.objects.active().filter(room_id=form.instance.pk).values_list('user_id', 'room_id')
+        before = set(occupants)
+        super().save_related(request, form, formsets, change)
+        # Deleted inlines were journaled by the Booking delete signal
+        deleted = {
+            (inline.instance.user_id, inline.instance.room_id)
+            for formset in formsets for inline in formset.deleted_forms
+        }
+        journal.record_changes(before - deleted, set(occupants.all()), 'admin')
+        user_ids = {
+            inline.instance.user_id
+            for formset in formsets for inline in formset.forms
+            if inline.has_changed() and inline.instance.user_id
+        }
+        booking.resync_rooms([form.instance.pk], user_ids)
+
+    @admin.action(description='Evict all occupants of selected rooms', permissions=['change'])
+    def evict_occupants(self, request, queryset):
+        room_ids = list(queryset.values_list('pk', flat=True))
+        with transaction.atomic():
+            active = Booking.objects.active().filter(room_id__in=room_ids)
+            evicted = list(active.values_list('user_id', 'room_id'))
+            user_ids = [user_id for user_id, _ in evicted]
+            active.update(status=Booking.CANCELLED, cancelled_at=timezone.now())
+            journal.record_changes(evicted, (), 'admin')
+            booking.resync_rooms(room_ids, user_ids)
+        self.message_user(request, f'Evicted {len(user_ids)} student(s) from {len(room_ids)} room(s).', messages.SUCCESS)
+
+    @admin.action(description='Change capacity of selected rooms', permissions=['change'])
+    def change_capacity(self, request, queryset):
+        form = CapacityForm(request.POST if 'apply' in request.POST else None)
+        if not form.is_valid():
+            return TemplateResponse(request, 'admin/hostel/room/change_capacity.html', {
+                **self.admin_site.each_context(request),
+                'title': 'Change capacity',
+                'opts': self.model._meta,
+                'form': form,
+                'room_count': queryset.count(),
+                'select_across': request.POST.get('select_across') == '1',
+                'selected': request.POST.getlist(admin.helpers.ACTION_CHECKBOX_NAME),
+                'action_checkbox_name': admin.helpers.ACTION_CHECKBOX_NAME,
+            })
+
+        capacity = form.cleaned_data['capacity']
+        room_ids = list(queryset.values_list('pk', flat=True))
+        with transaction.atomic():
+            # Never below the current occupants; those rooms are left alone and reported
+            rooms = Room.objects.filter(pk__in=room_ids, occupancy__lte=capacity)
+            changed = rooms.update(
+                capacity=capacity,
+                is_booked=ExpressionWrapper(Q(occupancy__gte=capacity), output_field=BooleanField()),
+            )
+            occupancy.refresh_rooms(room_ids)
+            availability.bump_rooms_on_commit(room_ids)
+        self.message_user(request, f'Set the capacity of {changed} room(s) to {capacity}.', messages.SUCCESS)
+        if changed < len(room_ids):
+            self.message_user(
+                request, f'{len(room_ids) - changed} room(s) have more occupants than that and were not changed.',
+                messages.WARNING,
+            )
+
+
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    form = BookingAdminForm
+    list_display = ['user', 'room', 'term', 'status', 'created_at', 'cancelled_at']
+    list_filter = ['status', 'term']
+    search_fields = ['user__username', 'room__room_number', 'room__floor__block__block_name']
+    list_select_related = ['user', 'room__floor__block']
+    raw_id_fields = ['user', 'room']
+
+    def save_model(self, request, obj, form, change):
+        previous_room_id = form.initial.get('room') if change else None
+        previous_user_id = form.initial.get('user') if change else None
+        was_active = change and form.initial.get('status') == Booking.ACTIVE
+        super().save_model(request, obj, form, change)
+        journal.record_changes(
+            [(previous_user_id, previous_room_id)] if was_active else [],
+            [(obj.user_id, obj.room_id)] if obj.status == Booking.ACTIVE else [],
+            'admin',
+        )
+        booking.resync_rooms(
+            (room_id for room_id in (obj.room_id, previous_room_id) if room_id),
+            (user_id for user_id in (obj.user_id, previous_user_id) if user_id),
+        )
+
+
+@admin.register(BookingEvent)
+class BookingEventAdmin(admin.ModelAdmin):
+    # Ids rather than joins: the users and rooms an event mentions may be gone
+    list_display = ['id', 'kind', 'user_id', 'room_id', 'from_room_id', 'source', 'created_at']
+    list_filter = ['kind', 'source']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # The journal is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user_id', 'room_id', 'term', 'status', 'created_at', 'archived_at']
+    list_filter = ['term', 'status']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AllocationRound)
+class AllocationRoundAdmin(admin.ModelAdmin):
+    list_display = ['name', 'term', 'opens_at', 'closes_at', 'status', 'entries', 'allocated_at', 'seed']
+    list_filter = ['status', 'term']
+    readonly_fields = ['status', 'seed', 'allocated_at']
+    actions = ['run_lottery']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(entry_count=Count('requests'))
+
+    @admin.display(description='Entries', ordering='entry_count')
+    def entries(self, obj):
+        return obj.entry_count
+
+    @admin.action(description='Run the lottery of selected rounds', permissions=['change'])
+    def run_lottery(self, request, queryset):
+        for allocation_round in queryset.filter(status=AllocationRound.OPEN):
+            result = lottery.run_lottery(allocation_round)
+            self.message_user(
+                request,
+                f'{allocation_round}: placed {result.placed} student(s), {result.unplaced} unplaced (seed {result.seed}).',
+                messages.SUCCESS,
+            )
+        skipped = queryset.exclude(status=AllocationRound.OPEN).count()
+        if skipped:
+            self.message_user(request, f'{skipped} round(s) were already allocated and were skipped.', messages.WARNING)
+
+
+class RoomPreferenceInline(admin.TabularInline):
+    model = RoomPreference
+    raw_id_fields = ['room']
+    extra = 0
+
+
+@admin.register(RoomRequest)
+class RoomRequestAdmin(admin.ModelAdmin):
+    list_display = ['user', 'round', 'priority', 'group_code', 'assigned_room', 'created_at']
+    list_filter = ['round']
+    list_select_related = ['user', 'round', 'assigned_room__floor__block']
+    search_fields = ['user__username', 'group_code']
+    raw_id_fields = ['user', 'assigned_room']
+    inlines = [RoomPreferenceInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
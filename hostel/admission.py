@@ -0,0 +1,245 @@
+"""
+Admission control for the booking views, for the minute allocation opens.
+
+Three layers, all kept in the cache (settings.HOSTEL_ADMISSION_CACHE; use a
+shared backend such as Redis when running several workers):
+
+- A token bucket per student (HOSTEL_ADMISSION_USER_RATE requests a second,
+  bursts of HOSTEL_ADMISSION_USER_BURST) stops one student hammering the
+  booking pages. Over it they get a 429.
+- At most HOSTEL_ADMISSION_CONCURRENCY booking POSTs run at once, across all
+  workers. Each holds a slot: a cache key added with a lease timeout, so a
+  worker that dies never leaks its slot for long. SQLite takes one writer
+  at a time, so a few in flight keep it busy without a pile-up on its lock.
+- A POST that finds every slot taken, or a queue already waiting, gets a
+  numbered ticket and the waiting room page instead. The page polls
+  queue_status_view, which answers from the cache without a query. Each
+  booking that finishes lets the next ticket in, so the queue moves exactly
+  as fast as the database gets through bookings; the page then resubmits
+  the student's original form with the ticket. A ticket admits one POST:
+  it is marked used when it gets its slot, and a replayed ticket is rate
+  limited and queued again like a request without one.
+
+Browsing pages are not wrapped, so they stay fast however long the queue
+gets. A turn handed to a student who has left is noticed by the pollers
+after STALL_SECONDS and given to the next ticket. The counters are updated
+without a lock, so the order is approximately FIFO; the slots are what
+bound the load on the database.
+"""
+import math
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.shortcuts import render
+
+
+TICKET_FIELD = 'admission_ticket'
+TICKET_SALT = 'hostel.admission.ticket'
+TICKET_MAX_AGE = 3600
+POLL_SECONDS = 2
+# A queue that has not moved for this long with slots free has lost turns to students who left
+STALL_SECONDS = 2
+
+_TAIL = 'hostel:admission:tail'  # last ticket handed out
+_SERVING = 'hostel:admission:serving'  # tickets up to this one may enter
+_MOVED_AT = 'hostel:admission:moved_at'
+
+
+def _cache():
+    return caches[getattr(settings, 'HOSTEL_ADMISSION_CACHE', 'default')]
+
+
+def _setting(name, default):
+    return getattr(settings, f'HOSTEL_ADMISSION_{name}', default)
+
+
+def enabled():
+    return _setting('ENABLED', True)
+
+
+def take_token(user_id, now=None):
+    """
+    Spend one of user_id's tokens. Returns 0 if the request may go ahead,
+    else the seconds until a token is free. A token bucket kept as one
+    timestamp (GCRA): the time the bucket would next be full.
+    """
+    now = time.time() if now is None else now
+    interval = 1 / _setting('USER_RATE', 1.0)
+    key = f'hostel:admission:user:{user_id}'
+    cache = _cache()
+    full_at = max(cache.get(key, now), now)
+    wait = full_at - now - (_setting('USER_BURST', 10) - 1) * interval
+    if wait > 0:
+        return wait
+    cache.set(key, full_at + interval, timeout=math.ceil(full_at + interval - now) + 1)
+    return 0
+
+
+def _slot_keys():
+    return [f'hostel:admission:slot:{index}' for index in range(_setting('CONCURRENCY', 4))]
+
+
+def acquire_slot():
+    """Claim one of the concurrency slots; returns it for release_slot(), or None if all are taken"""
+    cache = _cache()
+    lease = _setting('SLOT_SECONDS', 30)
+    owner = uuid.uuid4().hex
+    for key in _slot_keys():
+        if cache.add(key, owner, timeout=lease):
+            return key, owner
+    return None
+
+
+def release_slot(slot):
+    """Free slot and hand its turn to the next ticket in the queue"""
+    key, owner = slot
+    cache = _cache()
+    # The lease may have run out and been taken by another request meanwhile
+    if cache.get(key) == owner:
+        cache.delete(key)
+    if queue_length():
+        _move(1)
+
+
+def _counters():
+    cache = _cache()
+    cache.add(_TAIL, 0, timeout=None)
+    cache.add(_SERVING, 0, timeout=None)
+    values = cache.get_many([_TAIL, _SERVING])
+    return values.get(_TAIL, 0), values.get(_SERVING, 0)
+
+
+def queue_length():
+    tail, serving = _counters()
+    return max(0, tail - serving)
+
+
+def take_ticket():
+    tail, serving = _counters()
+    if tail <= serving:
+        # A new queue: it has not stalled, however long ago the last one moved
+        _cache().set(_MOVED_AT, time.time(), timeout=None)
+    return _cache().incr(_TAIL)
+
+
+def _move(turns, now=None):
+    cache = _cache()
+    cache.set(_MOVED_AT, time.time() if now is None else now, timeout=None)
+    return cache.incr(_SERVING, turns)
+
+
+def ticket_status(ticket, now=None):
+    """(tickets ahead of ticket, whether it may enter now)"""
+    now = time.time() if now is None else now
+    tail, serving = _counters()
+    if ticket > tail:
+        # The counters were lost (cache restart): the ticket is from an older queue
+        return 0, True
+    if ticket > serving and now - _cache().get(_MOVED_AT, now) >= STALL_SECONDS:
+        # Nobody came for the last turns: give the free slots to the next tickets
+        free = len(_slot_keys()) - len(_cache().get_many(_slot_keys()))
+        if free:
+            serving = _move(min(free, tail - serving), now)
+    return max(0, ticket - serving), ticket <= serving
+
+
+def _used_key(ticket):
+    return f'hostel:admission:used:{ticket}'
+
+
+def ticket_used(ticket):
+    return bool(_cache().get(_used_key(ticket)))
+
+
+def use_ticket(ticket):
+    """Mark ticket used; False if it already was (add() settles two replays racing for it)"""
+    return _cache().add(_used_key(ticket), True, timeout=TICKET_MAX_AGE)
+
+
+def sign_ticket(ticket, user_id):
+    return signing.dumps({'t': ticket, 'u': user_id}, salt=TICKET_SALT)
+
+
+def read_ticket(value, user_id=None):
+    """The ticket number in a signed ticket, or None if it is forged, expired or someone else's"""
+    try:
+        data = signing.loads(value, salt=TICKET_SALT, max_age=TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if user_id is not None and data.get('u') != user_id:
+        return None
+    return data.get('t')
+
+
+def _waiting_room(request, ticket, signed):
+    position, _ = ticket_status(ticket)
+    context = {
+        'ticket': ticket,
+        'signed_ticket': signed,
+        'position': position,
+        'poll_seconds': POLL_SECONDS,
+        # Replayed when the ticket's turn comes; the template adds a fresh CSRF token
+        'fields': [
+            (name, value) for name, values in request.POST.lists()
+            if name not in ('csrfmiddlewaretoken', TICKET_FIELD) for value in values
+        ],
+    }
+    # 202: the request is accepted and will be sent again; not an error worth logging
+    response = render(request, 'hostel/waiting_room.html', context, status=202)
+    response['Retry-After'] = str(POLL_SECONDS)
+    return response
+
+
+def _too_many_requests(request, wait):
+    response = render(request, 'hostel/too_many_requests.html', {'wait': math.ceil(wait)}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def admission_controlled(view):
+    """
+    Rate-limit a booking view per student and pass its POSTs through the
+    concurrency cap and the waiting room. Put it under login_required.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not enabled():
+            return view(request, *args, **kwargs)
+        user_id = request.user.pk
+        signed = request.POST.get(TICKET_FIELD) if request.method == 'POST' else None
+        ticket = read_ticket(signed, user_id) if signed else None
+        if ticket is not None and ticket_used(ticket):
+            # Each ticket admits one POST; a replayed one queues again like any other request
+            ticket = None
+
+        # A ticket holder is paced by the queue already
+        if ticket is None:
+            wait = take_token(user_id)
+            if wait:
+                return _too_many_requests(request, wait)
+        if request.method != 'POST':
+            return view(request, *args, **kwargs)
+
+        if ticket is None:
+            slot = acquire_slot() if not queue_length() else None
+            if slot is None:
+                ticket = take_ticket()
+                return _waiting_room(request, ticket, sign_ticket(ticket, user_id))
+        else:
+            _, ready = ticket_status(ticket)
+            slot = acquire_slot() if ready else None
+            if slot is None:
+                return _waiting_room(request, ticket, signed)
+            if not use_ticket(ticket):
+                release_slot(slot)
+                ticket = take_ticket()
+                return _waiting_room(request, ticket, sign_ticket(ticket, user_id))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            release_slot(slot)
+    return wrapper
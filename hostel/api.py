@@ -0,0 +1,271 @@
+"""
+JSON availability API for kiosks and the mobile app, plus staff-only
+endpoints for placing many groups of students at once and for tailing the
+booking journal.
+
+Responses are built from the same versioned snapshots as the HTML pages and
+carry a strong ETag made of the block's availability version, so a client
+revalidating unchanged data gets a 304 straight from the cache, without a
+query against the room tables. Room lists are paginated by key: the cursor
+is the (floor_number, room_number) of the last room on the previous page.
+"""
+import base64
+import binascii
+import json
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from . import availability
+from .models import Room
+from .routers import pin_to_primary, read_only_view
+from .services import booking, journal
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MAX_GROUPS = 500
+
+# Statuses of groups that were never attempted
+UNKNOWN_ROOM = 'unknown_room'
+UNKNOWN_USER = 'unknown_user'
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_view(view):
+    """GET only, signed-in users only, JSON errors and revalidate-every-time caching"""
+    @require_GET
+    @read_only_view
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _error('Authentication required.', 401)
+        try:
+            response = view(request, *args, **kwargs)
+        except BadRequest as exc:
+            return _error(str(exc), 400)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
+
+
+def _may_see(request, gender):
+    return request.user.is_staff or request.user_context.gender == gender
+
+
+def _block_for(request, block_id):
+    """The block's details if it exists and request's user may see it, else None"""
+    block = availability.get_block(block_id)
+    if block is None or not _may_see(request, block['gender']):
+        return None
+    return block
+
+
+def _denied(request, block_id):
+    if availability.get_block(block_id) is None:
+        return _error('No such block.', 404)
+    return _error('This block is not available to you.', 403)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        floor_number, room_number = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise BadRequest('Invalid cursor.')
+    if not isinstance(floor_number, int) or not isinstance(room_number, str):
+        raise BadRequest('Invalid cursor.')
+    return floor_number, room_number
+
+
+def _int_param(request, name, default=None, minimum=None, maximum=None):
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest(f'{name} must be an integer.')
+    if minimum is not None and value < minimum:
+        raise BadRequest(f'{name} must be at least {minimum}.')
+    return min(value, maximum) if maximum is not None else value
+
+
+def _blocks_gender(request):
+    return request.GET.get('gender') or request.user_context.gender
+
+
+def _blocks_etag(request):
+    gender = _blocks_gender(request)
+    if not gender or not _may_see(request, gender):
+        return None
+    return availability.etag(availability.BLOCKS_LIST, gender)
+
+
+@api_view
+@condition(etag_func=_blocks_etag)
+def blocks_api(request):
+    """Blocks for ?gender= (default: the user's own)"""
+    gender = _blocks_gender(request)
+    if not gender:
+        raise BadRequest('gender is required.')
+    if not _may_see(request, gender):
+        return _error('These blocks are not available to you.', 403)
+    return JsonResponse({'blocks': availability.get_blocks_list(gender)})
+
+
+def _rooms_etag(request, block_id):
+    if _block_for(request, block_id) is None:
+        return None
+    return availability.etag(block_id)
+
+
+@api_view
+@condition(etag_func=_rooms_etag)
+def block_rooms_api(request, block_id):
+    """Rooms of a block (optionally one ?floor=) with occupancy, ?limit= at a time from ?cursor="""
+    block = _block_for(request, block_id)
+    if block is None:
+        return _denied(request, block_id)
+    floor_number = _int_param(request, 'floor')
+    limit = _int_param(request, 'limit', DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    cursor = request.GET.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+
+    rooms, next_key = availability.get_room_page(block_id, floor_number, after, limit)
+    return JsonResponse({
+        'block': block,
+        'rooms': rooms,
+        'next_cursor': encode_cursor(next_key) if next_key else None,
+    })
+
+
+def _room_etag(request, room_id):
+    block_id = availability.room_block_id(room_id)
+    if block_id is None or _block_for(request, block_id) is None:
+        return None
+    return availability.etag(block_id, 'room', room_id)
+
+
+@api_view
+@condition(etag_func=_room_etag)
+def room_api(request, room_id):
+    block_id = availability.room_block_id(room_id)
+    room = availability.get_room(block_id, room_id) if block_id is not None else None
+    if room is None:
+        return _error('No such room.', 404)
+    block = _block_for(request, block_id)
+    if block is None:
+        return _denied(request, block_id)
+    return JsonResponse({'block': block, 'room': room})
+
+
+def _event(event):
+    return {
+        'id': event.pk,
+        'kind': event.kind,
+        'user': event.user_id,
+        'room': event.room_id,
+        'from_room': event.from_room_id,
+        'source': event.source,
+        'created_at': event.created_at.isoformat(),
+    }
+
+
+@api_view
+def booking_events_api(request):
+    """
+    Booking journal events after ?after= (an event id, default 0), oldest
+    first, ?limit= at a time (staff only). Ask again with after=last_id until
+    more is false, then poll from there.
+    """
+    if not request.user.is_staff:
+        return _error('Only staff can read the booking journal.', 403)
+    after = _int_param(request, 'after', 0, minimum=0)
+    limit = _int_param(request, 'limit', DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    # One extra row says whether there is another page
+    events = journal.events_since(after, limit + 1)
+    more = len(events) > limit
+    events = events[:limit]
+    return JsonResponse({
+        'events': [_event(event) for event in events],
+        'last_id': events[-1].pk if events else after,
+        'more': more,
+    })
+
+
+def _parse_groups(body):
+    """The groups of a group booking request as (room id, [usernames]) pairs, and the switch flag"""
+    try:
+        payload = json.loads(body)
+        groups, switch = payload['groups'], payload.get('switch', False)
+    except (ValueError, TypeError, KeyError):
+        raise BadRequest('Send a JSON object with a list of groups.')
+    if not isinstance(groups, list) or not isinstance(switch, bool):
+        raise BadRequest('groups must be a list and switch a boolean.')
+    if len(groups) > MAX_GROUPS:
+        raise BadRequest(f'At most {MAX_GROUPS} groups per request.')
+    parsed = []
+    for group in groups:
+        if not isinstance(group, dict):
+            raise BadRequest('Each group must be an object with room and usernames.')
+        room_id, usernames = group.get('room'), group.get('usernames')
+        if (
+            not isinstance(room_id, int) or not isinstance(usernames, list) or not usernames
+            or not all(isinstance(name, str) for name in usernames)
+        ):
+            raise BadRequest('Each group needs a room id and a non-empty list of usernames.')
+        parsed.append((room_id, list(dict.fromkeys(usernames))))
+    return parsed, switch
+
+
+@require_POST
+def group_bookings_api(request):
+    """
+    Place many groups at once (staff only). Body:
+    {"switch": false, "groups": [{"room": 12, "usernames": ["alice", "bob"]}, ...]}
+    Each group is booked all-or-nothing; the response has a result per group, in order.
+    """
+    if not request.user.is_authenticated:
+        return _error('Authentication required.', 401)
+    if not request.user.is_staff:
+        return _error('Only staff can place groups.', 403)
+    try:
+        groups, switch = _parse_groups(request.body)
+    except BadRequest as exc:
+        return _error(str(exc), 400)
+
+    # Every room and student of the request in two queries
+    rooms = Room.objects.select_related('floor__block').in_bulk({room_id for room_id, _ in groups})
+    users = User.objects.in_bulk({name for _, usernames in groups for name in usernames}, field_name='username')
+
+    results = [None] * len(groups)
+    placements, placed = [], []
+    for index, (room_id, usernames) in enumerate(groups):
+        unknown = [name for name in usernames if name not in users]
+        if room_id not in rooms:
+            results[index] = {'room': room_id, 'status': UNKNOWN_ROOM, 'usernames': []}
+        elif unknown:
+            results[index] = {'room': room_id, 'status': UNKNOWN_USER, 'usernames': unknown}
+        else:
+            placements.append(([users[name] for name in usernames], rooms[room_id]))
+            placed.append(index)
+
+    for index, result in zip(placed, booking.book_groups(placements, switch=switch)):
+        results[index] = {'room': result.room.pk, 'status': result.status.value, 'usernames': list(result.usernames)}
+    if placements:
+        pin_to_primary(request)
+    return JsonResponse({'results': results})
@@ -0,0 +1,182 @@
+"""
+Async versions of the read-only browsing views.
+
+hostel/urls.py routes the browsing pages here when HOSTEL_ASYNC_VIEWS is on,
+which hostel_booking/asgi.py turns on by default. The views behave exactly like
+their counterparts in views.py (same messages, redirects, templates and
+conditional GET), but wait on the database through the async ORM instead of
+holding a worker thread, and ask for independent rows together with
+asyncio.gather. Django still runs one request's queries one after another on
+that request's own thread, so the win is concurrency across requests.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import redirect, render
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import availability
+from .models import Booking, Room, UserProfile
+from .routers import read_only_view
+from .views import _block_layout, _layout_validators, _room_validators
+
+
+async def _viewer(request):
+    """The signed-in user, also installed where templates and UserContext look, so it is loaded once"""
+    user = await request.auser()
+    request.user = user
+    request.user_context.user = user
+    return user
+
+
+async def _profile(user):
+    return await UserProfile.objects.filter(user_id=user.pk).afirst()
+
+
+def _remember_profile(request, profile):
+    # UserContext.profile is a cached_property: later readers (validators, templates) reuse this row
+    request.user_context.profile = profile
+
+
+async def _gender_or_redirect(request, user, profile):
+    """Async _user_gender_or_redirect: (gender, None), or (None, redirect)"""
+    if profile is None:
+        _remember_profile(request, await UserProfile.objects.acreate(user=user))
+        messages.error(request, 'Your profile was missing. Please update your gender information.')
+        return None, redirect('dashboard')
+    if not profile.gender:
+        messages.error(request, 'Gender information is required. Access denied.')
+        return None, redirect('dashboard')
+    return profile.gender, None
+
+
+async def _not_modified(request, validators):
+    """A 304 response if the client's copy is current, like @condition"""
+    etag, last_modified = validators
+    if etag is None:
+        return None
+    return get_conditional_response(
+        request, etag=quote_etag(etag), last_modified=int(last_modified.timestamp()),
+    )
+
+
+def _with_validators(response, validators):
+    etag, last_modified = validators
+    if etag is not None:
+        response.headers.setdefault('ETag', quote_etag(etag))
+        response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+    return response
+
+
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@login_required
+@read_only_view
+async def blocks_list_view(request):
+    """Show list of blocks filtered by user's gender"""
+    user = await _viewer(request)
+    user_profile = await _profile(user)
+    _remember_profile(request, user_profile)
+    if user_profile is None:
+        _remember_profile(request, await UserProfile.objects.acreate(user=user))
+        messages.warning(request, 'Your profile was missing. Please update your gender information.')
+        return redirect('dashboard')
+
+    user_gender = user_profile.gender
+    if not user_gender:
+        messages.error(request, 'Gender information is required to view blocks. Please contact administrator or re-register with gender information.')
+        return redirect('dashboard')
+
+    blocks = await sync_to_async(availability.get_blocks_list)(user_gender)
+    return await _render(request, 'hostel/blocks_list.html', {
+        'blocks': blocks,
+        'user_gender': user_gender,
+    })
+
+
+@login_required
+@read_only_view
+async def block_layout_view(request, block_id):
+    """Show layout of a specific block"""
+    user = await _viewer(request)
+    layout, user_profile = await asyncio.gather(
+        sync_to_async(_block_layout)(request, block_id),
+        _profile(user),
+    )
+    _remember_profile(request, user_profile)
+
+    validators = await sync_to_async(_layout_validators)(request, block_id)
+    not_modified = await _not_modified(request, validators)
+    if not_modified is not None:
+        return _with_validators(not_modified, validators)
+
+    if layout is None:
+        raise Http404('No Block matches the given query.')
+    block = layout['block']
+
+    user_gender, denied = await _gender_or_redirect(request, user, user_profile)
+    if denied:
+        return denied
+    if block['gender'] != user_gender:
+        messages.error(request, f"Access denied: You do not have permission to view {block['block_name']} block. This block is for {block['gender_display']}s only.")
+        return redirect('blocks_list')
+
+    response = await _render(request, 'hostel/block_layout.html', {
+        'hostel_block': block,
+        'floors_data': layout['floors'],
+    })
+    return _with_validators(response, validators)
+
+
+async def _occupants(room_id):
+    """Students with an active booking in room_id, earliest booking first"""
+    bookings = Booking.objects.active().filter(room_id=room_id).select_related('user').order_by('id')
+    return [booking.user async for booking in bookings]
+
+
+@login_required
+@read_only_view
+async def room_detail_view(request, room_id):
+    user = await _viewer(request)
+    user_profile = await _profile(user)
+    _remember_profile(request, user_profile)
+
+    validators = await sync_to_async(_room_validators)(request, room_id)
+    not_modified = await _not_modified(request, validators)
+    if not_modified is not None:
+        return _with_validators(not_modified, validators)
+
+    # The room, who is in it and where the viewer lives don't depend on each other
+    room, occupants, current_room_id = await asyncio.gather(
+        Room.objects.select_related('floor__block').filter(id=room_id).afirst(),
+        _occupants(room_id),
+        Booking.objects.active().filter(user_id=user.pk).values_list('room_id', flat=True).afirst(),
+    )
+    if room is None:
+        raise Http404('No Room matches the given query.')
+
+    user_gender, denied = await _gender_or_redirect(request, user, user_profile)
+    if denied:
+        return denied
+    if room.floor.block.gender != user_gender:
+        messages.error(request, f'Access denied: You cannot access rooms in {room.floor.block.block_name} block. This block is for {room.floor.block.get_gender_display()}s only.')
+        return redirect('blocks_list')
+
+    user_in_room = current_room_id == room.pk
+    available_spots = room.get_available_spots()
+    response = await _render(request, 'hostel/room_detail.html', {
+        'room': room,
+        'can_book': available_spots > 0 and not user_in_room,
+        'user_has_booking': current_room_id is not None,
+        'user_in_room': user_in_room,
+        'available_spots': available_spots,
+        'current_occupancy': room.get_current_occupancy(),
+        'occupants': occupants,
+    })
+    return _with_validators(response, validators)
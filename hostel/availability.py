@@ -0,0 +1,328 @@
+"""
+Cached availability snapshots for the browsing pages.
+
+A snapshot is stored under a key that embeds a per-block version number.
+Anything that changes a block's rooms or occupancy bumps that version (after
+the transaction commits), so readers simply stop finding the old snapshot;
+nothing is ever deleted or overwritten in place. The cache alias is
+settings.HOSTEL_AVAILABILITY_CACHE, so a shared backend such as Redis or
+Memcached can be plugged in when running several worker processes.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import live, metrics, routers
+from .models import Block, Floor, Room
+
+
+BLOCKS_LIST = 'blocks'
+
+ROOM_FIELDS = ('id', 'room_number', 'capacity', 'occupancy', 'free_spots', 'occupancy_status', 'is_booked')
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'HOSTEL_AVAILABILITY_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'HOSTEL_AVAILABILITY_TIMEOUT', 300)
+
+
+def _key_timeout():
+    """Lifetime of the per-user and per-room keys, so the many of them age out instead of crowding out block versions"""
+    return getattr(settings, 'HOSTEL_AVAILABILITY_KEY_TIMEOUT', 86400)
+
+
+def _scope_timeout(scope):
+    # Block and blocks-list versions never expire; there are few of them and
+    # losing one invalidates every snapshot of the block
+    return _key_timeout() if str(scope).startswith('user:') else None
+
+
+def _count(event, n=1):
+    with _stats_lock:
+        _stats[event] += n
+
+
+def stats():
+    """In-process hit/miss/bump counters since start-up (or the last reset_stats())"""
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses'], 'bumps': _stats['bumps']}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _version_key(scope):
+    return f'hostel:availability:{scope}:version'
+
+
+def _changed_key(scope):
+    return f'hostel:availability:{scope}:changed'
+
+
+def user_scope(user_id):
+    """Scope of the pages that depend on a user's own booking"""
+    return f'user:{user_id}'
+
+
+def get_version(scope):
+    """Current version for scope (a block id, or BLOCKS_LIST)"""
+    cache = _cache()
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a version lost to eviction never reuses an old snapshot key
+        cache.add(key, time.time_ns(), timeout=_scope_timeout(scope))
+        version = cache.get(key, 0)
+    return version
+
+
+def bump(scope):
+    cache = _cache()
+    key = _version_key(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=_scope_timeout(scope))
+    cache.set(_changed_key(scope), time.time(), timeout=_scope_timeout(scope))
+    _count('bumps')
+
+
+def bump_many(scopes):
+    """
+    bump() for many scopes in two cache round trips (per lifetime): each gets a fresh
+    clock-seeded version, which is always past any version it had before
+    """
+    scopes = list(scopes)
+    if not scopes:
+        return
+    version, now = time.time_ns(), time.time()
+    cache = _cache()
+    by_timeout = defaultdict(list)
+    for scope in scopes:
+        by_timeout[_scope_timeout(scope)].append(scope)
+    for timeout, group in by_timeout.items():
+        cache.set_many({_version_key(scope): version for scope in group}, timeout=timeout)
+        cache.set_many({_changed_key(scope): now for scope in group}, timeout=timeout)
+    _count('bumps', len(scopes))
+
+
+def last_changed(scope):
+    """When scope was last bumped, in epoch seconds; unknown (e.g. evicted) reads as now, which is always safe"""
+    cache = _cache()
+    key = _changed_key(scope)
+    changed = cache.get(key)
+    if changed is None:
+        cache.add(key, time.time(), timeout=_scope_timeout(scope))
+        changed = cache.get(key) or time.time()
+    return changed
+
+
+def bump_blocks_on_commit(block_ids):
+    """Invalidate the given blocks, and the blocks list showing their free beds, once the surrounding transaction commits"""
+    block_ids = set(block_ids)
+    if block_ids:
+        transaction.on_commit(lambda: [bump(scope) for scope in (*block_ids, BLOCKS_LIST)])
+
+
+def bump_users_on_commit(user_ids):
+    """Invalidate the pages that show these users' own bookings once the surrounding transaction commits"""
+    scopes = {user_scope(user_id) for user_id in user_ids}
+    if scopes:
+        transaction.on_commit(lambda: bump_many(scopes))
+
+
+def bump_floors_on_commit(floor_ids):
+    """Invalidate the blocks holding floor_ids once the surrounding transaction commits"""
+    floor_ids = set(floor_ids)
+    if floor_ids:
+        bump_blocks_on_commit(Floor.objects.filter(pk__in=floor_ids).values_list('block_id', flat=True))
+
+
+def bump_rooms_on_commit(room_ids):
+    """
+    Invalidate the blocks holding room_ids once the surrounding transaction
+    commits, and push the rooms' new state to live viewers.
+    """
+    room_ids = set(room_ids)
+    if room_ids:
+        block_ids = Floor.objects.filter(rooms__in=room_ids).values_list('block_id', flat=True).distinct()
+        bump_blocks_on_commit(block_ids)
+        live.publish_rooms_on_commit(room_ids)
+
+
+def _cached(key, build):
+    cache = _cache()
+    snapshot = cache.get(key)
+    metrics.note_cache(hit=snapshot is not None)
+    if snapshot is not None:
+        _count('hits')
+        return snapshot
+    _count('misses')
+    # Build from the primary: a lagging replica would store old data under the new version
+    with routers.primary():
+        snapshot = build()
+    if snapshot is not None:
+        cache.set(key, snapshot, _timeout())
+    return snapshot
+
+
+def etag(scope, *parts):
+    """Strong validator for anything served from scope's snapshots at its current version"""
+    return ':'.join(str(part) for part in (scope, get_version(scope), *parts))
+
+
+def _block_dict(block):
+    return {
+        'id': block.pk,
+        'block_name': block.block_name,
+        'gender': block.gender,
+        'gender_display': block.get_gender_display(),
+        'description': block.description,
+    }
+
+
+def _beds(summary):
+    if summary is None:  # not counted yet; occupancy.rebuild() fills it in
+        return {'rooms': None, 'beds': None, 'occupied': None, 'free_beds': None}
+    return {'rooms': summary.rooms, 'beds': summary.beds, 'occupied': summary.occupied, 'free_beds': summary.free_beds}
+
+
+def build_block_layout(block_id):
+    """Floors and rooms of a block with occupancy and status, or None if the block doesn't exist"""
+    block = Block.objects.filter(pk=block_id).first()
+    if block is None:
+        return None
+
+    rooms_by_floor = defaultdict(list)
+    rooms = (
+        Room.objects.filter(floor__block=block)
+        .with_occupancy()
+        .order_by('floor__floor_number', 'room_number')
+    )
+    for room in rooms:
+        rooms_by_floor[room.floor_id].append({
+            'id': room.pk,
+            'room_number': room.room_number,
+            'capacity': room.capacity,
+            'occupancy': room.occupancy,
+            'free_spots': room.free_spots,
+            'occupancy_status': room.occupancy_status,
+            'is_booked': room.is_booked,
+        })
+
+    floors = Floor.objects.filter(block=block).order_by('floor_number')
+    return {
+        'block': _block_dict(block),
+        'floors': [
+            {'floor': {'id': floor.pk, 'floor_number': floor.floor_number}, 'rooms': rooms_by_floor[floor.pk]}
+            for floor in floors
+        ],
+    }
+
+
+def _layout_key(block_id, version):
+    return f'hostel:availability:{block_id}:layout:{version}'
+
+
+def get_block_layout(block_id):
+    return _cached(_layout_key(block_id, get_version(block_id)), lambda: build_block_layout(block_id))
+
+
+def build_blocks_list(gender):
+    """The gender's blocks with their bed counts, from the occupancy summary: one row per block, no room is read"""
+    blocks = Block.objects.filter(gender=gender).select_related('occupancy').order_by('block_name')
+    return [{**_block_dict(block), **_beds(getattr(block, 'occupancy', None))} for block in blocks]
+
+
+def get_blocks_list(gender):
+    key = f'hostel:availability:{BLOCKS_LIST}:{gender}:{get_version(BLOCKS_LIST)}'
+    return _cached(key, lambda: build_blocks_list(gender))
+
+
+def get_block(block_id):
+    """A block's details, or None if it doesn't exist"""
+    version = get_version(block_id)
+    # Usually someone has looked at the block already, so its layout snapshot holds the details
+    layout = _cache().get(_layout_key(block_id, version))
+    if layout is not None:
+        return layout['block']
+    key = f'hostel:availability:{block_id}:block:{version}'
+    return _cached(key, lambda: next(
+        (_block_dict(block) for block in Block.objects.filter(pk=block_id)), None,
+    ))
+
+
+def build_room_page(block_id, floor_number=None, after=None, limit=100):
+    """
+    Up to limit rooms of a block in (floor_number, room_number) order, starting
+    after the key given as after. Seeks straight to the key, so deep pages cost
+    the same as the first. Returns (rooms, next key or None).
+    """
+    rooms = Room.objects.filter(floor__block_id=block_id)
+    if floor_number is not None:
+        rooms = rooms.filter(floor__floor_number=floor_number)
+    if after is not None:
+        after_floor, after_room = after
+        rooms = rooms.filter(
+            Q(floor__floor_number__gt=after_floor)
+            | Q(floor__floor_number=after_floor, room_number__gt=after_room)
+        )
+    rooms = list(
+        rooms.with_occupancy()
+        .order_by('floor__floor_number', 'room_number')
+        .values(*ROOM_FIELDS, floor_number=F('floor__floor_number'))[:limit + 1]
+    )
+    if len(rooms) <= limit:
+        return rooms, None
+    rooms = rooms[:limit]
+    return rooms, (rooms[-1]['floor_number'], rooms[-1]['room_number'])
+
+
+def get_room_page(block_id, floor_number=None, after=None, limit=100):
+    after_key = '' if after is None else f'{after[0]}/{after[1]}'
+    key = f'hostel:availability:{block_id}:rooms:{get_version(block_id)}:{floor_number}:{after_key}:{limit}'
+    return _cached(key, lambda: build_room_page(block_id, floor_number, after, limit))
+
+
+def _room_block_key(room_id):
+    return f'hostel:availability:room:{room_id}:block'
+
+
+def room_block_id(room_id):
+    """The block a room belongs to, remembered so single-room reads can be versioned without a query"""
+    cache = _cache()
+    key = _room_block_key(room_id)
+    block_id = cache.get(key)
+    if block_id is None:
+        with routers.primary():
+            block_id = Room.objects.filter(pk=room_id).values_list('floor__block_id', flat=True).first()
+        if block_id is not None:
+            cache.set(key, block_id, timeout=_key_timeout())
+    return block_id
+
+
+def forget_room(room_id):
+    """Drop the remembered block of a room that moved or was deleted"""
+    _cache().delete(_room_block_key(room_id))
+
+
+def get_room(block_id, room_id):
+    """A room's occupancy in the page shape, or None if it is not (or no longer) in block_id"""
+    key = f'hostel:availability:{block_id}:room:{room_id}:{get_version(block_id)}'
+    return _cached(key, lambda: (
+        Room.objects.filter(pk=room_id, floor__block_id=block_id).with_occupancy()
+        .values(*ROOM_FIELDS, floor_number=F('floor__floor_number')).first()
+    ))
@@ -0,0 +1,687 @@
+"""
+Load and contention harnesses shared by the benchmark management commands and tests.
+"""
+import asyncio
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from types import ModuleType
+
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import F
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path, reverse
+from django.utils import timezone
+
+from . import availability, profiling
+from .models import AllocationRound, Block, Booking, Floor, Room, RoomPreference, RoomRequest, UserProfile
+from .services import booking, occupancy
+from .stats import percentile
+
+
+# Most SQL queries each view may issue for one request. Keep these tight: a
+# per-room or per-floor query creeping back in shows up as a budget failure.
+VIEW_QUERY_BUDGETS = {
+    'dashboard': 3,
+    'blocks_list': 3,
+    'block_layout': 5,
+    'room_detail': 6,  # +1 the first time a room is seen: its block is remembered for conditional GETs
+    'confirm_booking': 4,
+    # +2 each: the floor and block occupancy summaries are updated in the same transaction;
+    # +1 each: the booking journal's INSERT
+    'book_room': 16,
+    'cancel_booking': 12,
+}
+
+
+def seed_contended_block(rooms=5, capacity=2, users=50, gender='M', prefix='stress'):
+    """Create one block of rooms plus a crowd of users who all want them"""
+    block = Block.objects.create(block_name=f'{prefix}-block', gender=gender)
+    floor = Floor.objects.create(block=block, floor_number=1)
+    Room.objects.bulk_create(
+        Room(floor=floor, room_number=f'{room_num:03d}', capacity=capacity)
+        for room_num in range(1, rooms + 1)
+    )
+    occupancy.refresh_floors([floor.pk])
+    User.objects.bulk_create(User(username=f'{prefix}-{num}') for num in range(users))
+    crowd = list(User.objects.filter(username__startswith=f'{prefix}-').order_by('id'))
+    UserProfile.objects.bulk_create(UserProfile(user=user, gender=gender) for user in crowd)
+    return list(Room.objects.filter(floor=floor).order_by('room_number')), crowd
+
+
+def _count_lock_errors(counter, lock):
+    """An execute_wrapper counting the statements SQLite refused with "database is locked" """
+    def wrapper(execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as exc:
+            if 'locked' in str(exc):
+                with lock:
+                    counter['lock_errors'] += 1
+            raise
+    return wrapper
+
+
+def run_booking_stress(rooms, users, threads=8, seed=0, readers=0):
+    """
+    Let every user race for a room from several threads at once. Each user
+    walks the rooms in a shuffled order until one accepts them or all are full.
+    With readers, that many more threads keep rebuilding the block's layout
+    (uncached) for as long as the booking runs. Returns counters and throughput
+    for the run, including how often SQLite answered "database is locked".
+    """
+    rng = random.Random(seed)
+    plans = []
+    for user in users:
+        order = list(rooms)
+        rng.shuffle(order)
+        plans.append((user, order))
+
+    outcomes = Counter()
+    locks = Counter()
+    errors = []
+    lock = threading.Lock()
+    booking_done = threading.Event()
+    block_id = Floor.objects.filter(rooms=rooms[0]).values_list('block_id', flat=True).get() if readers else None
+
+    def worker(chunk):
+        local = Counter()
+        try:
+            with connections['default'].execute_wrapper(_count_lock_errors(locks, lock)):
+                for user, order in chunk:
+                    for room in order:
+                        result = booking.book_room(user, Room(pk=room.pk))
+                        local[result.status.value] += 1
+                        if result.status != booking.BookingStatus.ROOM_FULL:
+                            break
+        except Exception as exc:  # surfaced to the caller below
+            errors.append(exc)
+        finally:
+            connections.close_all()
+            with lock:
+                outcomes.update(local)
+
+    def reader():
+        reads = 0
+        try:
+            with connections['default'].execute_wrapper(_count_lock_errors(locks, lock)):
+                while not booking_done.is_set():
+                    try:
+                        availability.build_block_layout(block_id)
+                    except OperationalError as exc:
+                        if 'locked' not in str(exc):
+                            raise
+                        continue
+                    reads += 1
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connections.close_all()
+            with lock:
+                locks['reads'] += reads
+
+    chunks = [plans[i::threads] for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    reading = [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in reading + pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    booking_done.set()
+    for thread in reading:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    attempts = sum(outcomes.values())
+    return {
+        'threads': threads,
+        'readers': readers,
+        'users': len(users),
+        'rooms': len(rooms),
+        'attempts': attempts,
+        'outcomes': dict(outcomes),
+        'lock_errors': locks['lock_errors'],
+        'elapsed_seconds': elapsed,
+        'bookings_per_second': outcomes[booking.BookingStatus.BOOKED.value] / elapsed if elapsed else 0.0,
+        'attempts_per_second': attempts / elapsed if elapsed else 0.0,
+        'reads_per_second': locks['reads'] / elapsed if elapsed else 0.0,
+    }
+
+
+_TICKET_INPUT = re.compile(r'name="admission_ticket" value="([^"]+)"')
+
+
+def run_admission_benchmark(rooms, users, threads=32, readers=4, poll_seconds=0.05):
+    """
+    Let every user book through the booking view from several threads, as
+    browsers would: a user trying a full room moves on to the next, and one
+    sent to the waiting room polls for its turn and resubmits. Meanwhile
+    readers keep loading a room detail page. Returns booking throughput,
+    end-to-end booking latency, browsing latency and how many requests queued.
+    """
+    plans = [(user, rooms[i % len(rooms):] + rooms[:i % len(rooms)]) for i, user in enumerate(users)]
+    booking_ms, browse_ms = [], []
+    counts = Counter()
+    locks = Counter()
+    errors = []
+    lock = threading.Lock()
+    booking_done = threading.Event()
+    browse_url = reverse('room_detail', args=[rooms[0].pk])
+    browser = users[0]
+
+    def book(client, room):
+        """POST a booking, waiting our turn if queued; True once the student has the room"""
+        url = reverse('book_room', args=[room.pk])
+        data = {}
+        while True:
+            response = client.post(url, data)
+            if response.status_code == 302:
+                return response['Location'] == reverse('dashboard')
+            if response.status_code == 429:
+                time.sleep(float(response['Retry-After']))
+                continue
+            if response.status_code != 202:
+                raise AssertionError(f'{url} returned HTTP {response.status_code}')
+            with lock:
+                counts['queued'] += 'admission_ticket' not in data
+            data = {'admission_ticket': _TICKET_INPUT.search(response.content.decode()).group(1)}
+            while not client.get(reverse('queue_status'), {'ticket': data['admission_ticket']}).json()['ready']:
+                time.sleep(poll_seconds)
+
+    def worker(chunk):
+        client = Client()
+        samples = []
+        try:
+            with connections['default'].execute_wrapper(_count_lock_errors(locks, lock)):
+                for user, order in chunk:
+                    client.force_login(user)
+                    started = time.perf_counter()
+                    booked = any(book(client, room) for room in order)
+                    samples.append((time.perf_counter() - started) * 1000)
+                    with lock:
+                        counts['booked' if booked else 'unplaced'] += 1
+        except Exception as exc:  # surfaced to the caller below
+            errors.append(exc)
+        finally:
+            connections.close_all()
+            with lock:
+                booking_ms.extend(samples)
+
+    def reader():
+        client = Client()
+        client.force_login(browser)
+        samples = []
+        try:
+            while not booking_done.is_set():
+                started = time.perf_counter()
+                client.get(browse_url)
+                samples.append((time.perf_counter() - started) * 1000)
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connections.close_all()
+            with lock:
+                browse_ms.extend(samples)
+
+    pool = [threading.Thread(target=worker, args=(plans[i::threads],)) for i in range(threads)]
+    reading = [threading.Thread(target=reader) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in reading + pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    booking_done.set()
+    for thread in reading:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return {
+        'users': len(users),
+        'threads': threads,
+        'booked': counts['booked'],
+        'queued': counts['queued'],
+        'lock_errors': locks['lock_errors'],
+        'elapsed_seconds': round(elapsed, 3),
+        'bookings_per_second': round(counts['booked'] / elapsed, 1) if elapsed else 0.0,
+        'booking_p50_ms': round(percentile(booking_ms, 50), 1),
+        'booking_p95_ms': round(percentile(booking_ms, 95), 1),
+        'browse_p50_ms': round(percentile(browse_ms, 50), 1),
+        'browse_p95_ms': round(percentile(browse_ms, 95), 1),
+    }
+
+
+def seed_hostel(blocks=10, floors=5, rooms=40, capacity=2, users=2000, booked_ratio=0.5, seed=42):
+    """Build a load-test sized hostel through populate_sample_data"""
+    call_command(
+        'populate_sample_data', blocks=blocks, floors=floors, rooms=rooms, capacity=capacity,
+        users=users, booked_ratio=booked_ratio, seed=seed, stdout=StringIO(),
+    )
+
+
+def run_view_benchmarks(iterations=20, gender='M', budgets=None):
+    """
+    Drive the booking HTTP paths through the test client against the seeded
+    hostel. Each iteration browses, books a partly occupied room and cancels
+    again, so the data ends where it started. Returns one result dict per view.
+    """
+    budgets = VIEW_QUERY_BUDGETS if budgets is None else budgets
+    student = (
+        User.objects.filter(profile__gender=gender).exclude(bookings__status=Booking.ACTIVE)
+        .order_by('id').first()
+    )
+    room = (
+        Room.objects.filter(floor__block__gender=gender).with_free_spots()
+        .order_by('-occupancy', 'id').select_related('floor').first()
+    )
+    if student is None or room is None:
+        raise ValueError('Seed a hostel with free rooms and unbooked students first.')
+
+    client = Client()
+    client.force_login(student)
+    steps = [
+        ('dashboard', 'get', reverse('dashboard')),
+        ('blocks_list', 'get', reverse('blocks_list')),
+        ('block_layout', 'get', reverse('block_layout', args=[room.floor.block_id])),
+        ('room_detail', 'get', reverse('room_detail', args=[room.pk])),
+        ('confirm_booking', 'get', reverse('confirm_booking', args=[room.pk])),
+        ('book_room', 'post', reverse('book_room', args=[room.pk])),
+        ('cancel_booking', 'post', reverse('cancel_booking', args=[room.pk])),
+    ]
+
+    timings = {name: [] for name, _, _ in steps}
+    queries = {name: [] for name, _, _ in steps}
+    # One student drives every request, so admission control would rate-limit the
+    # run after a few iterations; run_admission_benchmark measures that layer
+    with override_settings(HOSTEL_ADMISSION_ENABLED=False):
+        for _ in range(iterations):
+            for name, method, url in steps:
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(url)
+                    elapsed = time.perf_counter() - started
+                if response.status_code not in (200, 302):
+                    raise AssertionError(f'{name} returned HTTP {response.status_code}')
+                timings[name].append(elapsed * 1000)
+                queries[name].append(len(ctx.captured_queries))
+
+    results = []
+    for name, _, _ in steps:
+        budget = budgets.get(name)
+        max_queries = max(queries[name])
+        results.append({
+            'view': name,
+            'requests': iterations,
+            'p50_ms': round(percentile(timings[name], 50), 3),
+            'p95_ms': round(percentile(timings[name], 95), 3),
+            'max_ms': round(max(timings[name]), 3),
+            'min_queries': min(queries[name]),
+            'max_queries': max_queries,
+            'query_budget': budget,
+            'over_budget': budget is not None and max_queries > budget,
+        })
+    return results
+
+
+def browsing_urlconf(async_browsing):
+    """A root URLconf serving the hostel with the sync or the async browsing views"""
+    from .urls import build_urlpatterns
+    urlconf = ModuleType(f'hostel_bench_urls_{"async" if async_browsing else "sync"}')
+    urlconf.urlpatterns = [path('', include(build_urlpatterns(async_browsing)))]
+    return urlconf
+
+
+def _browsing_targets(gender):
+    student = User.objects.filter(profile__gender=gender).order_by('id').first()
+    room = (
+        Room.objects.filter(floor__block__gender=gender).order_by('-occupancy', 'id')
+        .select_related('floor').first()
+    )
+    if student is None or room is None:
+        raise ValueError('Seed a hostel with rooms and students first.')
+    return student, [
+        ('blocks_list', '/blocks/'),
+        ('block_layout', f'/block/{room.floor.block_id}/'),
+        ('room_detail', f'/room/{room.pk}/'),
+    ]
+
+
+def _throughput_result(mode, name, timings, seconds, concurrency):
+    return {
+        'mode': mode,
+        'view': name,
+        'requests': len(timings),
+        'concurrency': concurrency,
+        'requests_per_second': round(len(timings) / seconds, 1) if seconds else 0.0,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+    }
+
+
+def _wsgi_throughput(student, url, requests, concurrency):
+    """requests GETs of url from concurrency threads, each with its own test Client (one WSGI worker thread each)"""
+    timings = []
+    lock = threading.Lock()
+    failures = []
+    per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+    def worker(count):
+        client = Client()
+        client.force_login(student)
+        samples = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(url)
+                samples.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+        finally:
+            connections.close_all()
+        with lock:
+            timings.extend(samples)
+
+    threads = [threading.Thread(target=worker, args=(count,)) for count in per_worker]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    if failures:
+        raise AssertionError(f'{url} returned HTTP {failures[0]} under WSGI')
+    return timings, seconds
+
+
+async def _asgi_throughput(student, url, requests, concurrency):
+    """The same load as _wsgi_throughput, as concurrency tasks on one event loop"""
+    timings = []
+    failures = []
+    per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+    async def worker(count):
+        client = AsyncClient()
+        await client.aforce_login(student)
+        for _ in range(count):
+            # Like the ASGI server: each request gets its own thread for sync code
+            async with ThreadSensitiveContext():
+                started = time.perf_counter()
+                response = await client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                failures.append(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(count) for count in per_worker))
+    seconds = time.perf_counter() - started
+    if failures:
+        raise AssertionError(f'{url} returned HTTP {failures[0]} under ASGI')
+    return timings, seconds
+
+
+def run_async_benchmark(requests=200, concurrency=16, gender='M'):
+    """
+    Throughput of the browsing pages with the sync views under threads (WSGI)
+    and the async views on an event loop (ASGI), against the seeded hostel.
+    Returns one result dict per mode and view.
+    """
+    student, targets = _browsing_targets(gender)
+    results = []
+    for mode, async_browsing in (('wsgi', False), ('asgi', True)):
+        with override_settings(ROOT_URLCONF=browsing_urlconf(async_browsing)):
+            for name, url in targets:
+                if async_browsing:
+                    timings, seconds = asyncio.run(_asgi_throughput(student, url, requests, concurrency))
+                else:
+                    timings, seconds = _wsgi_throughput(student, url, requests, concurrency)
+                results.append(_throughput_result(mode, name, timings, seconds, concurrency))
+    return results
+
+
+def run_assignment_benchmark(assignments=200, gender='M', seed=0):
+    """
+    Auto-assign unbooked students of gender with a mix of preferences against
+    the seeded hostel. Returns latency and query counts per preference kind,
+    and the query plan of the candidate lookup.
+    """
+    from .services import assignment
+
+    rng = random.Random(seed)
+    students = list(
+        User.objects.filter(profile__gender=gender).exclude(bookings__status=Booking.ACTIVE)
+        .order_by('id')[:assignments]
+    )
+    block_ids = list(Block.objects.filter(gender=gender).values_list('id', flat=True))
+    top_floor = max(Floor.objects.values_list('floor_number', flat=True), default=1)
+    if not students or not block_ids:
+        raise ValueError('Seed a hostel with unbooked students first.')
+
+    def floors():
+        low = rng.randint(1, top_floor)
+        return assignment.Preferences(min_floor=low, max_floor=low + 1)
+
+    kinds = [
+        ('any', lambda: assignment.Preferences()),
+        ('block', lambda: assignment.Preferences(block_id=rng.choice(block_ids))),
+        ('floors', floors),
+        ('shared', lambda: assignment.Preferences(room_type=assignment.SHARED)),
+    ]
+    timings = {name: [] for name, _ in kinds}
+    queries = {name: [] for name, _ in kinds}
+    outcomes = Counter()
+    for num, student in enumerate(students):
+        name, preferences = kinds[num % len(kinds)]
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            result = assignment.assign_room(student, gender, preferences())
+            elapsed = time.perf_counter() - started
+        outcomes[result.status.value] += 1
+        timings[name].append(elapsed * 1000)
+        queries[name].append(len(ctx.captured_queries))
+
+    plan = assignment.available_rooms(gender)[:assignment.CANDIDATES].explain()
+    return {
+        'outcomes': dict(outcomes),
+        'plan': plan,
+        'preferences': [
+            {
+                'kind': name,
+                'assignments': len(timings[name]),
+                'p50_ms': round(percentile(timings[name], 50), 3),
+                'p95_ms': round(percentile(timings[name], 95), 3),
+                'max_queries': max(queries[name], default=0),
+            }
+            for name, _ in kinds
+        ],
+    }
+
+
+
+def seed_lottery_round(group_ratio=0.2, choices=3, seed=0):
+    """
+    Enter every student without a room into a new allocation round with
+    ranked choices. Popular blocks are picked far more often than the rest,
+    so many students miss their first choice. About group_ratio of the
+    students enter in pairs of the same gender; a tenth of the choices name a
+    specific room. Returns the round.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    allocation_round = AllocationRound.objects.create(
+        name='Benchmark lottery', opens_at=now - timedelta(days=7), closes_at=now,
+    )
+    students = list(
+        User.objects.exclude(bookings__status=Booking.ACTIVE).filter(profile__gender__isnull=False)
+        .order_by('id').values_list('id', 'profile__gender')
+    )
+    blocks = {}
+    for block_id, gender in Block.objects.order_by('id').values_list('id', 'gender'):
+        blocks.setdefault(gender, []).append(block_id)
+    rooms = {}
+    for room_id, block_id in Room.objects.order_by('id').values_list('id', 'floor__block_id'):
+        rooms.setdefault(block_id, []).append(room_id)
+
+    requests, pending = [], {}
+    for user_id, gender in students:
+        group_code = ''
+        if rng.random() < group_ratio:
+            # Pair with the previous student of this gender who is still waiting for a partner
+            group_code = pending.pop(gender, None) or pending.setdefault(gender, f'G{user_id}')
+        requests.append(RoomRequest(
+            round=allocation_round, user_id=user_id, priority=rng.choice((0, 0, 0, 1, 2)), group_code=group_code,
+        ))
+    RoomRequest.objects.bulk_create(requests, batch_size=2000)
+
+    preferences = []
+    genders = dict(students)
+    for request_id, user_id in allocation_round.requests.order_by('id').values_list('id', 'user_id'):
+        options = blocks[genders[user_id]]
+        weights = [1 / (rank + 1) ** 2 for rank in range(len(options))]
+        picked = []
+        while len(picked) < min(choices, len(options)):
+            block_id = rng.choices(options, weights)[0]
+            if block_id not in picked:
+                picked.append(block_id)
+        for rank, block_id in enumerate(picked, start=1):
+            if rng.random() < 0.1 and rooms.get(block_id):
+                preferences.append(RoomPreference(request_id=request_id, rank=rank, room_id=rng.choice(rooms[block_id])))
+            else:
+                preferences.append(RoomPreference(request_id=request_id, rank=rank, block_id=block_id))
+    RoomPreference.objects.bulk_create(preferences, batch_size=2000)
+    return allocation_round
+
+
+def run_lottery_benchmark(allocation_round, seed=0):
+    """
+    Run the round's lottery twice with the same seed, once as a dry run and
+    once for real, and check both draws place the same students. Returns the
+    outcome and timings.
+    """
+    from .services import lottery
+
+    with CaptureQueriesContext(connection) as dry_ctx:
+        dry_run = lottery.run_lottery(allocation_round, seed=seed, dry_run=True)
+    with CaptureQueriesContext(connection) as ctx:
+        result = lottery.run_lottery(allocation_round, seed=seed)
+    if (dry_run.placed, dry_run.by_choice) != (result.placed, result.by_choice):
+        raise AssertionError('The same seed gave two different draws.')
+    overfull = Room.objects.filter(occupancy__gt=F('capacity')).count()
+    if overfull:
+        raise AssertionError(f'{overfull} room(s) over capacity after the lottery.')
+    return {
+        'students': result.placed + result.unplaced + result.already_housed,
+        'placed': result.placed,
+        'unplaced': result.unplaced,
+        'by_choice': {str(choice): total for choice, total in sorted(result.by_choice.items(), key=lambda item: str(item[0]))},
+        'dry_run_seconds': round(dry_run.seconds, 3),
+        'dry_run_queries': len(dry_ctx.captured_queries),
+        'seconds': round(result.seconds, 3),
+        'queries': len(ctx.captured_queries),
+    }
+
+
+def run_profiling_benchmark(requests=200, sample_rate=0.05, per_minute=None, gender='M'):
+    """
+    Cost of ProfilingMiddleware on the browsing pages of the seeded hostel:
+    the same requests with profiling off, sampling at sample_rate (capped at
+    per_minute, default HOSTEL_PROFILING_MAX_PER_MINUTE) and profiling every
+    request. Dumps go to a throwaway directory. Returns one result per mode and view.
+    """
+    from django.conf import settings
+
+    per_minute = settings.HOSTEL_PROFILING_MAX_PER_MINUTE if per_minute is None else per_minute
+    student, targets = _browsing_targets(gender)
+    modes = (
+        ('off', {'HOSTEL_PROFILING_ENABLED': False}),
+        ('sampled', {'HOSTEL_PROFILING_SAMPLE_RATE': sample_rate, 'HOSTEL_PROFILING_MAX_PER_MINUTE': per_minute}),
+        ('every', {'HOSTEL_PROFILING_SAMPLE_RATE': 1.0, 'HOSTEL_PROFILING_MAX_PER_MINUTE': requests * len(targets)}),
+    )
+    results = []
+    baseline = {}
+    with tempfile.TemporaryDirectory(prefix='hostel-profiles-') as directory:
+        for mode, overrides in modes:
+            overrides = {
+                'HOSTEL_PROFILING_ENABLED': True, 'HOSTEL_PROFILING_DIR': os.path.join(directory, mode),
+                'HOSTEL_PROFILING_MAX_DUMPS': requests * len(targets), **overrides,
+            }
+            with override_settings(**overrides):
+                # A new client loads the middleware with these settings
+                client = Client()
+                client.force_login(student)
+                for name, url in targets:
+                    client.get(url)  # warm the availability cache
+                    timings = []
+                    for _ in range(requests):
+                        started = time.perf_counter()
+                        response = client.get(url)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        if response.status_code != 200:
+                            raise AssertionError(f'{url} returned HTTP {response.status_code}')
+                    mean_ms = sum(timings) / len(timings)
+                    baseline.setdefault(name, mean_ms)
+                    results.append({
+                        'mode': mode,
+                        'view': name,
+                        'requests': requests,
+                        'profiled': len(profiling.dumps_by_view(overrides['HOSTEL_PROFILING_DIR'], name).get(name, [])),
+                        'mean_ms': round(mean_ms, 3),
+                        'p50_ms': round(percentile(timings, 50), 3),
+                        'p95_ms': round(percentile(timings, 95), 3),
+                        'overhead_pct': round((mean_ms / baseline[name] - 1) * 100, 1),
+                    })
+    return results
+
+
+# Indexes added for the booking query patterns (see migrations 0004 and 0005)
+BOOKING_INDEXES = (
+    'hostel_booking_one_active_per_user',
+    'hostel_booking_active_room_idx',
+    'hostel_block_gender_name_idx',
+    'hostel_room_booked_floor_idx',
+)
+
+
+def hot_queries():
+    """The booking hot paths as (name, queryset) pairs, built against the seeded data"""
+    occupied = Booking.objects.active().order_by('id').first()
+    floor = Floor.objects.order_by('id').first()
+    return [
+        ('room_of_user', Room.objects.occupied_by(occupied.user_id).order_by()[:1]),
+        ('occupants_of_room', Booking.objects.active().filter(room_id=occupied.room_id).order_by('id')),
+        ('blocks_for_gender', Block.objects.filter(gender='M').order_by('block_name')),
+        ('rooms_of_floor', Room.objects.filter(floor=floor).order_by('room_number')),
+        ('admin_booked_filter', Room.objects.filter(is_booked=True).order_by('floor_id', 'room_number')[:100]),
+        ('admin_free_rooms', Room.objects.filter(is_booked=False).order_by().values('floor_id', 'room_number')),
+    ]
+
+
+def time_query(queryset, repeat=50):
+    """Median wall time in milliseconds to evaluate queryset"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.all())
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentile(samples, 50)
+
+
+def explain_hot_queries(repeat=50):
+    return [
+        {'query': name, 'plan': queryset.explain(), 'median_ms': round(time_query(queryset, repeat), 4)}
+        for name, queryset in hot_queries()
+    ]
@@ -0,0 +1,3 @@
+def user_context(request):
+    """Expose the per-request UserContext so templates reuse the view's lookups"""
+    return {'user_context': getattr(request, 'user_context', None)}
@@ -1,7 +1,10 @@
+import re
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import Block, Room, UserProfile
+from .services import assignment
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -55,3 +58,141 @@ class CustomUserCreationForm(UserCreationForm):
                 profile.refresh_from_db()
         
         return user
+
+
+class AssignRoomForm(forms.Form):
+    """Optional preferences for auto-assignment; every field may be left blank"""
+    ROOM_TYPE_CHOICES = [
+        ('', 'No preference'),
+        (assignment.SINGLE, 'Single room'),
+        (assignment.SHARED, 'Shared room'),
+    ]
+
+    block = forms.ModelChoiceField(
+        queryset=Block.objects.none(),
+        required=False,
+        empty_label='Any block',
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    min_floor = forms.IntegerField(
+        min_value=1,
+        required=False,
+        widget=forms.NumberInput(attrs={'placeholder': 'Lowest floor'})
+    )
+    max_floor = forms.IntegerField(
+        min_value=1,
+        required=False,
+        widget=forms.NumberInput(attrs={'placeholder': 'Highest floor'})
+    )
+    room_type = forms.ChoiceField(
+        choices=ROOM_TYPE_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    roommate = forms.CharField(
+        max_length=150,
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': "Roommate's username (optional)"})
+    )
+
+    def __init__(self, *args, gender, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['block'].queryset = Block.objects.filter(gender=gender).order_by('block_name')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        min_floor, max_floor = cleaned_data.get('min_floor'), cleaned_data.get('max_floor')
+        if min_floor is not None and max_floor is not None and min_floor > max_floor:
+            raise forms.ValidationError('The lowest floor cannot be above the highest floor.')
+        return cleaned_data
+
+    def preferences(self):
+        data = self.cleaned_data
+        return assignment.Preferences(
+            block_id=data['block'].pk if data['block'] else None,
+            min_floor=data['min_floor'],
+            max_floor=data['max_floor'],
+            room_type=data['room_type'] or None,
+            roommate=data['roommate'].strip() or None,
+        )
+
+
+class GroupBookingForm(forms.Form):
+    """The friends a student books a room with, as usernames"""
+    MAX_FRIENDS = 10
+
+    usernames = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 3, 'placeholder': "Friends' usernames, separated by commas or spaces"})
+    )
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+
+    def clean_usernames(self):
+        names = [name for name in re.split(r'[\s,]+', self.cleaned_data['usernames']) if name]
+        names = [name for name in dict.fromkeys(names) if name != self.user.username]
+        if not names:
+            raise forms.ValidationError('Enter the username of at least one friend.')
+        if len(names) > self.MAX_FRIENDS:
+            raise forms.ValidationError(f'You can book with at most {self.MAX_FRIENDS} friends at once.')
+        friends = {user.username: user for user in User.objects.filter(username__in=names)}
+        unknown = [name for name in names if name not in friends]
+        if unknown:
+            raise forms.ValidationError(f"No student is called {', '.join(unknown)}.")
+        return [friends[name] for name in names]
+
+
+class LotteryEntryForm(forms.Form):
+    """A student's ranked choices for an allocation round: a block, optionally narrowed to one room"""
+    CHOICES = 3
+
+    group_code = forms.CharField(
+        max_length=30,
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'Same code as your roommates (optional)'})
+    )
+
+    def __init__(self, *args, gender, **kwargs):
+        super().__init__(*args, **kwargs)
+        blocks = Block.objects.filter(gender=gender).order_by('block_name')
+        for rank in range(1, self.CHOICES + 1):
+            self.fields[f'block_{rank}'] = forms.ModelChoiceField(
+                queryset=blocks,
+                required=rank == 1,
+                label=f'Choice {rank}: block',
+                empty_label='No choice' if rank > 1 else None,
+                widget=forms.Select(attrs={'class': 'form-select'})
+            )
+            self.fields[f'room_{rank}'] = forms.CharField(
+                max_length=50,
+                required=False,
+                label=f'Choice {rank}: room number',
+                widget=forms.TextInput(attrs={'placeholder': 'Any room in the block'})
+            )
+        # Group code last, after the choices
+        self.order_fields([name for name in self.fields if name != 'group_code'])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        choices = []
+        for rank in range(1, self.CHOICES + 1):
+            block, room_number = cleaned_data.get(f'block_{rank}'), cleaned_data.get(f'room_{rank}', '').strip()
+            if block is None:
+                if room_number:
+                    self.add_error(f'block_{rank}', 'Pick the block this room is in.')
+                continue
+            room = None
+            if room_number:
+                room = Room.objects.filter(floor__block=block, room_number=room_number).first()
+                if room is None:
+                    self.add_error(f'room_{rank}', f'{block.block_name} has no room {room_number}.')
+                    continue
+            choice = (None, room) if room else (block, None)
+            if choice in choices:
+                self.add_error(f'block_{rank}', 'You already picked this.')
+                continue
+            choices.append(choice)
+        cleaned_data['choices'] = choices
+        cleaned_data['group_code'] = cleaned_data.get('group_code', '').strip().upper()
+        return cleaned_data
@@ -0,0 +1,108 @@
+"""
+Live availability push for block layout pages.
+
+Viewers of a block hold one Server-Sent Events connection (served by the ASGI
+app). When a booking or cancellation commits, the affected rooms' new
+occupancy is published to every subscriber of their block. The broker is
+in-process: each ASGI worker fans out the changes committed through it, so
+run a single ASGI worker for the stream endpoint or put a shared pub/sub in
+front of it when scaling out.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Room
+
+
+# Events a slow viewer may fall behind by before it is told to resynchronise
+SUBSCRIBER_QUEUE_SIZE = 256
+
+ROOM_FIELDS = ('id', 'capacity', 'occupancy', 'free_spots', 'occupancy_status', 'is_booked')
+
+
+class Subscription:
+    def __init__(self, block_id, loop):
+        self.block_id = block_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def _deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class AvailabilityBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, block_id):
+        """Must be called from the event loop that will consume the subscription"""
+        subscription = Subscription(block_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[block_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.block_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.block_id]
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def subscribed_blocks(self):
+        with self._lock:
+            return set(self._subscribers)
+
+    def publish(self, block_id, event):
+        """Thread-safe: hand event to every subscriber of block_id on its own loop"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(block_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down; it will unsubscribe on its way out
+                pass
+
+
+broker = AvailabilityBroker()
+
+
+def room_states(room_ids):
+    """Current occupancy of room_ids as (block_id, room dict) pairs in the layout snapshot shape"""
+    rooms = (
+        Room.objects.filter(pk__in=room_ids)
+        .with_occupancy()
+        .values('floor__block_id', *ROOM_FIELDS)
+    )
+    for room in rooms:
+        block_id = room.pop('floor__block_id')
+        yield block_id, room
+
+
+def _publish_rooms(room_ids):
+    watched = broker.subscribed_blocks()
+    if not watched:
+        return
+    for block_id, room in room_states(room_ids):
+        if block_id in watched:
+            broker.publish(block_id, room)
+
+
+def publish_rooms_on_commit(room_ids):
+    """Push the new state of room_ids to live viewers once the surrounding transaction commits"""
+    room_ids = set(room_ids)
+    if room_ids:
+        transaction.on_commit(lambda: _publish_rooms(room_ids))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+from hostel.models import ArchivedBooking, Booking, BookingEvent, current_term
+from hostel.services import booking, journal
+
+
+ARCHIVED_FIELDS = ('id', 'user_id', 'room_id', 'term', 'status', 'created_at', 'cancelled_at')
+
+
+class Command(BaseCommand):
+    help = 'Moves the bookings of closed terms out of the booking table and into the archive, in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--term', action='append', dest='terms',
+            help='Term to archive (repeatable). Defaults to every term before the current one.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Bookings moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        current = current_term()
+        if options['terms']:
+            if current in options['terms']:
+                raise CommandError(f'{current} is the current term and cannot be archived.')
+            bookings = Booking.objects.filter(term__in=options['terms'])
+        else:
+            bookings = Booking.objects.filter(term__lt=current)
+
+        summary = bookings.order_by('term', 'status').values('term', 'status').annotate(total=Count('*'))
+        if not summary:
+            self.stdout.write(self.style.SUCCESS('Nothing to archive.'))
+            return
+        for row in summary:
+            self.stdout.write(f"{row['term']}: {row['total']} {row['status']}")
+        if options['dry_run']:
+            return
+
+        moved = 0
+        while True:
+            with booking.write_transaction(), journal.batch():
+                rows = list(bookings.order_by('id').values(*ARCHIVED_FIELDS)[:options['batch_size']])
+                if not rows:
+                    break
+                now = timezone.now()
+                archived = []
+                for row in rows:
+                    if row['status'] == Booking.ACTIVE:
+                        # Still active when its term closed, so the stay simply ended
+                        row = dict(row, status=Booking.ENDED)
+                    archived.append(ArchivedBooking(archived_at=now, **row))
+                ArchivedBooking.objects.bulk_create(archived)
+                ended = [row for row in rows if row['status'] == Booking.ACTIVE]
+                # Ended first, so the delete signal leaves the journal and counters to us
+                Booking.objects.filter(pk__in=[row['id'] for row in ended]).update(status=Booking.ENDED)
+                Booking.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+                journal.record_many(BookingEvent.ENDED, ((row['user_id'], row['room_id']) for row in ended), 'archive')
+                booking.resync_rooms((row['room_id'] for row in ended), (row['user_id'] for row in ended))
+            moved += len(rows)
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} booking(s).'))
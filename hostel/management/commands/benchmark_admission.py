@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from hostel.benchmarks import run_admission_benchmark, seed_contended_block
+
+
+class Command(BaseCommand):
+    help = (
+        'Storms the booking view from many threads with admission control off and on, '
+        'and reports booking throughput, booking latency and browsing latency meanwhile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=100, help='Rooms in the contended block')
+        parser.add_argument('--capacity', type=int, default=2, help='Capacity of each room')
+        parser.add_argument('--users', type=int, default=300, help='Students booking')
+        parser.add_argument('--threads', type=int, default=32, help='Concurrent booking threads')
+        parser.add_argument('--readers', type=int, default=4, help='Threads loading a room page meanwhile')
+        parser.add_argument('--concurrency', type=int, help='Override HOSTEL_ADMISSION_CONCURRENCY')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        overrides = {'HOSTEL_ADMISSION_USER_BURST': 1000}
+        if options['concurrency']:
+            overrides['HOSTEL_ADMISSION_CONCURRENCY'] = options['concurrency']
+
+        setup_test_environment()
+        try:
+            results = {
+                mode: self.run_mode(options, HOSTEL_ADMISSION_ENABLED=enabled, **overrides)
+                for mode, enabled in (('off', False), ('on', True))
+            }
+        finally:
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+        self.stdout.write(
+            f"{'admission':<11}{'booked':>8}{'queued':>8}{'bookings/s':>12}{'book p95 ms':>13}"
+            f"{'browse p50 ms':>15}{'browse p95 ms':>15}{'lock errors':>13}"
+        )
+        for mode, stats in results.items():
+            self.stdout.write(
+                f"{mode:<11}{stats['booked']:>8}{stats['queued']:>8}{stats['bookings_per_second']:>12.1f}"
+                f"{stats['booking_p95_ms']:>13.1f}{stats['browse_p50_ms']:>15.1f}{stats['browse_p95_ms']:>15.1f}"
+                f"{stats['lock_errors']:>13}"
+            )
+
+    def run_mode(self, options, **settings):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            # A file, not the shared-cache in-memory test database, so locking behaves like production
+            workdir = tempfile.mkdtemp(prefix='hostel-admission-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            rooms, users = seed_contended_block(
+                rooms=options['rooms'], capacity=options['capacity'], users=options['users'],
+            )
+            caches['default'].clear()
+            with override_settings(**settings):
+                return run_admission_benchmark(rooms, users, threads=options['threads'], readers=options['readers'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
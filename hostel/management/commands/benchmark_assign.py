@@ -0,0 +1,79 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from hostel.benchmarks import run_assignment_benchmark, seed_hostel
+
+
+class Command(BaseCommand):
+    help = 'Measures auto-assignment latency on a large throwaway hostel (100k rooms by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=50, help='Blocks per gender')
+        parser.add_argument('--floors', type=int, default=10, help='Floors per block')
+        parser.add_argument('--rooms', type=int, default=100, help='Rooms per floor')
+        parser.add_argument('--users', type=int, default=40000, help='Synthetic students')
+        parser.add_argument('--booked-ratio', type=float, default=0.9, help='Fraction of students already booked')
+        parser.add_argument('--seed', type=int, default=42, help='Dataset seed')
+        parser.add_argument('--assignments', type=int, default=400, help='Students to auto-assign')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            started = time.perf_counter()
+            seed_hostel(
+                blocks=options['blocks'], floors=options['floors'], rooms=options['rooms'],
+                users=options['users'], booked_ratio=options['booked_ratio'], seed=options['seed'],
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            seed_seconds = time.perf_counter() - started
+            results = run_assignment_benchmark(assignments=options['assignments'], seed=options['seed'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                key: options[key] for key in ('blocks', 'floors', 'rooms', 'users', 'booked_ratio', 'seed')
+            },
+            'seed_seconds': round(seed_seconds, 3),
+            **results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+        rooms = 2 * options['blocks'] * options['floors'] * options['rooms']
+        self.stdout.write(f'{rooms} rooms; candidate query plan:\n{results["plan"]}\n')
+        self.stdout.write(f"{'preference':<12}{'assigned':>10}{'p50 ms':>10}{'p95 ms':>10}{'queries':>10}")
+        for row in results['preferences']:
+            self.stdout.write(
+                f"{row['kind']:<12}{row['assignments']:>10}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+                f"{row['max_queries']:>10}"
+            )
+        self.stdout.write(f"Outcomes: {results['outcomes']}")
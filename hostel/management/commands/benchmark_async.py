@@ -0,0 +1,73 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from hostel.benchmarks import run_async_benchmark, seed_hostel
+
+
+class Command(BaseCommand):
+    help = 'Compares browsing throughput of the sync views under WSGI threads with the async views under ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=20, help='Blocks per gender')
+        parser.add_argument('--floors', type=int, default=10, help='Floors per block')
+        parser.add_argument('--rooms', type=int, default=50, help='Rooms per floor')
+        parser.add_argument('--users', type=int, default=20000, help='Synthetic students')
+        parser.add_argument('--booked-ratio', type=float, default=0.5, help='Fraction of students already booked')
+        parser.add_argument('--seed', type=int, default=42, help='Dataset seed')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per view and mode')
+        parser.add_argument('--concurrency', type=int, default=16, help='Threads (WSGI) or tasks (ASGI) in flight')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            # Several threads read at once, so use a file like production rather than shared memory
+            workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            seed_hostel(
+                blocks=options['blocks'], floors=options['floors'], rooms=options['rooms'],
+                users=options['users'], booked_ratio=options['booked_ratio'], seed=options['seed'],
+            )
+            results = run_async_benchmark(requests=options['requests'], concurrency=options['concurrency'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                key: options[key] for key in ('blocks', 'floors', 'rooms', 'users', 'booked_ratio', 'seed')
+            },
+            'views': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+        self.stdout.write(f"{'mode':<6}{'view':<16}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:<6}{row['view']:<16}{row['requests_per_second']:>10.1f}"
+                f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+            )
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import setup_databases, teardown_databases
+from hostel.benchmarks import BOOKING_INDEXES, explain_hot_queries, seed_hostel
+
+
+class Command(BaseCommand):
+    help = 'Shows query plans and timings of the booking hot paths with and without the booking indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=50, help='Blocks per gender')
+        parser.add_argument('--floors', type=int, default=10, help='Floors per block')
+        parser.add_argument('--rooms', type=int, default=100, help='Rooms per floor')
+        parser.add_argument('--users', type=int, default=200000, help='Synthetic students')
+        parser.add_argument('--booked-ratio', type=float, default=0.6, help='Fraction of students already booked')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError('Dropping indexes inside a transaction needs SQLite or PostgreSQL.')
+
+        workdir = None
+        if connection.vendor == 'sqlite':
+            workdir = tempfile.mkdtemp(prefix='hostel-index-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            seed_hostel(
+                blocks=options['blocks'], floors=options['floors'], rooms=options['rooms'],
+                users=options['users'], booked_ratio=options['booked_ratio'],
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            # DDL is transactional here, so measure "before" with the indexes dropped and roll back.
+            # It has to run first: SQLite keeps reusing a cached EXPLAIN plan after a DROP INDEX.
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in BOOKING_INDEXES:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                before = explain_hot_queries(options['repeat'])
+                transaction.set_rollback(True)
+            after = explain_hot_queries(options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        results = []
+        for old, new in zip(before, after):
+            results.append({
+                'query': new['query'],
+                'before': {'plan': old['plan'], 'median_ms': old['median_ms']},
+                'after': {'plan': new['plan'], 'median_ms': new['median_ms']},
+            })
+            self.stdout.write(self.style.MIGRATE_HEADING(new['query']))
+            self.stdout.write(f"  before ({old['median_ms']:.3f}ms):")
+            for line in old['plan'].splitlines():
+                self.stdout.write(f'    {line}')
+            self.stdout.write(f"  after ({new['median_ms']:.3f}ms):")
+            for line in new['plan'].splitlines():
+                self.stdout.write(f'    {line}')
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
@@ -0,0 +1,74 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from hostel.benchmarks import run_lottery_benchmark, seed_hostel, seed_lottery_round
+
+
+class Command(BaseCommand):
+    help = 'Times a full lottery draw on a throwaway hostel (50k students into 25k double rooms by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=25, help='Blocks per gender')
+        parser.add_argument('--floors', type=int, default=10, help='Floors per block')
+        parser.add_argument('--rooms', type=int, default=50, help='Rooms per floor')
+        parser.add_argument('--capacity', type=int, default=2, help='Beds per room')
+        parser.add_argument('--users', type=int, default=50000, help='Students entering the lottery')
+        parser.add_argument('--group-ratio', type=float, default=0.2, help='Fraction of students entering in pairs')
+        parser.add_argument('--seed', type=int, default=42, help='Dataset and draw seed')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            started = time.perf_counter()
+            seed_hostel(
+                blocks=options['blocks'], floors=options['floors'], rooms=options['rooms'],
+                capacity=options['capacity'], users=options['users'], booked_ratio=0, seed=options['seed'],
+            )
+            allocation_round = seed_lottery_round(group_ratio=options['group_ratio'], seed=options['seed'])
+            seed_seconds = time.perf_counter() - started
+            results = run_lottery_benchmark(allocation_round, seed=options['seed'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                key: options[key] for key in ('blocks', 'floors', 'rooms', 'capacity', 'users', 'group_ratio', 'seed')
+            },
+            'seed_seconds': round(seed_seconds, 3),
+            **results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+        rooms = 2 * options['blocks'] * options['floors'] * options['rooms']
+        self.stdout.write(f"{results['students']} students, {rooms} rooms")
+        self.stdout.write(f"Placed {results['placed']}, unplaced {results['unplaced']}; by choice: {results['by_choice']}")
+        self.stdout.write(f"Dry run: {results['dry_run_seconds']:.2f}s in {results['dry_run_queries']} queries")
+        self.stdout.write(f"Draw:    {results['seconds']:.2f}s in {results['queries']} queries")
@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from hostel.benchmarks import run_profiling_benchmark, seed_hostel
+
+
+class Command(BaseCommand):
+    help = 'Measures the overhead of the request profiling middleware on the browsing pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=10, help='Blocks per gender')
+        parser.add_argument('--floors', type=int, default=5, help='Floors per block')
+        parser.add_argument('--rooms', type=int, default=40, help='Rooms per floor')
+        parser.add_argument('--users', type=int, default=2000, help='Synthetic students')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per view and mode')
+        parser.add_argument('--sample-rate', type=float, default=0.05, help='Fraction of requests sampled')
+        parser.add_argument('--per-minute', type=int, help='Profiles per minute (default: HOSTEL_PROFILING_MAX_PER_MINUTE)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            # Benchmark against a file like production, not the in-memory test database
+            workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            seed_hostel(
+                blocks=options['blocks'], floors=options['floors'], rooms=options['rooms'], users=options['users'],
+            )
+            results = run_profiling_benchmark(
+                requests=options['requests'], sample_rate=options['sample_rate'], per_minute=options['per_minute'],
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'results': results}, fh, indent=2)
+
+        self.stdout.write(f"{'mode':<9}{'view':<14}{'profiled':>9}{'p50 ms':>9}{'p95 ms':>9}{'overhead':>10}")
+        for row in results:
+            self.stdout.write(
+                f"{row['mode']:<9}{row['view']:<14}{row['profiled']:>9}{row['p50_ms']:>9.2f}"
+                f"{row['p95_ms']:>9.2f}{row['overhead_pct']:>9.1f}%"
+            )
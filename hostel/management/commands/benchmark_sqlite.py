@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+from hostel.benchmarks import run_booking_stress, seed_contended_block
+
+
+PROFILES = {
+    'default': {},
+    'production': settings.HOSTEL_SQLITE_OPTIONS,
+}
+
+
+class Command(BaseCommand):
+    help = 'Races concurrent bookings and readers against SQLite with the stock and the production settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=50, help='Rooms in the contended block')
+        parser.add_argument('--capacity', type=int, default=2, help='Capacity of each room')
+        parser.add_argument('--users', type=int, default=100, help='Users competing for the rooms')
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent booking threads')
+        parser.add_argument('--readers', type=int, default=8, help='Threads reading the block layout meanwhile')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the order users try rooms in')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_sqlite compares SQLite settings; the default database is not SQLite.')
+
+        original_options = connection.settings_dict.get('OPTIONS', {})
+        results = {}
+        try:
+            for profile, profile_options in PROFILES.items():
+                results[profile] = self.run_profile(profile_options, options)
+        finally:
+            connection.close()
+            connection.settings_dict['OPTIONS'] = original_options
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+
+        self.stdout.write(f"{'profile':<12}{'bookings/s':>12}{'attempts/s':>12}{'reads/s':>10}{'lock errors':>13}")
+        for profile, stats in results.items():
+            self.stdout.write(
+                f"{profile:<12}{stats['bookings_per_second']:>12.1f}{stats['attempts_per_second']:>12.1f}"
+                f"{stats['reads_per_second']:>10.1f}{stats['lock_errors']:>13}"
+            )
+
+    def run_profile(self, profile_options, options):
+        # A file, not the shared-cache in-memory test database, so locking behaves like production
+        workdir = tempfile.mkdtemp(prefix='hostel-sqlite-')
+        connection.close()
+        connection.settings_dict['OPTIONS'] = dict(profile_options)
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            rooms, users = seed_contended_block(
+                rooms=options['rooms'], capacity=options['capacity'], users=options['users'],
+            )
+            return run_booking_stress(
+                rooms, users, threads=options['threads'], seed=options['seed'], readers=options['readers'],
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
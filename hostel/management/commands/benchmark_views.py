@@ -0,0 +1,82 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from hostel.benchmarks import VIEW_QUERY_BUDGETS, run_view_benchmarks, seed_hostel
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the booking views on a large throwaway hostel and enforces per-view query budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=20, help='Blocks per gender')
+        parser.add_argument('--floors', type=int, default=10, help='Floors per block')
+        parser.add_argument('--rooms', type=int, default=50, help='Rooms per floor')
+        parser.add_argument('--users', type=int, default=20000, help='Synthetic students')
+        parser.add_argument('--booked-ratio', type=float, default=0.5, help='Fraction of students already booked')
+        parser.add_argument('--seed', type=int, default=42, help='Dataset seed')
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per view')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            # Benchmark against a file like production, not the in-memory test database
+            workdir = tempfile.mkdtemp(prefix='hostel-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            started = time.perf_counter()
+            seed_hostel(
+                blocks=options['blocks'], floors=options['floors'], rooms=options['rooms'],
+                users=options['users'], booked_ratio=options['booked_ratio'], seed=options['seed'],
+            )
+            seed_seconds = time.perf_counter() - started
+            results = run_view_benchmarks(iterations=options['iterations'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        report = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                key: options[key] for key in ('blocks', 'floors', 'rooms', 'users', 'booked_ratio', 'seed')
+            },
+            'seed_seconds': round(seed_seconds, 3),
+            'iterations': options['iterations'],
+            'views': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+        self.stdout.write(f"{'view':<16}{'p50 ms':>10}{'p95 ms':>10}{'queries':>10}{'budget':>8}")
+        for row in results:
+            line = (
+                f"{row['view']:<16}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+                f"{row['max_queries']:>10}{row['query_budget'] or '-':>8}"
+            )
+            self.stdout.write(self.style.ERROR(line) if row['over_budget'] else line)
+
+        over = [row['view'] for row in results if row['over_budget']]
+        if over:
+            raise CommandError(f"Over query budget: {', '.join(over)} (budgets: {VIEW_QUERY_BUDGETS})")
+        self.stdout.write(self.style.SUCCESS('All views within their query budgets.'))
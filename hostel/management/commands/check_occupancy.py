@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from hostel.models import Room
+from hostel.services import booking
+
+
+class Command(BaseCommand):
+    help = 'Checks stored room occupancy against active bookings and optionally repairs drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Rewrite occupancy (and is_booked) for every room that has drifted',
+        )
+
+    def handle(self, *args, **options):
+        drifted = list(Room.objects.drifted().select_related('floor__block'))
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All room occupancy counters are consistent.'))
+            return
+
+        for room in drifted:
+            self.stdout.write(self.style.WARNING(f'{room}: stored {room.occupancy}, actual {room.actual}'))
+
+        if not options['repair']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} room(s) drifted. Re-run with --repair to fix them.'))
+            return
+
+        with transaction.atomic():
+            booking.resync_rooms(room.pk for room in drifted)
+
+        self.stdout.write(self.style.SUCCESS(f'Repaired {len(drifted)} room(s).'))
@@ -0,0 +1,53 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from hostel.models import Booking
+
+
+COLUMNS = ('username', 'block', 'floor', 'room', 'term')
+LOOKUPS = ('user__username', 'room__floor__block__block_name', 'room__floor__floor_number', 'room__room_number', 'term')
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams the current allocations (active bookings) as CSV or JSONL, in the format '
+        'import_allocations reads, one row at a time'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+        parser.add_argument('--output', help='File to write (defaults to stdout)')
+        parser.add_argument('--block', action='append', dest='blocks', help='Only this block (repeatable)')
+        parser.add_argument('--term', help='Only bookings of this term')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.active()
+        if options['blocks']:
+            bookings = bookings.filter(room__floor__block__block_name__in=options['blocks'])
+        if options['term']:
+            bookings = bookings.filter(term=options['term'])
+        # iterator() streams from the cursor, so memory stays flat however many students are housed
+        rows = bookings.order_by(*LOOKUPS[1:4], 'id').values_list(*LOOKUPS).iterator(chunk_size=options['chunk_size'])
+
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        written = 0
+        try:
+            if options['format'] == 'csv':
+                writer = csv.writer(output)
+                writer.writerow(COLUMNS)
+                for row in rows:
+                    writer.writerow(row)
+                    written += 1
+            else:
+                for row in rows:
+                    output.write(json.dumps(dict(zip(COLUMNS, row))) + '\n')
+                    written += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Exported {written} allocation(s) to {options['output']}."))
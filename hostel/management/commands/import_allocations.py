@@ -0,0 +1,176 @@
+import csv
+import json
+import sys
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from hostel.models import Booking, BookingEvent, Room, current_term
+from hostel.services import booking, journal
+
+
+FIELDS = ('username', 'block', 'floor', 'room')
+
+# Why a row was not applied, as written to the rejects file
+INVALID_ROW = 'invalid row'
+UNKNOWN_USER = 'unknown user'
+UNKNOWN_ROOM = 'unknown room'
+NO_GENDER = 'student has no gender'
+WRONG_GENDER = 'block is for the other gender'
+ALREADY_BOOKED = 'student already has a room'
+ROOM_FULL = 'room is full'
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV (with header) or JSONL stream, one line at a time"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        missing = set(FIELDS) - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(f"CSV header lacks {', '.join(sorted(missing))}")
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_num, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_num, row if isinstance(row, dict) else {}
+
+
+class Command(BaseCommand):
+    help = (
+        'Books students into rooms in bulk from a CSV or JSONL file of username, block, floor and room. '
+        'Rows that fail a check are skipped and reported; the rest are applied in batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Allocation file, or '-' for stdin")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Defaults to the file extension, else csv')
+        parser.add_argument('--term', help='Term of the new bookings (defaults to the current term)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows checked and applied per transaction')
+        parser.add_argument('--rejects', help='Write rejected rows and the reason to this CSV file')
+        parser.add_argument('--dry-run', action='store_true', help='Check every row but book nobody')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.term = options['term'] or current_term()
+        self.dry_run = options['dry_run']
+        # Each room as (block name, floor number, room number) -> (room id, block gender)
+        self.rooms = {
+            (block_name, floor_number, room_number): (room_id, gender)
+            for room_id, block_name, floor_number, room_number, gender in Room.objects.values_list(
+                'id', 'floor__block__block_name', 'floor__floor_number', 'room_number', 'floor__block__gender',
+            ).iterator(chunk_size=5000)
+        }
+        # A dry run commits nothing, so later batches must see what earlier ones would have taken
+        self.taken = Counter()
+        self.placed = set()
+
+        self.reasons = Counter()
+        self.booked = 0
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        rejects_file = open(options['rejects'], 'w', newline='', encoding='utf-8') if options['rejects'] else None
+        try:
+            self.rejects = csv.writer(rejects_file) if rejects_file else None
+            if self.rejects:
+                self.rejects.writerow(('line', *FIELDS, 'reason'))
+            rows = read_rows(stream, fmt)
+            while batch := list(islice(rows, options['batch_size'])):
+                self.apply_batch(batch)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects_file:
+                rejects_file.close()
+
+        rejected = sum(self.reasons.values())
+        verb = 'Would book' if self.dry_run else 'Booked'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {self.booked} student(s) for {self.term}.'))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f'Rejected {rejected} row(s):'))
+            for reason, count in self.reasons.most_common():
+                self.stdout.write(f'  {reason}: {count}')
+
+    def parse(self, row):
+        """(username, room key) of a row, or None if a field is missing or malformed"""
+        try:
+            username, block, floor, room = (str(row[field]).strip() for field in FIELDS)
+            floor = int(floor)
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not (username and block and room):
+            return None
+        return username, (block, floor, room)
+
+    def reject(self, line_num, row, reason):
+        self.reasons[reason] += 1
+        if self.rejects:
+            self.rejects.writerow((line_num, *(row.get(field, '') for field in FIELDS), reason))
+
+    def apply_batch(self, batch):
+        parsed = []
+        for line_num, row in batch:
+            allocation = self.parse(row)
+            if allocation is None:
+                self.reject(line_num, row, INVALID_ROW)
+            else:
+                parsed.append((line_num, row, *allocation))
+
+        users = {
+            username: (user_id, gender)
+            for username, user_id, gender in User.objects.filter(
+                username__in={username for _, _, username, _ in parsed},
+            ).values_list('username', 'id', 'profile__gender')
+        }
+        room_ids = {self.rooms[key][0] for _, _, _, key in parsed if key in self.rooms}
+
+        with booking.write_transaction(), journal.batch():
+            # Lock the batch's rooms and read their free spots now, so site bookings made meanwhile count
+            free = dict(
+                Room.objects.select_for_update().filter(pk__in=room_ids)
+                .values_list('id', F('capacity') - F('occupancy'))
+            )
+            booked_users = set(
+                Booking.objects.active().filter(user_id__in=[user_id for user_id, _ in users.values()])
+                .values_list('user_id', flat=True)
+            )
+
+            bookings = []
+            for line_num, row, username, key in parsed:
+                user_id, gender = users.get(username, (None, None))
+                room_id, block_gender = self.rooms.get(key, (None, None))
+                if user_id is None:
+                    reason = UNKNOWN_USER
+                elif room_id is None or room_id not in free:
+                    reason = UNKNOWN_ROOM
+                elif not gender:
+                    reason = NO_GENDER
+                elif gender != block_gender:
+                    reason = WRONG_GENDER
+                elif user_id in booked_users or user_id in self.placed:
+                    reason = ALREADY_BOOKED
+                elif free[room_id] - self.taken[room_id] <= 0:
+                    reason = ROOM_FULL
+                else:
+                    reason = None
+                if reason:
+                    self.reject(line_num, row, reason)
+                    continue
+                free[room_id] -= 1
+                booked_users.add(user_id)
+                bookings.append(Booking(user_id=user_id, room_id=room_id, term=self.term))
+
+            self.booked += len(bookings)
+            if self.dry_run:
+                self.taken.update(b.room_id for b in bookings)
+                self.placed.update(b.user_id for b in bookings)
+                return
+            Booking.objects.bulk_create(bookings)
+            journal.record_many(BookingEvent.BOOKED, ((b.user_id, b.room_id) for b in bookings), source='import')
+            booking.resync_rooms({b.room_id for b in bookings}, [b.user_id for b in bookings])
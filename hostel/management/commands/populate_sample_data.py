@@ -1,76 +1,186 @@
-from django.core.management.base import BaseCommand
-from hostel.models import Block, Floor, Room
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from hostel import availability
+from hostel.models import Block, Booking, BookingEvent, Floor, Room, UserProfile, current_term
+from hostel.services import journal, occupancy
+
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
 class Command(BaseCommand):
-    help = 'Populates the database with sample block data'
+    help = 'Populates the database with sample block data (and optionally students and bookings)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--blocks', type=int, default=3, help='Blocks per gender (B1.., G1..)')
+        parser.add_argument('--floors', type=int, default=3, help='Floors per block')
+        parser.add_argument('--rooms', type=int, default=5, help='Rooms per floor')
+        parser.add_argument('--capacity', type=int, default=2, help='Capacity of each new room')
+        parser.add_argument('--users', type=int, default=0, help='Synthetic students to create, half of each gender')
+        parser.add_argument(
+            '--booked-ratio', type=float, default=0.0,
+            help='Fraction of the new students to book into a random room of their gender',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, so benchmark datasets are comparable')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk INSERT/UPDATE')
+        parser.add_argument(
+            '--password', default='student-password',
+            help='Password shared by the synthetic students (hashed once)',
+        )
 
     def handle(self, *args, **options):
-        # Create male blocks (B1, B2, B3)
-        male_blocks = []
-        for i in range(1, 4):
-            block_name = f"B{i}"
-            block, created = Block.objects.get_or_create(
-                block_name=block_name,
-                defaults={
-                    'gender': 'M',
-                    'description': f'Male Block {i} with modern amenities'
-                }
-            )
-            male_blocks.append(block)
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'Created block: {block.block_name}'))
-        
-        # Create female blocks (G1, G2, G3)
-        female_blocks = []
-        for i in range(1, 4):
-            block_name = f"G{i}"
-            block, created = Block.objects.get_or_create(
-                block_name=block_name,
-                defaults={
-                    'gender': 'F',
-                    'description': f'Female Block {i} with modern amenities'
-                }
-            )
-            female_blocks.append(block)
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'Created block: {block.block_name}'))
-        
-        all_blocks = male_blocks + female_blocks
-        
-        # Create floors for each block (3 floors per block)
-        total_floors = 0
-        total_rooms = 0
-        
-        for block in all_blocks:
-            floors = []
-            for floor_num in range(1, 4):
-                floor, created = Floor.objects.get_or_create(
-                    block=block,
-                    floor_number=floor_num,
-                    defaults={}
-                )
-                floors.append(floor)
-                if created:
-                    self.stdout.write(self.style.SUCCESS(f'Created floor: {floor}'))
-                    total_floors += 1
-            
-            # Create rooms for each floor (5 rooms per floor)
-            for floor in floors:
-                for room_num in range(1, 6):
-                    room_number = f"{floor.floor_number}{room_num:02d}"  # e.g., 101, 102, etc.
-                    room, created = Room.objects.get_or_create(
-                        floor=floor,
-                        room_number=room_number,
-                        defaults={'capacity': 2}
-                    )
-                    if created:
-                        self.stdout.write(self.style.SUCCESS(f'Created room: {block.block_name} - {room.room_number}'))
-                        total_rooms += 1
-        
+        if not 0.0 <= options['booked_ratio'] <= 1.0:
+            raise CommandError('--booked-ratio must be between 0 and 1.')
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            blocks = self.create_blocks(options['blocks'])
+            floor_ids = self.create_floors(blocks, options['floors'])
+            total_rooms = self.create_rooms(floor_ids, options['rooms'], options['capacity'])
+            users = self.create_users(options['users'], options['password'])
+            total_bookings = self.create_bookings(users, options['booked_ratio'])
+
+            # Rooms were bulk inserted and counted without signals: count the summary once at the end
+            occupancy.rebuild()
+            availability.bump_blocks_on_commit(block.pk for block in blocks)
+            transaction.on_commit(lambda: availability.bump(availability.BLOCKS_LIST))
+
+        elapsed = time.perf_counter() - started
         self.stdout.write(self.style.SUCCESS('\n' + '='*50))
         self.stdout.write(self.style.SUCCESS('Sample data populated successfully!'))
-        self.stdout.write(self.style.SUCCESS(f'Created: {len(all_blocks)} blocks ({len(male_blocks)} male, {len(female_blocks)} female)'))
-        self.stdout.write(self.style.SUCCESS(f'Created: {total_floors} floors (3 per block)'))
-        self.stdout.write(self.style.SUCCESS(f'Created: {total_rooms} rooms (5 per floor)'))
+        self.stdout.write(self.style.SUCCESS(f'Created: {self.created_blocks} blocks ({options["blocks"]} per gender requested)'))
+        self.stdout.write(self.style.SUCCESS(f'Created: {self.created_floors} floors ({options["floors"]} per block)'))
+        self.stdout.write(self.style.SUCCESS(f'Created: {total_rooms} rooms ({options["rooms"]} per floor)'))
+        self.stdout.write(self.style.SUCCESS(f'Created: {len(users)} students and {total_bookings} bookings'))
+        self.stdout.write(self.style.SUCCESS(f'Took {elapsed:.2f}s'))
         self.stdout.write(self.style.SUCCESS('='*50))
+
+    def create_blocks(self, per_gender):
+        wanted = {}
+        for gender, prefix, label in (('M', 'B', 'Male'), ('F', 'G', 'Female')):
+            for i in range(1, per_gender + 1):
+                wanted[f'{prefix}{i}'] = Block(
+                    block_name=f'{prefix}{i}',
+                    gender=gender,
+                    description=f'{label} Block {i} with modern amenities',
+                )
+
+        existing = set(Block.objects.filter(block_name__in=wanted).values_list('block_name', flat=True))
+        missing = [block for name, block in wanted.items() if name not in existing]
+        Block.objects.bulk_create(missing, batch_size=self.batch_size)
+        self.created_blocks = len(missing)
+        for block in missing:
+            self.stdout.write(self.style.SUCCESS(f'Created block: {block.block_name}'))
+
+        return list(Block.objects.filter(block_name__in=wanted).order_by('block_name'))
+
+    def create_floors(self, blocks, per_block):
+        """Returns {floor_id: (block, floor_number)} for every requested floor"""
+        block_ids = [block.pk for block in blocks]
+        existing = set(
+            Floor.objects.filter(block_id__in=block_ids).values_list('block_id', 'floor_number')
+        )
+        missing = [
+            Floor(block_id=block.pk, floor_number=floor_num)
+            for block in blocks
+            for floor_num in range(1, per_block + 1)
+            if (block.pk, floor_num) not in existing
+        ]
+        Floor.objects.bulk_create(missing, batch_size=self.batch_size)
+        self.created_floors = len(missing)
+
+        blocks_by_id = {block.pk: block for block in blocks}
+        floors = Floor.objects.filter(block_id__in=block_ids, floor_number__lte=per_block)
+        return {floor_id: (blocks_by_id[block_id], floor_number)
+                for floor_id, block_id, floor_number in floors.values_list('id', 'block_id', 'floor_number')}
+
+    def create_rooms(self, floor_ids, per_floor, capacity):
+        existing = set(
+            Room.objects.filter(floor_id__in=floor_ids).values_list('floor_id', 'room_number')
+        )
+        missing = []
+        for floor_id, (block, floor_number) in floor_ids.items():
+            for room_num in range(1, per_floor + 1):
+                room_number = f'{floor_number}{room_num:02d}'  # e.g., 101, 102, etc.
+                if (floor_id, room_number) not in existing:
+                    missing.append(Room(floor_id=floor_id, room_number=room_number, capacity=capacity))
+        Room.objects.bulk_create(missing, batch_size=self.batch_size)
+
+        # Free spots per gender across every requested room, for create_bookings()
+        self.free_rooms = {'M': [], 'F': []}
+        rooms = Room.objects.filter(floor_id__in=floor_ids, occupancy__lt=F('capacity'))
+        for room_id, floor_id, free in rooms.values_list('id', 'floor_id', F('capacity') - F('occupancy')):
+            block, _ = floor_ids[floor_id]
+            self.free_rooms[block.gender].append([room_id, free])
+        return len(missing)
+
+    def create_users(self, count, password):
+        if not count:
+            return []
+        password_hash = make_password(password)
+        wanted = [f'student{num:06d}' for num in range(1, count + 1)]
+        existing = set()
+        for chunk in batched(wanted, self.batch_size):
+            existing.update(User.objects.filter(username__in=chunk).values_list('username', flat=True))
+
+        new_users = [
+            User(username=username, password=password_hash, first_name='Student', last_name=username[7:])
+            for username in wanted if username not in existing
+        ]
+        User.objects.bulk_create(new_users, batch_size=self.batch_size)
+
+        created = []
+        for chunk in batched([user.username for user in new_users], self.batch_size):
+            created.extend(User.objects.filter(username__in=chunk).values_list('id', 'username'))
+        created.sort(key=lambda row: row[1])
+        # Alternate genders so each gender gets half the students, independent of the seed
+        users = [(user_id, 'M' if num % 2 == 0 else 'F') for num, (user_id, _) in enumerate(created)]
+        UserProfile.objects.bulk_create(
+            (UserProfile(user_id=user_id, gender=gender) for user_id, gender in users),
+            batch_size=self.batch_size,
+        )
+        return users
+
+    def create_bookings(self, users, booked_ratio):
+        bookings = []
+        added = {}
+        term = current_term()
+        for user_id, gender in users:
+            free_rooms = self.free_rooms[gender]
+            if not free_rooms or self.rng.random() >= booked_ratio:
+                continue
+            index = self.rng.randrange(len(free_rooms))
+            room = free_rooms[index]
+            room_id = room[0]
+            bookings.append(Booking(room_id=room_id, user_id=user_id, term=term))
+            added[room_id] = added.get(room_id, 0) + 1
+            room[1] -= 1
+            if not room[1]:
+                free_rooms[index] = free_rooms[-1]
+                free_rooms.pop()
+
+        Booking.objects.bulk_create(bookings, batch_size=self.batch_size)
+        with journal.batch():
+            journal.record_many(BookingEvent.BOOKED, ((b.user_id, b.room_id) for b in bookings), 'sample')
+
+        # One UPDATE per batch of rooms that gained the same number of occupants
+        rooms_by_delta = {}
+        for room_id, delta in added.items():
+            rooms_by_delta.setdefault(delta, []).append(room_id)
+        for delta, room_ids in rooms_by_delta.items():
+            for chunk in batched(room_ids, self.batch_size):
+                Room.objects.filter(pk__in=chunk).adjust_occupancy(delta)
+        first_occupant = Booking.objects.active().filter(room_id=OuterRef('pk')).order_by('id').values('user_id')[:1]
+        for chunk in batched(list(added), self.batch_size):
+            Room.objects.filter(pk__in=chunk, booked_by__isnull=True).update(booked_by=Subquery(first_occupant))
+        return len(bookings)
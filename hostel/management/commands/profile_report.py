@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from hostel import profiling
+from hostel.stats import percentile
+
+
+class Command(BaseCommand):
+    help = 'Aggregates the request profile dumps into the top functions per view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Directory of dumps (default: HOSTEL_PROFILING_DIR)')
+        parser.add_argument('--view', help='Only this view, by URL name (e.g. book_room)')
+        parser.add_argument('--top', type=int, default=20, help='Functions listed per view')
+        parser.add_argument(
+            '--sort', choices=sorted(profiling.SORT_KEYS), default='cumulative', help='Order of the functions',
+        )
+        parser.add_argument(
+            '--header',
+            action='store_true',
+            help='Print a signed X-Hostel-Profile header that gets one request profiled, and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['header']:
+            self.stdout.write(f'{profiling.HEADER}: {profiling.sign_token()}')
+            self.stdout.write(f'Valid for {settings.HOSTEL_PROFILING_TOKEN_MAX_AGE} seconds.')
+            return
+
+        directory = options['dir'] or settings.HOSTEL_PROFILING_DIR
+        dumps = profiling.dumps_by_view(directory, options['view'])
+        if not dumps:
+            self.stdout.write(self.style.WARNING(f'No profile dumps in {directory}.'))
+            return
+
+        for view, entries in sorted(dumps.items()):
+            latencies = [ms for _, ms in entries]
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{view}: {len(entries)} profile(s), p50 {percentile(latencies, 50)}ms, max {max(latencies)}ms'
+            ))
+            self.stdout.write(f'{"calls":>10} {"tottime ms":>11} {"cumtime ms":>11}  function (per request)')
+            for row in profiling.top_functions([path for path, _ in entries], options['top'], options['sort']):
+                self.stdout.write(
+                    f'{row["calls"]:>10} {row["tottime_ms"]:>11.2f} {row["cumtime_ms"]:>11.2f}  {row["function"]}'
+                )
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+from hostel.services import occupancy
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-block and per-floor occupancy summary from the rooms'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        floors, blocks = occupancy.rebuild()
+        elapsed = time.perf_counter() - started
+        if floors or blocks:
+            self.stdout.write(self.style.WARNING(f'Corrected {floors} floor and {blocks} block summary row(s).'))
+        self.stdout.write(self.style.SUCCESS(f'Occupancy summary rebuilt in {elapsed:.2f}s.'))
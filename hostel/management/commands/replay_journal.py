@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+from hostel.services import journal
+
+
+SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds room occupancy from the booking journal and checks it against the live tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--until',
+            type=int,
+            help='Only replay up to this event id and report the state then, without checking',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['until'] is not None:
+            occupants, rooms = journal.replay(until=options['until'])
+            self.stdout.write(self.style.SUCCESS(
+                f'As of event {options["until"]}: {len(rooms)} student(s) housed in {len(occupants)} room(s) '
+                f'({time.perf_counter() - started:.2f}s).'
+            ))
+            return
+
+        room_drift, user_drift = journal.check()
+        elapsed = time.perf_counter() - started
+        for room_id, (replayed, live) in sorted(room_drift.items())[:SHOWN]:
+            self.stdout.write(self.style.WARNING(f'Room {room_id}: journal {replayed}, live {live}'))
+        for user_id, (replayed, live) in sorted(user_drift.items())[:SHOWN]:
+            self.stdout.write(self.style.WARNING(f'User {user_id}: journal room {replayed}, live room {live}'))
+
+        if room_drift or user_drift:
+            self.stdout.write(self.style.WARNING(
+                f'{len(room_drift)} room(s) and {len(user_drift)} student(s) differ from the journal.'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Journal up to event {journal.last_event_id()} matches the live tables ({elapsed:.2f}s).'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from hostel.models import AllocationRound
+from hostel.services.lottery import ANYWHERE, LotteryError, run_lottery
+
+
+class Command(BaseCommand):
+    help = 'Runs the lottery of an allocation round, placing every student who entered it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('round', type=int, help='Allocation round id')
+        parser.add_argument('--seed', type=int, help='Draw seed (default: random; reuse a recorded one to reproduce a draw)')
+        parser.add_argument(
+            '--preferences-only', action='store_true',
+            help='Leave students whose choices are all full unplaced instead of putting them anywhere',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report the outcome without writing it')
+
+    def handle(self, *args, **options):
+        try:
+            allocation_round = AllocationRound.objects.get(pk=options['round'])
+        except AllocationRound.DoesNotExist:
+            raise CommandError(f"No allocation round {options['round']}.")
+        try:
+            result = run_lottery(
+                allocation_round, seed=options['seed'],
+                place_anywhere=not options['preferences_only'], dry_run=options['dry_run'],
+            )
+        except LotteryError as exc:
+            raise CommandError(str(exc))
+
+        for choice, total in sorted(result.by_choice.items(), key=lambda item: (item[0] == ANYWHERE, str(item[0]))):
+            label = 'anywhere' if choice == ANYWHERE else f'choice {choice}'
+            self.stdout.write(f'{label}: {total}')
+        if result.already_housed:
+            self.stdout.write(f'already housed: {result.already_housed}')
+        verb = 'Would place' if options['dry_run'] else 'Placed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.placed} student(s), {result.unplaced} unplaced, '
+            f'in {result.seconds:.2f}s (seed {result.seed}).'
+        ))
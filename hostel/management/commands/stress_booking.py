@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, F
+from django.test.utils import setup_databases, teardown_databases
+from hostel.benchmarks import run_booking_stress, seed_contended_block
+from hostel.models import Booking, Room
+
+
+class Command(BaseCommand):
+    help = 'Races many concurrent bookings against a throwaway database and reports throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=20, help='Rooms in the contended block')
+        parser.add_argument('--capacity', type=int, default=2, help='Capacity of each room')
+        parser.add_argument('--users', type=int, default=200, help='Users competing for the rooms')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent booking threads')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the order users try rooms in')
+
+    def handle(self, *args, **options):
+        workdir = None
+        if connection.vendor == 'sqlite':
+            # A file, not the shared-cache in-memory test database, so locking behaves like production
+            workdir = tempfile.mkdtemp(prefix='hostel-stress-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'stress.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            rooms, users = seed_contended_block(
+                rooms=options['rooms'], capacity=options['capacity'], users=options['users'],
+            )
+            stats = run_booking_stress(rooms, users, threads=options['threads'], seed=options['seed'])
+
+            overfilled = Room.objects.filter(occupancy__gt=F('capacity')).count()
+            drifted = Room.objects.drifted().count()
+            in_many_rooms = (
+                Booking.objects.active().order_by().values('user_id')
+                .annotate(rooms=Count('room_id')).filter(rooms__gt=1).count()
+            )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f"Threads: {stats['threads']}, users: {stats['users']}, rooms: {stats['rooms']}")
+        for outcome, count in sorted(stats['outcomes'].items()):
+            self.stdout.write(f'  {outcome}: {count}')
+        self.stdout.write(f"Lock errors (retried): {stats['lock_errors']}")
+        self.stdout.write(f"Elapsed: {stats['elapsed_seconds']:.3f}s")
+        self.stdout.write(f"Throughput: {stats['bookings_per_second']:.1f} bookings/s, {stats['attempts_per_second']:.1f} attempts/s")
+
+        if overfilled or drifted or in_many_rooms:
+            raise CommandError(
+                f'Invariant violated: {overfilled} overfilled, {drifted} drifted, {in_many_rooms} users in several rooms'
+            )
+        self.stdout.write(self.style.SUCCESS('Capacity was never exceeded.'))
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies the primary SQLite database over the replica file, once or every --interval seconds. '
+        'A local stand-in for replication when trying out HOSTEL_REPLICA_NAME.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replica', help="Replica file (defaults to the 'replica' database's NAME)")
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep copying, sleeping this many seconds in between (the replication lag to expect)',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('sync_replica only copies SQLite databases; use your database\'s own replication.')
+        replica = options['replica'] or settings.DATABASES.get('replica', {}).get('NAME')
+        if not replica:
+            raise CommandError('No replica configured: set HOSTEL_REPLICA_NAME or pass --replica.')
+        primary = str(connection.settings_dict['NAME'])
+        if str(replica) == primary:
+            raise CommandError('The replica must be a different file from the primary.')
+
+        while True:
+            started = time.perf_counter()
+            self.copy(primary, str(replica))
+            self.stdout.write(f'Replica synced in {(time.perf_counter() - started) * 1000:.1f}ms')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def copy(self, primary, replica):
+        # The backup API copies a consistent snapshot while the site keeps writing to the primary
+        source = sqlite3.connect(primary, timeout=20)
+        target = sqlite3.connect(replica, timeout=20)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
@@ -0,0 +1,207 @@
+"""
+In-process request metrics, exposed in the Prometheus text format.
+
+RequestMetricsMiddleware opens a RequestStats for each request; SQL, template
+and cache timings are added to it while the view runs and folded into the
+histograms below when the response goes out. Each worker process keeps its
+own numbers, so scrape every worker (Prometheus sums them per view).
+"""
+import contextvars
+import heapq
+import threading
+import time
+from collections import defaultdict
+
+
+# Latency buckets in seconds, and buckets for "queries per request"
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# How many of a request's slowest queries are kept for the slow-request log
+SLOWEST_QUERIES_KEPT = 5
+
+
+class RequestStats:
+    def __init__(self):
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.slowest_queries = []  # min-heap of (seconds, sql)
+        self.template_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add_query(self, sql, seconds):
+        self.sql_queries += 1
+        self.sql_seconds += seconds
+        entry = (seconds, sql)
+        if len(self.slowest_queries) < SLOWEST_QUERIES_KEPT:
+            heapq.heappush(self.slowest_queries, entry)
+        elif seconds > self.slowest_queries[0][0]:
+            heapq.heapreplace(self.slowest_queries, entry)
+
+    def slowest(self):
+        return sorted(self.slowest_queries, reverse=True)
+
+
+_current = contextvars.ContextVar('hostel_request_stats', default=None)
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def record_sql(execute, sql, params, many, context):
+    """
+    Execute wrapper that hostel.signals installs on every database connection
+    as it opens. It reads the request from the context rather than being
+    installed per request, because under ASGI a sync view queries on a worker
+    thread whose connections the middleware never sees.
+    """
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def note_cache(hit):
+    """Called by the availability cache for every snapshot lookup"""
+    stats = _current.get()
+    if stats is None:
+        return
+    if hit:
+        stats.cache_hits += 1
+    else:
+        stats.cache_misses += 1
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            label_text = _labels(labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = defaultdict(float)
+
+    def inc(self, labels, amount=1):
+        self._series[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{{{_labels(labels)}}} {value:g}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.requests = Counter('hostel_requests_total', 'Requests handled, by view and status code.')
+            self.duration = Histogram(
+                'hostel_request_duration_seconds', 'Wall time per request, by view.', DURATION_BUCKETS,
+            )
+            self.sql_queries = Histogram(
+                'hostel_request_sql_queries', 'SQL queries issued per request, by view.', QUERY_COUNT_BUCKETS,
+            )
+            self.sql_duration = Histogram(
+                'hostel_request_sql_duration_seconds', 'Time spent in SQL per request, by view.', DURATION_BUCKETS,
+            )
+            self.template_duration = Histogram(
+                'hostel_request_template_duration_seconds', 'Template render time per request, by view.',
+                DURATION_BUCKETS,
+            )
+            self.cache = Counter(
+                'hostel_availability_cache_requests_total', 'Availability snapshot lookups, by view and result.',
+            )
+            self.profiled = Counter('hostel_profiled_requests_total', 'Requests profiled, by view and trigger.')
+            self.profile_writes = Counter(
+                'hostel_profile_write_seconds_total', 'Time spent writing profile dumps, by view.',
+            )
+
+    def record(self, view, status, seconds, stats):
+        labels = (('view', view),)
+        with self._lock:
+            self.requests.inc((('view', view), ('status', str(status))))
+            self.duration.observe(labels, seconds)
+            self.sql_queries.observe(labels, stats.sql_queries)
+            self.sql_duration.observe(labels, stats.sql_seconds)
+            self.template_duration.observe(labels, stats.template_seconds)
+            if stats.cache_hits:
+                self.cache.inc((('view', view), ('result', 'hit')), stats.cache_hits)
+            if stats.cache_misses:
+                self.cache.inc((('view', view), ('result', 'miss')), stats.cache_misses)
+
+    def record_profile(self, view, trigger, write_seconds):
+        with self._lock:
+            self.profiled.inc((('view', view), ('trigger', trigger)))
+            self.profile_writes.inc((('view', view),), write_seconds)
+
+    def render(self):
+        with self._lock:
+            lines = [
+                '# HELP hostel_process_start_time_seconds Start time of the metrics window.',
+                '# TYPE hostel_process_start_time_seconds gauge',
+                f'hostel_process_start_time_seconds {self.started}',
+            ]
+            for metric in (
+                self.requests, self.duration, self.sql_queries, self.sql_duration,
+                self.template_duration, self.cache, self.profiled, self.profile_writes,
+            ):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
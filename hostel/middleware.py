@@ -0,0 +1,248 @@
+import cProfile
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import Template
+from django.utils.functional import cached_property
+
+from . import metrics, profiling
+from .models import Room, UserProfile
+
+
+logger = logging.getLogger('hostel.metrics')
+profiling_logger = logging.getLogger('hostel.profiling')
+
+
+class UserContext:
+    """
+    Per-request view of the signed-in student. Each lookup runs at most once
+    per request, and only if something actually asks for it.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def profile(self):
+        if not self.user.is_authenticated:
+            return None
+        return UserProfile.objects.filter(user_id=self.user.pk).first()
+
+    @cached_property
+    def gender(self):
+        return self.profile.gender if self.profile else None
+
+    @cached_property
+    def room(self):
+        """The room the user currently occupies, with its floor and block already joined"""
+        if not self.user.is_authenticated:
+            return None
+        return Room.objects.occupied_by(self.user).select_related('floor__block').first()
+
+    @property
+    def has_booking(self):
+        return self.room is not None
+
+    def is_in_room(self, room):
+        return self.room is not None and self.room.pk == room.pk
+
+
+class UserContextMiddleware:
+    """Attach request.user_context; must run after AuthenticationMiddleware"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.user_context = UserContext(request.user)
+        return self.get_response(request)
+
+
+def _instrument_template_rendering():
+    """Time top-level template renders (includes and extends are part of their parent)"""
+    if getattr(Template.render, 'hostel_timed', False):
+        return
+    original_render = Template.render
+
+    def render(self, *args, **kwargs):
+        stats = metrics.current()
+        if stats is None:
+            return original_render(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return original_render(self, *args, **kwargs)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+    render.hostel_timed = True
+    Template.render = render
+
+
+class RequestMetricsMiddleware:
+    """
+    Record per-view wall time, SQL count and time, template render time and
+    availability cache hits into hostel.metrics, and log requests that exceed
+    HOSTEL_SLOW_REQUEST_SECONDS or HOSTEL_SLOW_REQUEST_QUERIES with their
+    slowest queries. Put it first in MIDDLEWARE so it times the whole stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            # Under ASGI stay async, so async views aren't pushed onto a thread by this middleware
+            markcoroutinefunction(self)
+        _instrument_template_rendering()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats, token, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats, token, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        return self._finish(request, response, stats, started)
+
+    def _start(self):
+        # SQL is timed by metrics.record_sql, installed on every connection
+        stats, token = metrics.start_request()
+        return stats, token, time.perf_counter()
+
+    def _finish(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or '<unresolved>'
+        metrics.registry.record(view, response.status_code, elapsed, stats)
+        self._log_if_slow(request, view, elapsed, stats)
+        return response
+
+    def _log_if_slow(self, request, view, elapsed, stats):
+        slow_seconds = getattr(settings, 'HOSTEL_SLOW_REQUEST_SECONDS', None)
+        slow_queries = getattr(settings, 'HOSTEL_SLOW_REQUEST_QUERIES', None)
+        if not (
+            (slow_seconds is not None and elapsed >= slow_seconds)
+            or (slow_queries is not None and stats.sql_queries >= slow_queries)
+        ):
+            return
+        slowest = '\n'.join(f'  {seconds * 1000:.1f}ms {sql[:500]}' for seconds, sql in stats.slowest())
+        logger.warning(
+            'Slow request %s %s (view %s): %.1fms, %d queries in %.1fms, templates %.1fms\n%s',
+            request.method, request.path, view, elapsed * 1000, stats.sql_queries,
+            stats.sql_seconds * 1000, stats.template_seconds * 1000, slowest,
+        )
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of views, and those of requests with a signed
+    X-Hostel-Profile header, with cProfile and dump each profile to
+    HOSTEL_PROFILING_DIR (see hostel.profiling). Only active with
+    HOSTEL_PROFILING_ENABLED.
+
+    The view is called from process_view, on the thread it would run on
+    anyway: under ASGI that is the request's own sync worker thread, so
+    cProfile sees only this request. Async views can't be profiled that way
+    and pass through. Put it last in MIDDLEWARE, so every other middleware's
+    process_view (CSRF included) has run first.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.HOSTEL_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_view = self._aprocess_view
+            if getattr(settings, 'HOSTEL_ASYNC_VIEWS', False):
+                profiling_logger.warning(
+                    'Request profiling is on, but the async browsing views (HOSTEL_ASYNC_VIEWS) are not profiled; '
+                    'set HOSTEL_ASYNC_VIEWS=0 to profile them.'
+                )
+        self.budget = profiling.Budget(settings.HOSTEL_PROFILING_MAX_PER_MINUTE)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trigger = self._trigger(request, view_func)
+        if trigger is None:
+            return None
+        return self._profile(request, view_func, view_args, view_kwargs, trigger)
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        # Decided on the event loop, so requests that aren't profiled never pay a thread hop
+        trigger = self._trigger(request, view_func)
+        if trigger is None:
+            return None
+        return await sync_to_async(self._profile, thread_sensitive=True)(
+            request, view_func, view_args, view_kwargs, trigger,
+        )
+
+    def _profile(self, request, view_func, view_args, view_kwargs, trigger):
+        """Call the view under cProfile and save the profile; None (the view runs as usual) if over budget"""
+        if not self.budget.acquire():
+            return None
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = view_func(request, *view_args, **view_kwargs)
+            finally:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+            self._save(request, profiler, elapsed, trigger)
+        finally:
+            self.budget.release()
+        return response
+
+    def _trigger(self, request, view_func):
+        if profiling.has_valid_token(request):
+            trigger = 'header'
+        elif random.random() < settings.HOSTEL_PROFILING_SAMPLE_RATE:
+            trigger = 'sample'
+        else:
+            return None
+        if iscoroutinefunction(view_func):
+            if trigger == 'header':
+                profiling_logger.warning('Not profiling %s %s: async views are not profiled', request.method, request.path)
+            return None
+        return trigger
+
+    def _save(self, request, profiler, elapsed, trigger):
+        view = request.resolver_match.view_name or '<unresolved>'
+        started = time.perf_counter()
+        try:
+            path = profiling.write_dump(profiler, view, elapsed)
+        except OSError:
+            # A full or read-only disk must not fail the request being profiled
+            profiling_logger.exception('Could not write the profile of %s %s', request.method, request.path)
+            return
+        metrics.registry.record_profile(view, trigger, time.perf_counter() - started)
+        profiling_logger.info('Profiled %s %s (view %s) in %.1fms: %s', request.method, request.path, view, elapsed * 1000, path)
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:20
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_occupancy(apps, schema_editor):
+    Room = apps.get_model('hostel', 'Room')
+    rooms = Room.objects.annotate(actual=Count('booked_by_users')).filter(actual__gt=0)
+    for room in rooms.only('id').iterator():
+        Room.objects.filter(pk=room.pk).update(occupancy=room.actual)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0002_room_booked_by_users_alter_room_booked_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='occupancy',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
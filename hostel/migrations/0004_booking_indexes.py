@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def keep_one_room_per_user(apps, schema_editor):
+    """Drop all but the earliest room membership of users booked into several rooms"""
+    Room = apps.get_model('hostel', 'Room')
+    RoomOccupants = Room.booked_by_users.through
+    duplicated = (
+        RoomOccupants.objects.values('user_id')
+        .annotate(rooms=Count('id'), first=Min('id'))
+        .filter(rooms__gt=1)
+    )
+    for row in duplicated:
+        extra = RoomOccupants.objects.filter(user_id=row['user_id']).exclude(id=row['first'])
+        room_ids = list(extra.values_list('room_id', flat=True))
+        extra.delete()
+        for room in Room.objects.filter(id__in=room_ids):
+            room.occupancy = RoomOccupants.objects.filter(room_id=room.id).count()
+            room.is_booked = room.occupancy >= room.capacity
+            if room.booked_by_id == row['user_id']:
+                first = RoomOccupants.objects.filter(room_id=room.id).order_by('id').first()
+                room.booked_by_id = first.user_id if first else None
+            room.save(update_fields=['occupancy', 'is_booked', 'booked_by'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0003_room_occupancy'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # A user occupies at most one room; also turns "which room is this user in" into a unique index probe
+        migrations.RunPython(keep_one_room_per_user, migrations.RunPython.noop),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX hostel_room_occupant_one_room_uniq ON hostel_room_booked_by_users (user_id)',
+            reverse_sql='DROP INDEX hostel_room_occupant_one_room_uniq',
+        ),
+        migrations.AddIndex(
+            model_name='block',
+            index=models.Index(fields=['gender', 'block_name'], name='hostel_block_gender_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['is_booked', 'floor', 'room_number'], name='hostel_room_booked_floor_idx'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.8 on 2026-10-17 18:42
+
+import django.db.models.deletion
+import django.utils.timezone
+import hostel.models
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+BATCH_SIZE = 5000
+
+
+def memberships_to_bookings(apps, schema_editor):
+    """Every current room member becomes an active booking for the current term, oldest first"""
+    Room = apps.get_model('hostel', 'Room')
+    Booking = apps.get_model('hostel', 'Booking')
+    RoomOccupants = Room.booked_by_users.through
+    term = hostel.models.current_term()
+    now = timezone.now()
+    memberships = RoomOccupants.objects.order_by('id').values_list('room_id', 'user_id')
+    bookings = [
+        Booking(room_id=room_id, user_id=user_id, term=term, status='active', created_at=now)
+        for room_id, user_id in memberships.iterator(chunk_size=BATCH_SIZE)
+    ]
+    Booking.objects.bulk_create(bookings, batch_size=BATCH_SIZE)
+
+
+def bookings_to_memberships(apps, schema_editor):
+    Room = apps.get_model('hostel', 'Room')
+    Booking = apps.get_model('hostel', 'Booking')
+    RoomOccupants = Room.booked_by_users.through
+    active = Booking.objects.filter(status='active').order_by('id').values_list('room_id', 'user_id')
+    RoomOccupants.objects.bulk_create(
+        [RoomOccupants(room_id=room_id, user_id=user_id) for room_id, user_id in active.iterator(chunk_size=BATCH_SIZE)],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0004_booking_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('term', models.CharField(db_index=True, max_length=20)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('cancelled', 'Cancelled'), ('ended', 'Ended')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('cancelled_at', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('room', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_bookings', to='hostel.room')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Booking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(default=hostel.models.current_term, max_length=20)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('cancelled', 'Cancelled'), ('ended', 'Ended')], default='active', max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cancelled_at', models.DateTimeField(blank=True, null=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='hostel.room')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status', 'active')), fields=['room'], name='hostel_booking_active_room_idx'), models.Index(fields=['term', 'status'], name='hostel_booking_term_status_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('user',), name='hostel_booking_one_active_per_user')],
+            },
+        ),
+        migrations.RunPython(memberships_to_bookings, bookings_to_memberships),
+        # Replaced by hostel_booking_one_active_per_user
+        migrations.RunSQL(
+            'DROP INDEX hostel_room_occupant_one_room_uniq',
+            reverse_sql='CREATE UNIQUE INDEX hostel_room_occupant_one_room_uniq ON hostel_room_booked_by_users (user_id)',
+        ),
+        migrations.RemoveField(
+            model_name='room',
+            name='booked_by_users',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0005_bookings'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(condition=models.Q(('is_booked', False)), fields=['-occupancy', 'id'], name='hostel_room_available_idx'),
+        ),
+    ]
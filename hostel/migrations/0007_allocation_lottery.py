@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:38
+
+import django.db.models.deletion
+import django.utils.timezone
+import hostel.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0006_room_available_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationRound',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('term', models.CharField(default=hostel.models.current_term, max_length=20)),
+                ('opens_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('closes_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('open', 'Open'), ('allocated', 'Allocated')], default='open', max_length=10)),
+                ('seed', models.BigIntegerField(blank=True, null=True)),
+                ('allocated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-opens_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.IntegerField(default=0)),
+                ('group_code', models.CharField(blank=True, max_length=30)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('assigned_room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='hostel.room')),
+                ('round', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='hostel.allocationround')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['round', '-priority', 'id'],
+                'unique_together': {('round', 'user')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RoomPreference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('block', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='hostel.block')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='hostel.room')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='preferences', to='hostel.roomrequest')),
+            ],
+            options={
+                'ordering': ['request', 'rank'],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('block__isnull', True), ('room__isnull', False)), models.Q(('block__isnull', False), ('room__isnull', True)), _connector='OR'), name='hostel_preference_room_or_block')],
+                'unique_together': {('request', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_occupancy(apps, schema_editor):
+    Block = apps.get_model('hostel', 'Block')
+    Floor = apps.get_model('hostel', 'Floor')
+    Room = apps.get_model('hostel', 'Room')
+    BlockOccupancy = apps.get_model('hostel', 'BlockOccupancy')
+    FloorOccupancy = apps.get_model('hostel', 'FloorOccupancy')
+    totals = {
+        row['floor_id']: row for row in
+        Room.objects.order_by().values('floor_id').annotate(rooms=Count('id'), beds=Sum('capacity'), occupied=Sum('occupancy'))
+    }
+    FloorOccupancy.objects.bulk_create([
+        FloorOccupancy(
+            floor_id=floor_id, block_id=block_id,
+            **{name: totals.get(floor_id, {}).get(name) or 0 for name in ('rooms', 'beds', 'occupied')},
+        )
+        for floor_id, block_id in Floor.objects.values_list('id', 'block_id').iterator()
+    ], batch_size=2000)
+    blocks = {
+        row['block_id']: row for row in
+        FloorOccupancy.objects.order_by().values('block_id').annotate(rooms=Sum('rooms'), beds=Sum('beds'), occupied=Sum('occupied'))
+    }
+    BlockOccupancy.objects.bulk_create([
+        BlockOccupancy(block_id=block_id, **{name: blocks.get(block_id, {}).get(name) or 0 for name in ('rooms', 'beds', 'occupied')})
+        for block_id in Block.objects.values_list('id', flat=True).iterator()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0007_allocation_lottery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlockOccupancy',
+            fields=[
+                ('block', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='occupancy', serialize=False, to='hostel.block')),
+                ('rooms', models.PositiveIntegerField(default=0)),
+                ('beds', models.PositiveIntegerField(default=0)),
+                ('occupied', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FloorOccupancy',
+            fields=[
+                ('floor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='occupancy', serialize=False, to='hostel.floor')),
+                ('rooms', models.PositiveIntegerField(default=0)),
+                ('beds', models.PositiveIntegerField(default=0)),
+                ('occupied', models.PositiveIntegerField(default=0)),
+                ('block', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='floor_occupancy', to='hostel.block')),
+            ],
+        ),
+        migrations.RunPython(count_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 19:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def journal_active_bookings(apps, schema_editor):
+    # Open the journal with the bookings that already exist, so replaying it matches the live tables
+    Booking = apps.get_model('hostel', 'Booking')
+    BookingEvent = apps.get_model('hostel', 'BookingEvent')
+    BookingEvent.objects.bulk_create([
+        BookingEvent(kind='booked', user_id=user_id, room_id=room_id, source='backfill', created_at=created_at)
+        for user_id, room_id, created_at in
+        Booking.objects.filter(status='active').order_by('id').values_list('user_id', 'room_id', 'created_at').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hostel', '0008_occupancy_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('booked', 'Booked'), ('switched', 'Switched'), ('cancelled', 'Cancelled'), ('ended', 'Ended')], max_length=10)),
+                ('source', models.CharField(max_length=10)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('from_room', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='hostel.room')),
+                ('room', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='booking_events', to='hostel.room')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='booking_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(journal_active_bookings, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,23 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import BooleanField, Case, Count, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+# Academic years (booking terms) run from this month to the same month next year
+TERM_START_MONTH = 7
+
+
+def current_term():
+    """The term new bookings belong to, e.g. '2026-27' (settings.HOSTEL_CURRENT_TERM overrides)"""
+    term = getattr(settings, 'HOSTEL_CURRENT_TERM', None)
+    if term:
+        return term
+    today = timezone.localdate()
+    start = today.year if today.month >= TERM_START_MONTH else today.year - 1
+    return f'{start}-{(start + 1) % 100:02d}'
 
 
 class UserProfile(models.Model):
@@ -30,6 +48,10 @@ class Block(models.Model):
 
     class Meta:
         ordering = ['block_name']
+        indexes = [
+            # Blocks for a gender, in display order
+            models.Index(fields=['gender', 'block_name'], name='hostel_block_gender_name_idx'),
+        ]
 
 
 class Floor(models.Model):
@@ -44,22 +66,74 @@ class Floor(models.Model):
         unique_together = ['block', 'floor_number']
 
 
+class RoomQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        """Annotate free spots and status in SQL (one query for many rooms)"""
+        return self.annotate(
+            free_spots=Greatest(F('capacity') - F('occupancy'), Value(0)),
+            occupancy_status=Case(
+                When(occupancy__gte=F('capacity'), then=Value('full')),
+                When(occupancy__gt=0, then=Value('partial')),
+                default=Value('empty'),
+            ),
+        )
+
+    def with_free_spots(self):
+        """Rooms that can take at least one more occupant"""
+        return self.filter(occupancy__lt=F('capacity'))
+
+    def occupied_by(self, user):
+        """Rooms in which user holds an active booking (at most one)"""
+        return self.filter(bookings__user=user, bookings__status=Booking.ACTIVE)
+
+    def drifted(self):
+        """Rooms whose stored occupancy disagrees with their active bookings, annotated with actual"""
+        return (
+            self.annotate(actual=Count('bookings', filter=Q(bookings__status=Booking.ACTIVE)))
+            .exclude(occupancy=F('actual'))
+        )
+
+    def sync_occupancy(self):
+        """Recount occupancy, is_booked and booked_by from the active bookings, in two UPDATEs"""
+        active = Booking.objects.active().filter(room_id=OuterRef('pk'))
+        actual = Subquery(
+            active.order_by().values('room_id').annotate(total=Count('*')).values('total'),
+            output_field=IntegerField(),
+        )
+        self.update(occupancy=Coalesce(actual, Value(0)))
+        return self.update(
+            is_booked=ExpressionWrapper(Q(occupancy__gte=F('capacity')), output_field=BooleanField()),
+            booked_by=Subquery(active.order_by('id').values('user_id')[:1]),
+        )
+
+    def adjust_occupancy(self, delta):
+        """Shift the stored occupancy by delta in a single UPDATE, keeping is_booked in step"""
+        # Both SET clauses see the pre-update row, so is_booked compares against the old value
+        return self.update(
+            occupancy=F('occupancy') + delta,
+            is_booked=ExpressionWrapper(Q(occupancy__gte=F('capacity') - delta), output_field=BooleanField()),
+        )
+
+
 class Room(models.Model):
     room_number = models.CharField(max_length=50)
     floor = models.ForeignKey(Floor, on_delete=models.CASCADE, related_name='rooms')
     capacity = models.IntegerField(default=1)
-    booked_by_users = models.ManyToManyField(User, related_name='booked_rooms', blank=True)
+    # Denormalized count of active bookings, only ever changed through set-based updates
+    occupancy = models.PositiveIntegerField(default=0, db_index=True, editable=False)
     
     # Keep for backward compatibility and quick queries
     is_booked = models.BooleanField(default=False)
     booked_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='primary_booked_rooms')
 
+    objects = RoomQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.floor.block.block_name} - {self.room_number}"
     
     def get_current_occupancy(self):
         """Get current number of occupants"""
-        return self.booked_by_users.count()
+        return self.occupancy
     
     def is_full(self):
         """Check if room is at full capacity"""
@@ -67,20 +141,254 @@ class Room(models.Model):
     
     def get_available_spots(self):
         """Get number of available spots"""
+        if hasattr(self, 'free_spots'):
+            return self.free_spots
         return max(0, self.capacity - self.get_current_occupancy())
+
+    def get_occupants(self):
+        """Students with an active booking here, earliest booking first"""
+        return [b.user for b in self.bookings.active().select_related('user').order_by('id')]
+
+    def get_occupancy_status(self):
+        """Get 'full', 'partial' or 'empty'"""
+        if hasattr(self, 'occupancy_status'):
+            return self.occupancy_status
+        occupancy = self.get_current_occupancy()
+        if occupancy >= self.capacity:
+            return 'full'
+        return 'partial' if occupancy > 0 else 'empty'
     
     def save(self, *args, **kwargs):
-        # Update is_booked and booked_by if room already exists
-        # Note: ManyToManyField changes require calling save() after add/remove
-        # The views handle this explicitly, but this helps for admin/other direct saves
+        # Capacity may have changed (e.g. in the admin); booked_by is owned by the booking service
         if self.pk:
-            # Note: ManyToMany count is accurate even before save() for in-memory changes
             self.is_booked = self.is_full()
-            # Keep booked_by as the first user for backward compatibility
-            if self.booked_by_users.exists() and not self.booked_by:
-                self.booked_by = self.booked_by_users.first()
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back a possibly stale occupancy; the counter is owned by adjust_occupancy()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('occupancy', 'booked_by')
+            ]
         super().save(*args, **kwargs)
 
     class Meta:
         ordering = ['floor', 'room_number']
+        # Also serves "rooms of a floor ordered by room_number"
         unique_together = ['floor', 'room_number']
+        indexes = [
+            # Admin changelist filtered on is_booked, in its default ordering
+            models.Index(fields=['is_booked', 'floor', 'room_number'], name='hostel_room_booked_floor_idx'),
+            # Rooms with a free spot, fullest first: auto-assignment reads the first few matches off it
+            models.Index(
+                fields=['-occupancy', 'id'], condition=Q(is_booked=False), name='hostel_room_available_idx',
+            ),
+        ]
+
+
+class BookingQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status=Booking.ACTIVE)
+
+
+class Booking(models.Model):
+    ACTIVE = 'active'
+    CANCELLED = 'cancelled'
+    ENDED = 'ended'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Active'),
+        (CANCELLED, 'Cancelled'),
+        (ENDED, 'Ended'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookings')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='bookings')
+    term = models.CharField(max_length=20, default=current_term)  # e.g., 2026-27
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    created_at = models.DateTimeField(default=timezone.now)
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+
+    objects = BookingQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user.username} - {self.room} ({self.term}, {self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # One room per student; also the index behind "which room is this student in"
+            models.UniqueConstraint(
+                fields=['user'], condition=Q(status='active'), name='hostel_booking_one_active_per_user',
+            ),
+        ]
+        indexes = [
+            # Current occupants of a room; history rows never enter this index
+            models.Index(fields=['room'], condition=Q(status='active'), name='hostel_booking_active_room_idx'),
+            # Archival sweeps by term
+            models.Index(fields=['term', 'status'], name='hostel_booking_term_status_idx'),
+        ]
+
+
+class ArchivedBooking(models.Model):
+    """A booking from a closed term, moved out of Booking by archive_bookings"""
+    id = models.BigIntegerField(primary_key=True)  # the original Booking id
+    # No database constraints: archived history must not block deleting users or rooms
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='archived_bookings',
+    )
+    room = models.ForeignKey(
+        Room, on_delete=models.DO_NOTHING, db_constraint=False, related_name='archived_bookings',
+    )
+    term = models.CharField(max_length=20, db_index=True)
+    status = models.CharField(max_length=10, choices=Booking.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user_id} - room {self.room_id} ({self.term}, {self.get_status_display()})"
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class AllocationRound(models.Model):
+    """
+    A lottery: students rank rooms or blocks while the round is open, then
+    services.lottery places everyone in one pass
+    """
+    OPEN = 'open'
+    ALLOCATED = 'allocated'
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (ALLOCATED, 'Allocated'),
+    ]
+
+    name = models.CharField(max_length=100)
+    term = models.CharField(max_length=20, default=current_term)
+    opens_at = models.DateTimeField(default=timezone.now)
+    closes_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    # Recorded when the lottery runs, so the same draw can be reproduced
+    seed = models.BigIntegerField(null=True, blank=True)
+    allocated_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.term})"
+
+    def is_accepting(self, now=None):
+        now = now or timezone.now()
+        return self.status == self.OPEN and self.opens_at <= now < self.closes_at
+
+    class Meta:
+        ordering = ['-opens_at']
+
+
+class RoomRequest(models.Model):
+    """A student's entry in an allocation round"""
+    round = models.ForeignKey(AllocationRound, on_delete=models.CASCADE, related_name='requests')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='room_requests')
+    # Higher goes first (e.g. final-year students); ties are broken by the draw
+    priority = models.IntegerField(default=0)
+    # Students entering the same code are placed in one room together
+    group_code = models.CharField(max_length=30, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    assigned_room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.round}"
+
+    class Meta:
+        ordering = ['round', '-priority', 'id']
+        unique_together = ['round', 'user']
+
+
+class RoomPreference(models.Model):
+    """One ranked choice of a RoomRequest: a specific room, or any room in a block"""
+    request = models.ForeignKey(RoomRequest, on_delete=models.CASCADE, related_name='preferences')
+    rank = models.PositiveSmallIntegerField()
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f"#{self.rank}: {self.room or self.block}"
+
+    class Meta:
+        ordering = ['request', 'rank']
+        unique_together = ['request', 'rank']
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(room__isnull=False, block__isnull=True) | Q(room__isnull=True, block__isnull=False),
+                name='hostel_preference_room_or_block',
+            ),
+        ]
+
+
+class BlockOccupancy(models.Model):
+    """
+    Beds and occupants of a block, kept in step with its rooms by
+    services.occupancy in the same transaction as every change
+    """
+    block = models.OneToOneField(Block, on_delete=models.CASCADE, primary_key=True, related_name='occupancy')
+    rooms = models.PositiveIntegerField(default=0)
+    beds = models.PositiveIntegerField(default=0)
+    occupied = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.block.block_name}: {self.occupied}/{self.beds}"
+
+    @property
+    def free_beds(self):
+        return max(0, self.beds - self.occupied)
+
+
+class FloorOccupancy(models.Model):
+    """Beds and occupants of a floor; see BlockOccupancy"""
+    floor = models.OneToOneField(Floor, on_delete=models.CASCADE, primary_key=True, related_name='occupancy')
+    # Copied from the floor so a block's floors are read without a join
+    block = models.ForeignKey(Block, on_delete=models.CASCADE, related_name='floor_occupancy')
+    rooms = models.PositiveIntegerField(default=0)
+    beds = models.PositiveIntegerField(default=0)
+    occupied = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.floor}: {self.occupied}/{self.beds}"
+
+    @property
+    def free_beds(self):
+        return max(0, self.beds - self.occupied)
+
+
+class BookingEvent(models.Model):
+    """
+    One entry of the append-only booking journal. Written by
+    services.journal in the same transaction as the change it records, and
+    never updated or deleted.
+    """
+    BOOKED = 'booked'
+    SWITCHED = 'switched'
+    CANCELLED = 'cancelled'
+    ENDED = 'ended'
+    KIND_CHOICES = [
+        (BOOKED, 'Booked'),
+        (SWITCHED, 'Switched'),
+        (CANCELLED, 'Cancelled'),
+        (ENDED, 'Ended'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # No database constraints: the journal outlives the users and rooms it mentions
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='booking_events')
+    room = models.ForeignKey(Room, on_delete=models.DO_NOTHING, db_constraint=False, related_name='booking_events')
+    # The room a switch moved the student out of
+    from_room = models.ForeignKey(
+        Room, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, blank=True, related_name='+',
+    )
+    # What made the change: student, group, lottery, import, admin, archive or sample
+    source = models.CharField(max_length=10)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind}: user {self.user_id} room {self.room_id}"
+
+    class Meta:
+        # Journal order; "events after N" is a range scan of the primary key
+        ordering = ['id']
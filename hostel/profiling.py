@@ -0,0 +1,161 @@
+"""
+Opt-in request profiling with cProfile, for finding out afterwards why a
+view was slow.
+
+ProfilingMiddleware profiles the view of a random HOSTEL_PROFILING_SAMPLE_RATE
+of the requests, plus of any request carrying a valid signed X-Hostel-Profile
+header (profile_report --header mints one), and writes each profile to
+HOSTEL_PROFILING_DIR as <time>_<view>_<ms>ms_<pid>.prof. profile_report
+aggregates the dumps into the top functions per view.
+
+The cost is bounded per process: one request is profiled at a time, at most
+HOSTEL_PROFILING_MAX_PER_MINUTE of them a minute, and only the newest
+HOSTEL_PROFILING_MAX_DUMPS files are kept. Requests that are not profiled pay
+one random() call. benchmark_profiling measures the overhead.
+"""
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+
+HEADER = 'X-Hostel-Profile'
+SIGNING_SALT = 'hostel.profiling'
+DUMP_SUFFIX = '.prof'
+_DUMP_NAME = re.compile(r'^(?P<stamp>\d{8}T\d{6}\.\d{6})_(?P<view>.+)_(?P<ms>\d+)ms_(?P<pid>\d+)\.prof$')
+
+# Sort keys for top_functions(): column of a pstats entry (cc, nc, tt, ct, callers)
+SORT_KEYS = {'cumulative': 3, 'tottime': 2, 'calls': 1}
+
+
+def sign_token():
+    """A value for the X-Hostel-Profile header, valid for HOSTEL_PROFILING_TOKEN_MAX_AGE seconds"""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def has_valid_token(request):
+    value = request.headers.get(HEADER)
+    if not value:
+        return False
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(value, max_age=settings.HOSTEL_PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class Budget:
+    """At most one profile in flight and per_minute started in any 60 seconds"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._started = deque()
+
+    def acquire(self, now=None):
+        now = time.monotonic() if now is None else now
+        if not self._busy.acquire(blocking=False):
+            return False
+        with self._lock:
+            while self._started and now - self._started[0] >= 60:
+                self._started.popleft()
+            if len(self._started) >= self.per_minute:
+                self._busy.release()
+                return False
+            self._started.append(now)
+        return True
+
+    def release(self):
+        self._busy.release()
+
+
+def dump_name(view, seconds, when=None, pid=None):
+    when = time.time() if when is None else when
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(when)) + f'.{int(when % 1 * 1e6):06d}'
+    safe_view = re.sub(r'[^\w.-]+', '-', view.replace(':', '.')).strip('-') or 'unresolved'
+    return f'{stamp}_{safe_view}_{round(seconds * 1000)}ms_{os.getpid() if pid is None else pid}{DUMP_SUFFIX}'
+
+
+def parse_dump_name(name):
+    """(view, milliseconds) of a dump file name, or None for anything else"""
+    match = _DUMP_NAME.match(name)
+    if match is None:
+        return None
+    return match['view'], int(match['ms'])
+
+
+def _dumps(directory):
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+    return sorted(entry.name for entry in entries if entry.is_file() and parse_dump_name(entry.name))
+
+
+def write_dump(profiler, view, seconds, directory=None, keep=None):
+    """
+    Save profiler's stats under directory and delete the oldest dumps beyond
+    keep (at least 1, the new one). The file appears complete or not at all.
+    Returns its path.
+    """
+    directory = Path(directory or settings.HOSTEL_PROFILING_DIR)
+    keep = settings.HOSTEL_PROFILING_MAX_DUMPS if keep is None else keep
+    keep = max(keep, 1)  # never the dump just written
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / dump_name(view, seconds)
+    fd, partial = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        profiler.dump_stats(partial)
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    # Names start with the time, so sorted names are oldest first
+    names = _dumps(directory)
+    for name in names[:max(len(names) - keep, 0)]:
+        try:
+            os.unlink(directory / name)
+        except FileNotFoundError:
+            pass  # another worker rotated it first
+    return path
+
+
+def dumps_by_view(directory=None, view=None):
+    """{view: [(path, milliseconds), ...]} for the dumps in directory, oldest first"""
+    directory = Path(directory or settings.HOSTEL_PROFILING_DIR)
+    found = defaultdict(list)
+    for name in _dumps(directory):
+        dump_view, ms = parse_dump_name(name)
+        if view is None or dump_view == view:
+            found[dump_view].append((directory / name, ms))
+    return dict(found)
+
+
+def top_functions(paths, limit=20, sort='cumulative'):
+    """
+    Merge the profiles in paths and return their top limit functions as
+    dicts: function, total calls, and tottime and cumtime in ms averaged per
+    profiled request.
+    """
+    stats = pstats.Stats(*map(str, paths))
+    column = SORT_KEYS[sort]
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:limit]
+    count = len(paths)
+    return [
+        {
+            'function': pstats.func_std_string(func),
+            'calls': total_calls,
+            'tottime_ms': tottime * 1000 / count,
+            'cumtime_ms': cumtime * 1000 / count,
+        }
+        for func, (_, total_calls, tottime, cumtime, _) in rows
+    ]
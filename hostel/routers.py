@@ -0,0 +1,147 @@
+"""
+Database routing for the read-only pages.
+
+Views wrapped in read_only_view send their reads to
+settings.HOSTEL_READ_DATABASE, a second connection alias, so they never queue
+behind the booking transactions on 'default'. That alias is either another
+query-only connection to the same SQLite file, or a replica. Everything else,
+and every write, uses 'default'. With no read alias configured the decorator
+does nothing.
+
+A replica may lag behind the primary, so a user who has just booked or
+cancelled is pinned to the primary for HOSTEL_PRIMARY_STICKY_SECONDS: the view
+calls pin_to_primary(request) and PrimaryPinMiddleware remembers it in a
+signed cookie. Their dashboard then never shows the state from before their
+own change.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+
+
+PIN_COOKIE = 'hostel_primary'
+PIN_SALT = 'hostel.routers.primary_pin'
+
+_read_alias = contextvars.ContextVar('hostel_read_alias', default=None)
+_pinned = contextvars.ContextVar('hostel_primary_pinned', default=False)
+
+
+def read_database():
+    return getattr(settings, 'HOSTEL_READ_DATABASE', None)
+
+
+@contextmanager
+def reading_from(alias):
+    """Route reads made inside the block to alias (None means the default routing)"""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def primary():
+    """Read from 'default' inside the block, even within a read_only_view"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def sticky_seconds():
+    return getattr(settings, 'HOSTEL_PRIMARY_STICKY_SECONDS', 15)
+
+
+def pin_to_primary(request):
+    """Keep request's user on the primary for a while: they just changed something"""
+    request._hostel_pin_primary = True
+
+
+class PrimaryPinMiddleware:
+    """
+    Route the reads of users pinned by pin_to_primary() to 'default' until the
+    pin expires. The pin is a signed cookie, so checking it costs no query.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _pinned.set(self._is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._remember_pin(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned.set(self._is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self._remember_pin(request, response)
+
+    def _is_pinned(self, request):
+        try:
+            request.get_signed_cookie(PIN_COOKIE, salt=PIN_SALT, max_age=sticky_seconds())
+        except (KeyError, signing.BadSignature):
+            return False
+        return True
+
+    def _remember_pin(self, request, response):
+        if getattr(request, '_hostel_pin_primary', False):
+            response.set_signed_cookie(
+                PIN_COOKIE, '1', salt=PIN_SALT, max_age=sticky_seconds(),
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+        return response
+
+
+def read_only_view(view):
+    """Serve view's reads from the read alias; works for sync and async views"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with reading_from(read_database()):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with reading_from(read_database()):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReadWriteRouter:
+    """Reads inside read_only_view go to the read alias unless pinned; all writes and migrations to 'default'"""
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get():
+            return None
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data (or a slightly older copy of it)
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,96 @@
+"""
+Auto-assignment: pick a room for a student instead of making them browse.
+
+Candidates come from hostel_room_available_idx, which holds only rooms with a
+free spot, fullest first. The query walks that index and stops after a
+handful of matches, so its cost does not grow with the size of the hostel.
+Filling partly occupied rooms first keeps empty rooms free for students who
+want a room to themselves or to move in with friends. The choice among equally
+full candidates is random, so students assigned at the same moment don't all
+race for one room. The booking itself goes through booking.book_room, the
+same transaction as booking by hand.
+"""
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db.models import F
+
+from ..models import Booking, Floor, Room
+from . import booking
+from .booking import BookingResult, BookingStatus
+
+
+SINGLE = 'single'
+SHARED = 'shared'
+
+# Rooms fetched per query, and queries tried before giving up when others keep filling them first
+CANDIDATES = 8
+ROUNDS = 3
+
+
+@dataclass(frozen=True)
+class Preferences:
+    block_id: Optional[int] = None
+    min_floor: Optional[int] = None
+    max_floor: Optional[int] = None
+    room_type: Optional[str] = None  # SINGLE, SHARED or None
+    roommate: Optional[str] = None  # username of a student to move in with
+
+
+def available_rooms(gender, preferences=Preferences()):
+    """Rooms with a free spot in gender's blocks matching preferences, fullest first"""
+    floors = Floor.objects.filter(block__gender=gender)
+    if preferences.block_id is not None:
+        floors = floors.filter(block_id=preferences.block_id)
+    if preferences.min_floor is not None:
+        floors = floors.filter(floor_number__gte=preferences.min_floor)
+    if preferences.max_floor is not None:
+        floors = floors.filter(floor_number__lte=preferences.max_floor)
+    rooms = Room.objects.filter(is_booked=False, occupancy__lt=F('capacity'))
+    if preferences.room_type == SINGLE:
+        rooms = rooms.filter(capacity=1)
+    elif preferences.room_type == SHARED:
+        rooms = rooms.filter(capacity__gt=1)
+    # floor_id + 0 can't use an index, so SQLite walks hostel_room_available_idx in
+    # order and stops at the first matches instead of sorting every room of the floors
+    return (
+        rooms.alias(floor_ref=F('floor_id') + 0).filter(floor_ref__in=floors.values('id'))
+        .order_by('-occupancy', 'id')
+    )
+
+
+def _candidates(gender, preferences, tried):
+    if preferences.roommate:
+        # Only the roommate's room will do; it still has to suit the student
+        rooms = available_rooms(gender).filter(
+            bookings__user__username=preferences.roommate, bookings__status=Booking.ACTIVE,
+        )
+        return list(rooms.exclude(pk__in=tried)[:1])
+    rooms = list(available_rooms(gender, preferences).exclude(pk__in=tried)[:CANDIDATES])
+    # Spread concurrent assignments over the equally full candidates
+    random.shuffle(rooms)
+    rooms.sort(key=lambda room: -room.occupancy)
+    return rooms
+
+
+def assign_room(user, gender, preferences=Preferences()):
+    """
+    Book user into the best free room matching preferences. Returns the
+    BookingResult of the booking, or NO_ROOM (with room None) if nothing fits.
+    Students who already have a room get HAS_OTHER_BOOKING: assignment never
+    switches rooms.
+    """
+    if Booking.objects.active().filter(user=user).exists():
+        return BookingResult(BookingStatus.HAS_OTHER_BOOKING, None)
+    tried = set()
+    for _ in range(ROUNDS):
+        candidates = _candidates(gender, preferences, tried)
+        if not candidates:
+            break
+        for room in candidates:
+            result = booking.book_room(user, room)
+            if result.status != BookingStatus.ROOM_FULL:
+                return result
+            tried.add(room.pk)
+    return BookingResult(BookingStatus.NO_ROOM, None)
@@ -0,0 +1,281 @@
+"""
+Booking engine: every change to who lives in which room goes through here.
+
+Each operation runs as one write_transaction(), which on SQLite takes the
+write lock when it begins. The capacity check is a conditional UPDATE on
+Room.occupancy, issued first.
+Bookings are never deleted here: cancelling or switching away marks the row
+cancelled, and archive_bookings later moves closed terms out of the table.
+Every change is also written to the booking journal (services.journal)
+before its transaction commits.
+"""
+import enum
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+from .. import availability
+from ..models import Booking, BookingEvent, Room, UserProfile
+from . import journal, occupancy
+
+
+# SQLite reports writer contention as OperationalError("database is locked");
+# the whole transaction has rolled back by then, so it is safe to run again.
+LOCK_RETRIES = 20
+LOCK_BACKOFF = 0.01
+
+
+class BookingStatus(enum.Enum):
+    BOOKED = 'booked'
+    SWITCHED = 'switched'
+    CANCELLED = 'cancelled'
+    ROOM_FULL = 'room_full'
+    ALREADY_IN_ROOM = 'already_in_room'
+    HAS_OTHER_BOOKING = 'has_other_booking'
+    NOT_IN_ROOM = 'not_in_room'
+    NO_ROOM = 'no_room'
+    WRONG_GENDER = 'wrong_gender'
+
+
+@dataclass(frozen=True)
+class BookingResult:
+    status: BookingStatus
+    room: Optional[Room]
+    previous_room_id: Optional[int] = None
+
+    @property
+    def ok(self):
+        return self.status in (BookingStatus.BOOKED, BookingStatus.SWITCHED, BookingStatus.CANCELLED)
+
+
+@dataclass(frozen=True)
+class GroupBookingResult:
+    status: BookingStatus
+    room: Room
+    # The members the status is about: those booked, or those who blocked the booking
+    usernames: tuple = ()
+
+    @property
+    def ok(self):
+        return self.status in (BookingStatus.BOOKED, BookingStatus.SWITCHED)
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    transaction.atomic() for a transaction that will write. On SQLite with
+    HOSTEL_SQLITE_IMMEDIATE_WRITES the outermost block begins with BEGIN
+    IMMEDIATE, taking the write lock (and waiting out the busy timeout for it)
+    up front, instead of reading first and failing to upgrade to a writer.
+    Other transactions stay deferred, so read-only ones never queue behind
+    bookings.
+    """
+    connection = transaction.get_connection(using)
+    if (
+        connection.vendor != 'sqlite' or connection.in_atomic_block
+        or not getattr(settings, 'HOSTEL_SQLITE_IMMEDIATE_WRITES', False)
+    ):
+        with transaction.atomic(using=using):
+            yield
+        return
+    # transaction_mode is read when the block begins; connecting would reset it
+    connection.ensure_connection()
+    previous, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
+
+
+def _retry_on_lock(operation):
+    for attempt in range(LOCK_RETRIES):
+        try:
+            return operation()
+        except OperationalError as exc:
+            if 'locked' not in str(exc) or attempt == LOCK_RETRIES - 1:
+                raise
+            time.sleep(LOCK_BACKOFF * (attempt + 1))
+
+
+def _release(user, room_id):
+    """Cancel user's active booking in room_id; must run inside a transaction"""
+    released = (
+        Booking.objects.active().filter(room_id=room_id, user_id=user.pk)
+        .update(status=Booking.CANCELLED, cancelled_at=timezone.now())
+    )
+    if not released:
+        return False
+    Room.objects.filter(pk=room_id).adjust_occupancy(-released)
+    occupancy.shift_room(room_id, -released)
+    # Hand the primary booking over to the longest-standing remaining occupant
+    next_occupant = Booking.objects.active().filter(room_id=OuterRef('pk')).order_by('id').values('user_id')[:1]
+    Room.objects.filter(pk=room_id, booked_by=user).update(booked_by=Subquery(next_occupant))
+    return True
+
+
+def book_room(user, room, switch=False):
+    """
+    Book user into room. With switch=True an existing booking elsewhere is
+    released in the same transaction, so the user is never in two rooms or none.
+    """
+    def attempt():
+        with write_transaction(), journal.batch():
+            claimed = Room.objects.filter(pk=room.pk, occupancy__lt=F('capacity')).adjust_occupancy(1)
+            current = list(Booking.objects.active().filter(user_id=user.pk).values_list('room_id', flat=True))
+
+            if room.pk in current:
+                transaction.set_rollback(True)
+                return BookingResult(BookingStatus.ALREADY_IN_ROOM, room)
+            if not claimed:
+                return BookingResult(BookingStatus.ROOM_FULL, room)
+            occupancy.shift_room(room.pk, 1)
+            if current and not switch:
+                transaction.set_rollback(True)
+                return BookingResult(BookingStatus.HAS_OTHER_BOOKING, room, previous_room_id=current[0])
+
+            # Release first: the one-active-booking-per-user constraint would reject the new row otherwise
+            for other_room_id in current:
+                _release(user, other_room_id)
+            try:
+                with transaction.atomic():
+                    Booking.objects.create(room_id=room.pk, user_id=user.pk)
+            except IntegrityError:
+                # A concurrent request booked this user elsewhere after we looked
+                transaction.set_rollback(True)
+                return BookingResult(BookingStatus.HAS_OTHER_BOOKING, room)
+            if current:
+                journal.record(BookingEvent.SWITCHED, user.pk, room.pk, from_room_id=current[0])
+            else:
+                journal.record(BookingEvent.BOOKED, user.pk, room.pk)
+            availability.bump_rooms_on_commit([room.pk, *current])
+            availability.bump_users_on_commit([user.pk])
+            Room.objects.filter(pk=room.pk, booked_by__isnull=True).update(booked_by=user)
+
+            room.refresh_from_db(fields=['occupancy', 'is_booked', 'booked_by'])
+            if current:
+                return BookingResult(BookingStatus.SWITCHED, room, previous_room_id=current[0])
+            return BookingResult(BookingStatus.BOOKED, room)
+
+    return _retry_on_lock(attempt)
+
+
+def _place_group(users, room, switch):
+    """book_group without the lock retry; inside a transaction it runs as a savepoint"""
+    members = {user.pk: user.username for user in users}
+    with write_transaction(), journal.batch():
+        genders = dict(UserProfile.objects.filter(user_id__in=members).values_list('user_id', 'gender'))
+        strangers = [name for user_id, name in members.items() if genders.get(user_id) != room.floor.block.gender]
+        if strangers:
+            return GroupBookingResult(BookingStatus.WRONG_GENDER, room, tuple(strangers))
+
+        current = dict(Booking.objects.active().filter(user_id__in=members).values_list('user_id', 'room_id'))
+        newcomers = [user_id for user_id in members if current.get(user_id) != room.pk]
+        movers = [user_id for user_id in newcomers if user_id in current]
+        if not newcomers:
+            return GroupBookingResult(BookingStatus.ALREADY_IN_ROOM, room, tuple(members.values()))
+        if movers and not switch:
+            return GroupBookingResult(BookingStatus.HAS_OTHER_BOOKING, room, tuple(members[m] for m in movers))
+
+        # One conditional UPDATE claims every spot the group needs, or none
+        claimed = (
+            Room.objects.filter(pk=room.pk, occupancy__lte=F('capacity') - len(newcomers))
+            .adjust_occupancy(len(newcomers))
+        )
+        if not claimed:
+            return GroupBookingResult(BookingStatus.ROOM_FULL, room)
+        occupancy.shift_room(room.pk, len(newcomers))
+
+        previous_rooms = {current[user_id] for user_id in movers}
+        if movers:
+            Booking.objects.active().filter(user_id__in=movers).update(
+                status=Booking.CANCELLED, cancelled_at=timezone.now(),
+            )
+            Room.objects.filter(pk__in=previous_rooms).sync_occupancy()
+            occupancy.refresh_rooms(previous_rooms)
+        try:
+            with transaction.atomic():
+                Booking.objects.bulk_create([Booking(room_id=room.pk, user_id=user_id) for user_id in newcomers])
+        except IntegrityError:
+            # A member booked a room elsewhere after we looked
+            transaction.set_rollback(True)
+            return GroupBookingResult(BookingStatus.HAS_OTHER_BOOKING, room)
+        Room.objects.filter(pk=room.pk, booked_by__isnull=True).update(booked_by_id=newcomers[0])
+        for user_id in newcomers:
+            if user_id in current:
+                journal.record(BookingEvent.SWITCHED, user_id, room.pk, from_room_id=current[user_id], source='group')
+            else:
+                journal.record(BookingEvent.BOOKED, user_id, room.pk, source='group')
+        availability.bump_rooms_on_commit([room.pk, *previous_rooms])
+        availability.bump_users_on_commit(newcomers)
+
+    room.refresh_from_db(fields=['occupancy', 'is_booked', 'booked_by'])
+    status = BookingStatus.SWITCHED if movers else BookingStatus.BOOKED
+    return GroupBookingResult(status, room, tuple(members[user_id] for user_id in newcomers))
+
+
+def book_group(users, room, switch=False):
+    """
+    Book users into room together: all of them get a spot or none does. Every
+    member must be of the gender of the room's block (room.floor.block is
+    read). Members booked elsewhere are moved with switch=True; otherwise the
+    group gets HAS_OTHER_BOOKING naming them. Members already in room keep
+    their spot.
+    """
+    return _retry_on_lock(lambda: _place_group(users, room, switch))
+
+
+def book_groups(placements, switch=False):
+    """
+    book_group for many (users, room) pairs in one transaction, each group in
+    its own savepoint so a group that does not fit leaves the others placed.
+    Returns a GroupBookingResult per placement, in order.
+    """
+    def attempt():
+        # One journal batch: the events of every placed group go in together
+        with write_transaction(), journal.batch():
+            return [_place_group(users, room, switch) for users, room in placements]
+
+    return _retry_on_lock(attempt)
+
+
+def switch_room(user, room):
+    """Move user into room, releasing their current room atomically"""
+    return book_room(user, room, switch=True)
+
+
+def cancel_booking(user, room):
+    """Cancel user's booking in room"""
+    def attempt():
+        with write_transaction(), journal.batch():
+            if not _release(user, room.pk):
+                return BookingResult(BookingStatus.NOT_IN_ROOM, room)
+            journal.record(BookingEvent.CANCELLED, user.pk, room.pk)
+            availability.bump_rooms_on_commit([room.pk])
+            availability.bump_users_on_commit([user.pk])
+            room.refresh_from_db(fields=['occupancy', 'is_booked', 'booked_by'])
+            return BookingResult(BookingStatus.CANCELLED, room)
+
+    return _retry_on_lock(attempt)
+
+
+def resync_rooms(room_ids, user_ids=()):
+    """
+    Recount occupancy, is_booked and booked_by of room_ids from their active
+    bookings, and invalidate pages of the users whose bookings changed. For
+    paths that write Booking rows outside this module (the admin,
+    archive_bookings, repairs); must run inside a transaction.
+    """
+    room_ids = set(room_ids)
+    if room_ids:
+        Room.objects.filter(pk__in=room_ids).sync_occupancy()
+        occupancy.refresh_rooms(room_ids)
+        availability.bump_rooms_on_commit(room_ids)
+    availability.bump_users_on_commit(user_ids)
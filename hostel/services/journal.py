@@ -0,0 +1,182 @@
+"""
+Booking journal: an append-only record of every booking, switch, cancellation
+and end of stay, as BookingEvent rows.
+
+Events are collected in an in-process buffer opened by batch() and inserted
+in bulk, BATCH_SIZE rows per INSERT, when the block ends. Open the batch
+inside the transaction making the change, so the events commit or roll back
+with it: a committed change always has its events, and a rolled back one
+never does.
+
+    with transaction.atomic(), journal.batch():
+        ...
+        journal.record(BookingEvent.BOOKED, user_id, room_id, source='student')
+
+events_since() lets caches and live views tail the journal by event id, and
+replay() rebuilds who is in which room from the events alone, for checking
+against the live tables (replay_journal).
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from ..models import Booking, BookingEvent, Room
+
+
+BATCH_SIZE = 1000
+MAX_PAGE_SIZE = 1000
+
+_local = threading.local()
+
+
+def _buffers():
+    if not hasattr(_local, 'buffers'):
+        _local.buffers = []
+    return _local.buffers
+
+
+def _write(events):
+    if events:
+        BookingEvent.objects.bulk_create(events, batch_size=BATCH_SIZE)
+
+
+@contextmanager
+def batch():
+    """
+    Buffer the events recorded inside the block and insert them when it ends.
+    Batches nest: an inner batch hands its events to the outer one, unless
+    its savepoint was marked for rollback, in which case they are dropped.
+    """
+    buffers = _buffers()
+    buffers.append([])
+    try:
+        yield
+    except BaseException:
+        buffers.pop()
+        raise
+    events = buffers.pop()
+    if connection.in_atomic_block and transaction.get_rollback():
+        return
+    if buffers:
+        buffers[-1].extend(events)
+    else:
+        _write(events)
+
+
+def record(kind, user_id, room_id, from_room_id=None, source='student'):
+    """Journal one event; outside batch() it is inserted straight away"""
+    event = BookingEvent(kind=kind, user_id=user_id, room_id=room_id, from_room_id=from_room_id, source=source)
+    buffers = _buffers()
+    if not buffers:
+        _write([event])
+        return
+    buffer = buffers[-1]
+    buffer.append(event)
+    if len(buffer) >= BATCH_SIZE:
+        # Still inside the caller's transaction, so an early write rolls back with it
+        _write(buffer)
+        buffer.clear()
+
+
+def record_many(kind, pairs, source):
+    """Journal kind for every (user id, room id) pair"""
+    for user_id, room_id in pairs:
+        record(kind, user_id, room_id, source=source)
+
+
+def record_changes(before, after, source):
+    """
+    Journal the difference between two sets of active (user id, room id)
+    pairs, for paths that edit Booking rows directly (the admin)
+    """
+    with batch():
+        record_many(BookingEvent.CANCELLED, sorted(set(before) - set(after)), source)
+        record_many(BookingEvent.BOOKED, sorted(set(after) - set(before)), source)
+
+
+def events_since(after=0, limit=100, room_ids=None):
+    """
+    Events with an id above after, oldest first, at most limit of them.
+    Consumers keep the last id they saw and ask again from there.
+    """
+    events = BookingEvent.objects.filter(pk__gt=after)
+    if room_ids is not None:
+        events = events.filter(room_id__in=room_ids)
+    return list(events.order_by('pk')[:min(limit, MAX_PAGE_SIZE)])
+
+
+def last_event_id():
+    return BookingEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def replay(until=None):
+    """
+    Rebuild state from the journal alone: returns ({room id: occupants},
+    {user id: room id}) as of event until (default: the latest).
+    """
+    occupants = Counter()
+    rooms = {}
+    events = BookingEvent.objects.order_by('pk')
+    if until is not None:
+        events = events.filter(pk__lte=until)
+    for kind, user_id, room_id, from_room_id in events.values_list(
+        'kind', 'user_id', 'room_id', 'from_room_id',
+    ).iterator(chunk_size=5000):
+        if kind in (BookingEvent.BOOKED, BookingEvent.SWITCHED):
+            if from_room_id is not None:
+                occupants[from_room_id] -= 1
+            occupants[room_id] += 1
+            rooms[user_id] = room_id
+        else:
+            occupants[room_id] -= 1
+            rooms.pop(user_id, None)
+    return {room_id: total for room_id, total in occupants.items() if total}, rooms
+
+
+@contextmanager
+def _read_snapshot():
+    """
+    A transaction for reading only. On SQLite it begins DEFERRED whatever the
+    connection's transaction_mode: under WAL that is already a consistent
+    snapshot, and it never takes the write lock bookings wait for.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    # transaction_mode is read when the block begins; connecting would reset it
+    connection.ensure_connection()
+    previous, connection.transaction_mode = connection.transaction_mode, 'DEFERRED'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
+
+
+def check():
+    """
+    Replay the journal and compare it with the live tables, both read from
+    one snapshot. Returns (rooms whose occupancy differs as {room id:
+    (journal, live)}, students whose room differs as {user id: (journal,
+    live)}).
+    """
+    with _read_snapshot():
+        occupants, rooms = replay()
+        live_occupants = dict(Room.objects.filter(occupancy__gt=0).values_list('id', 'occupancy'))
+        live_rooms = dict(Booking.objects.active().values_list('user_id', 'room_id'))
+    room_drift = {
+        room_id: (occupants.get(room_id, 0), live_occupants.get(room_id, 0))
+        for room_id in occupants.keys() | live_occupants.keys()
+        if occupants.get(room_id, 0) != live_occupants.get(room_id, 0)
+    }
+    user_drift = {
+        user_id: (rooms.get(user_id), live_rooms.get(user_id))
+        for user_id in rooms.keys() | live_rooms.keys()
+        if rooms.get(user_id) != live_rooms.get(user_id)
+    }
+    return room_drift, user_drift
@@ -0,0 +1,251 @@
+"""
+Lottery allocation: place every student of an AllocationRound in one pass.
+
+Instead of first-click-wins, students rank rooms or blocks while the round is
+open, and run_lottery resolves them all at once. Students sharing a group code
+form a roommate group and are placed in one room together. Groups go in
+priority order, ties broken by a draw from random.Random(seed), so a seed
+always reproduces the same allocation. Each group gets its first choice that
+still has room for all of them in a block of their gender: the named room, or
+the tightest-fitting room of the named block. Filling partly occupied rooms
+first keeps empty rooms for bigger groups. Groups whose choices are all full
+go to the tightest fit anywhere for their gender, unless place_anywhere is
+off.
+
+Rooms, requests and preferences are read once; the placing happens in
+memory; the result is written in one transaction with bulk inserts, so
+nobody is ever half placed.
+"""
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from ..models import AllocationRound, Booking, BookingEvent, Room, RoomPreference, RoomRequest
+from . import booking, journal
+
+
+ANYWHERE = 'anywhere'
+WRITE_BATCH = 2000
+
+
+class LotteryError(Exception):
+    pass
+
+
+@dataclass
+class LotteryResult:
+    seed: int
+    placed: int = 0
+    unplaced: int = 0
+    already_housed: int = 0
+    # Students by the rank of the choice they got (ANYWHERE for the fallback)
+    by_choice: Counter = field(default_factory=Counter)
+    seconds: float = 0.0
+
+
+class _Rooms:
+    """
+    Free spots per room, with a best-fit lookup per block and per gender.
+    Each pool maps a number of free spots to a stack of rooms; a room whose
+    free spots change is pushed onto its new stack and its old entry is
+    skipped when reached.
+    """
+
+    def __init__(self, rows):
+        self.free = {}
+        self.block = {}
+        self.gender = {}
+        self.block_gender = {}
+        self.pools = defaultdict(lambda: defaultdict(list))
+        self.largest = defaultdict(int)
+        # Highest id first onto each stack, so equal fits are taken lowest id first
+        for room_id, block_id, gender, free in sorted(rows, reverse=True):
+            self.free[room_id], self.block[room_id], self.gender[room_id] = free, block_id, gender
+            self.block_gender[block_id] = gender
+            self.largest[gender] = max(self.largest[gender], free)
+            if free > 0:
+                for pool in (('block', block_id), ('gender', gender)):
+                    self.pools[pool][free].append(room_id)
+
+    def fits(self, room_id, size, gender):
+        return self.gender.get(room_id) == gender and self.free[room_id] >= size
+
+    def best_fit(self, pool, size, gender):
+        stacks = self.pools.get(pool)
+        if not stacks:
+            return None
+        for free in range(size, self.largest[gender] + 1):
+            stack = stacks.get(free)
+            while stack:
+                room_id = stack.pop()
+                if self.free[room_id] == free:
+                    return room_id
+        return None
+
+    def take(self, room_id, size):
+        self.free[room_id] -= size
+        left = self.free[room_id]
+        if left > 0:
+            for pool in (('block', self.block[room_id]), ('gender', self.gender[room_id])):
+                self.pools[pool][left].append(room_id)
+
+
+def current_round(now=None):
+    """The round students see: the latest one that has opened, or None"""
+    now = now or timezone.now()
+    return AllocationRound.objects.filter(opens_at__lte=now).order_by('-opens_at').first()
+
+
+def enter_round(allocation_round, user, choices, group_code=''):
+    """
+    Record user's entry in allocation_round, replacing any earlier one.
+    choices are (block, room) pairs in rank order, one of the two None.
+    """
+    with transaction.atomic():
+        request, _ = RoomRequest.objects.update_or_create(
+            round=allocation_round, user=user, defaults={'group_code': group_code},
+        )
+        request.preferences.all().delete()
+        RoomPreference.objects.bulk_create([
+            RoomPreference(request=request, rank=rank, block=block, room=room)
+            for rank, (block, room) in enumerate(choices, start=1)
+        ])
+    return request
+
+
+def _groups(requests, housed):
+    """
+    Split requests into placement units: a roommate group per (group code,
+    gender), or a student on their own. Returns the units in request order
+    and the number of students skipped because they already have a room.
+    """
+    units = {}
+    skipped = 0
+    for request_id, user_id, priority, group_code, gender in requests:
+        if user_id in housed:
+            skipped += 1
+            continue
+        key = (group_code, gender) if group_code else request_id
+        units.setdefault(key, []).append((request_id, user_id, priority, gender))
+    return list(units.values()), skipped
+
+
+def _place(units, rooms, preferences, rng, place_anywhere, result):
+    """Yield (request id, user id, room id) for every placed student"""
+    draws = [rng.random() for _ in units]
+    ordered = sorted(
+        range(len(units)), key=lambda i: (-max(member[2] for member in units[i]), draws[i]),
+    )
+    for index in ordered:
+        members = units[index]
+        gender = members[0][3]
+        # A group too big for any room goes in one by one
+        groups = [members] if len(members) <= rooms.largest[gender] else [[member] for member in members]
+        for group in groups:
+            size = len(group)
+            # The group's choices are those of its highest priority member
+            lead = min(group, key=lambda member: (-member[2], member[0]))[0]
+            room_id, choice = None, None
+            for rank, pref_room, pref_block in preferences.get(lead, ()):
+                if pref_room is not None:
+                    room_id = pref_room if rooms.fits(pref_room, size, gender) else None
+                elif rooms.block_gender.get(pref_block) == gender:
+                    room_id = rooms.best_fit(('block', pref_block), size, gender)
+                if room_id is not None:
+                    choice = rank
+                    break
+            if room_id is None and place_anywhere:
+                room_id, choice = rooms.best_fit(('gender', gender), size, gender), ANYWHERE
+            if room_id is None:
+                result.unplaced += size
+                continue
+            rooms.take(room_id, size)
+            result.placed += size
+            result.by_choice[choice] += size
+            for request_id, user_id, _, _ in group:
+                yield request_id, user_id, room_id
+
+
+def run_lottery(allocation_round, seed=None, place_anywhere=True, dry_run=False):
+    """
+    Allocate every open request of allocation_round in one transaction and
+    mark the round allocated. Students who already have a room are left where
+    they are. With dry_run nothing is written. Returns a LotteryResult.
+    """
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 31)
+    result = LotteryResult(seed=seed)
+    started = time.perf_counter()
+
+    with booking.write_transaction():
+        # Claim the round in the database, not on this instance, which may be stale
+        # (another worker ran it meanwhile); a dry run rolls the claim back
+        claimed = AllocationRound.objects.filter(pk=allocation_round.pk, status=AllocationRound.OPEN).update(
+            status=AllocationRound.ALLOCATED,
+        )
+        if not claimed:
+            raise LotteryError(f'{allocation_round} has already been allocated.')
+        # Lock the rooms so bookings made meanwhile wait for the draw instead of racing it
+        rooms = _Rooms(
+            Room.objects.select_for_update(of=('self',)).with_occupancy().order_by()
+            .values_list('id', 'floor__block_id', 'floor__block__gender', 'free_spots')
+        )
+        requests = list(
+            RoomRequest.objects.filter(round=allocation_round).order_by('id')
+            .values_list('id', 'user_id', 'priority', 'group_code', 'user__profile__gender')
+        )
+        housed = set(
+            Booking.objects.active().filter(user__room_requests__round=allocation_round)
+            .values_list('user_id', flat=True)
+        )
+        preferences = defaultdict(list)
+        for request_id, rank, room_id, block_id in (
+            RoomPreference.objects.filter(request__round=allocation_round).order_by('request_id', 'rank')
+            .values_list('request_id', 'rank', 'room_id', 'block_id')
+        ):
+            preferences[request_id].append((rank, room_id, block_id))
+
+        units, result.already_housed = _groups(requests, housed)
+        units = [unit for unit in units if unit[0][3]]  # students without a gender can't be placed
+        result.unplaced += sum(1 for request in requests if not request[4] and request[1] not in housed)
+        placements = list(_place(units, rooms, preferences, random.Random(seed), place_anywhere, result))
+
+        if not dry_run:
+            _write(allocation_round, placements, seed)
+        else:
+            transaction.set_rollback(True)
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def _write(allocation_round, placements, seed):
+    """Book every placement and record it on its request; must run inside a transaction"""
+    drawn_at = timezone.now()
+    Booking.objects.bulk_create(
+        [
+            Booking(user_id=user_id, room_id=room_id, term=allocation_round.term, created_at=drawn_at)
+            for _, user_id, room_id in placements
+        ],
+        batch_size=WRITE_BATCH,
+    )
+    with journal.batch():
+        journal.record_many(BookingEvent.BOOKED, ((user_id, room_id) for _, user_id, room_id in placements), 'lottery')
+    # One UPDATE reading the bookings just made back through the one-active-booking-per-user index;
+    # bulk_update would build a CASE over every request instead
+    drawn = Booking.objects.active().filter(user_id=OuterRef('user_id'), created_at=drawn_at)
+    allocation_round.requests.update(assigned_room=Subquery(drawn.values('room_id')[:1]))
+    room_ids = list({room_id for _, _, room_id in placements})
+    for start in range(0, len(room_ids), WRITE_BATCH):
+        booking.resync_rooms(room_ids[start:start + WRITE_BATCH])
+    booking.resync_rooms((), [user_id for _, user_id, _ in placements])
+
+    allocation_round.status = AllocationRound.ALLOCATED
+    allocation_round.seed = seed
+    allocation_round.allocated_at = drawn_at
+    allocation_round.save(update_fields=['status', 'seed', 'allocated_at'])
@@ -0,0 +1,130 @@
+"""
+Occupancy summary: rooms, beds and occupants per floor and per block.
+
+BlockOccupancy and FloorOccupancy let the blocks list and the warden
+dashboard show free beds by reading one row per block or floor, instead of
+summing every room. They are changed in the same transaction as the rooms
+they summarise: shift_room() follows Room.adjust_occupancy() on the booking
+paths, and refresh_rooms() recounts the floors touched by a bulk change
+(resync_rooms, capacity edits, rooms added or removed). rebuild()
+recomputes both tables from scratch, for rooms written behind the
+summary's back (bulk loads, raw SQL).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from ..models import Block, BlockOccupancy, Floor, FloorOccupancy, Room
+
+
+COUNTED = ('rooms', 'beds', 'occupied')
+BATCH_SIZE = 2000
+
+
+def shift_room(room_id, delta):
+    """Add delta occupants (negative when they leave) to room_id's floor and block; must run inside a transaction"""
+    FloorOccupancy.objects.filter(floor__rooms=room_id).update(occupied=F('occupied') + delta)
+    BlockOccupancy.objects.filter(block__floors__rooms=room_id).update(occupied=F('occupied') + delta)
+
+
+def _floor_rows(floors, rooms):
+    """Summary rows for floors, a {floor id: block id} dict, counted from rooms"""
+    totals = {
+        row['floor_id']: row for row in
+        rooms.order_by().values('floor_id').annotate(rooms=Count('id'), beds=Sum('capacity'), occupied=Sum('occupancy'))
+    }
+    return [
+        FloorOccupancy(floor_id=floor_id, block_id=block_id, **{
+            name: totals.get(floor_id, {}).get(name) or 0 for name in COUNTED
+        })
+        for floor_id, block_id in floors.items()
+    ]
+
+
+def _block_rows(block_ids, floor_rows):
+    """Summary rows for block_ids, counted from their floors' summaries"""
+    totals = {
+        row['block_id']: row for row in
+        floor_rows.order_by().values('block_id').annotate(rooms=Sum('rooms'), beds=Sum('beds'), occupied=Sum('occupied'))
+    }
+    return [
+        BlockOccupancy(block_id=block_id, **{name: totals.get(block_id, {}).get(name) or 0 for name in COUNTED})
+        for block_id in block_ids
+    ]
+
+
+def refresh_blocks(block_ids):
+    """Recount the blocks' totals from their floors' summaries; blocks that no longer exist are skipped"""
+    block_ids = set(block_ids)
+    if block_ids:
+        block_ids = set(Block.objects.filter(pk__in=block_ids).values_list('id', flat=True))
+        BlockOccupancy.objects.bulk_create(
+            _block_rows(block_ids, FloorOccupancy.objects.filter(block_id__in=block_ids)),
+            update_conflicts=True, unique_fields=['block'], update_fields=list(COUNTED),
+        )
+
+
+def refresh_floors(floor_ids):
+    """Recount the floors from their rooms, then their blocks; floors that no longer exist are skipped"""
+    floor_ids = set(floor_ids)
+    if not floor_ids:
+        return
+    floors = dict(Floor.objects.filter(pk__in=floor_ids).values_list('id', 'block_id'))
+    FloorOccupancy.objects.bulk_create(
+        _floor_rows(floors, Room.objects.filter(floor_id__in=floors)),
+        update_conflicts=True, unique_fields=['floor'], update_fields=['block', *COUNTED],
+    )
+    refresh_blocks(floors.values())
+
+
+def refresh_rooms(room_ids):
+    """Recount the floors and blocks holding room_ids"""
+    room_ids = set(room_ids)
+    if room_ids:
+        refresh_floors(Room.objects.filter(pk__in=room_ids).values_list('floor_id', flat=True).distinct())
+
+
+def refresh_floors_on_commit(floor_ids):
+    """
+    refresh_floors() once the surrounding transaction commits. For deletions:
+    while a block or floor is being deleted its summary rows may already be
+    gone, and recreating them there would break the cascade.
+    """
+    floor_ids = set(floor_ids)
+    if floor_ids:
+        transaction.on_commit(lambda: refresh_floors(floor_ids))
+
+
+def refresh_blocks_on_commit(block_ids):
+    block_ids = set(block_ids)
+    if block_ids:
+        transaction.on_commit(lambda: refresh_blocks(block_ids))
+
+
+def _snapshot():
+    return {
+        (model, row[0]): row[1:]
+        for model, fields in ((FloorOccupancy, ['block_id', *COUNTED]), (BlockOccupancy, COUNTED))
+        for row in model.objects.values_list('pk', *fields).iterator()
+    }
+
+
+def rebuild():
+    """
+    Recompute every summary row from the rooms, in one transaction. Returns
+    how many floor and block rows were missing, stale or left over before.
+    """
+    with transaction.atomic():
+        before = _snapshot()
+        FloorOccupancy.objects.all().delete()
+        BlockOccupancy.objects.all().delete()
+        FloorOccupancy.objects.bulk_create(
+            _floor_rows(dict(Floor.objects.values_list('id', 'block_id')), Room.objects.all()), batch_size=BATCH_SIZE,
+        )
+        BlockOccupancy.objects.bulk_create(
+            _block_rows(Block.objects.values_list('id', flat=True), FloorOccupancy.objects.all()), batch_size=BATCH_SIZE,
+        )
+        after = _snapshot()
+    changed = Counter(model for model, pk in before.keys() | after.keys() if before.get((model, pk)) != after.get((model, pk)))
+    return changed[FloorOccupancy], changed[BlockOccupancy]
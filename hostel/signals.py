@@ -0,0 +1,92 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import availability, metrics
+from .models import Block, Booking, BookingEvent, Floor, Room
+from .services import booking, journal, occupancy
+
+
+@receiver(post_save, sender=Room)
+def invalidate_saved_room_snapshots(sender, instance, **kwargs):
+    availability.forget_room(instance.pk)
+    availability.bump_rooms_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Room)
+def invalidate_deleted_room_snapshots(sender, instance, **kwargs):
+    availability.forget_room(instance.pk)
+    availability.bump_floors_on_commit([instance.floor_id])
+
+
+@receiver([post_save, post_delete], sender=Floor)
+def invalidate_floor_snapshots(sender, instance, **kwargs):
+    availability.bump_blocks_on_commit([instance.block_id])
+
+
+@receiver([post_save, post_delete], sender=Block)
+def invalidate_block_snapshots(sender, instance, **kwargs):
+    availability.bump_blocks_on_commit([instance.pk])
+    transaction.on_commit(lambda: availability.bump(availability.BLOCKS_LIST))
+
+
+# Rooms, floors and blocks saved one by one (the admin, fixtures) keep their
+# occupancy summary in step; bulk loads call occupancy.rebuild() instead
+
+@receiver(post_save, sender=Room)
+def recount_saved_room_floor(sender, instance, **kwargs):
+    occupancy.refresh_floors([instance.floor_id])
+
+
+@receiver(post_delete, sender=Room)
+def recount_deleted_room_floor(sender, instance, **kwargs):
+    occupancy.refresh_floors_on_commit([instance.floor_id])
+
+
+@receiver(post_save, sender=Floor)
+def recount_saved_floor(sender, instance, **kwargs):
+    occupancy.refresh_floors([instance.pk])
+
+
+@receiver(post_delete, sender=Floor)
+def recount_deleted_floor_block(sender, instance, **kwargs):
+    occupancy.refresh_blocks_on_commit([instance.block_id])
+
+
+@receiver(post_save, sender=Block)
+def count_saved_block(sender, instance, created, **kwargs):
+    if created:
+        occupancy.refresh_blocks([instance.pk])
+
+
+# Bookings deleted outside the booking service, the admin and cascades from a
+# deleted user or room included, leave the room counters and summaries behind.
+# The recount waits for the commit: inside a cascade the floor summaries may
+# already be gone, as with refresh_floors_on_commit.
+
+@receiver(post_delete, sender=Booking)
+def release_deleted_booking(sender, instance, **kwargs):
+    if instance.status != Booking.ACTIVE:
+        return
+    journal.record(BookingEvent.CANCELLED, instance.user_id, instance.room_id, source='delete')
+    transaction.on_commit(lambda: _resync_room(instance.room_id, instance.user_id))
+
+
+def _resync_room(room_id, user_id):
+    with booking.write_transaction():
+        booking.resync_rooms([room_id], [user_id])
+
+
+@receiver(connection_created)
+def time_request_queries(sender, connection, **kwargs):
+    # Every thread has its own connections; a reconnect keeps the wrapper list
+    if metrics.record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.record_sql)
+
+
+@receiver(user_logged_in)
+def invalidate_pages_on_login(sender, request, user, **kwargs):
+    # A new session rotates the CSRF secret that cached room pages embed
+    availability.bump(availability.user_scope(user.pk))
@@ -0,0 +1,14 @@
+"""
+Small statistics helpers for the benchmark harnesses and reports, kept apart
+from hostel.benchmarks so reporting commands don't import the load-test code.
+"""
+import math
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of samples (pct in 0..100)"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
@@ -1,3 +1,1360 @@
-from django.test import TestCase
+import asyncio
+import cProfile
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, router, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import admission, availability, live, metrics, profiling, routers
+from .benchmarks import browsing_urlconf, run_booking_stress, run_view_benchmarks, seed_contended_block, seed_hostel
+from .models import (
+    AllocationRound, ArchivedBooking, Block, BlockOccupancy, Booking, BookingEvent, Floor, FloorOccupancy, Room,
+    RoomRequest, UserProfile, current_term,
+)
+from .routers import PrimaryPinMiddleware, read_only_view
+from .services import assignment, booking, journal, lottery, occupancy
+from .services.booking import BookingStatus
+
+
+def make_block(block_name='B1', gender='M', floors=2, rooms_per_floor=3, capacity=2):
+    block = Block.objects.create(block_name=block_name, gender=gender)
+    for floor_num in range(1, floors + 1):
+        floor = Floor.objects.create(block=block, floor_number=floor_num)
+        for room_num in range(1, rooms_per_floor + 1):
+            Room.objects.create(floor=floor, room_number=f"{floor_num}{room_num:02d}", capacity=capacity)
+    return block
+
+
+def make_user(username, gender='M'):
+    user = User.objects.create_user(username=username, password='pass12345')
+    UserProfile.objects.create(user=user, gender=gender)
+    return user
+
+
+class BlockLayoutViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('student')
+        self.client.force_login(self.user)
+
+    def _count_layout_queries(self, block):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('block_layout', args=[block.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_block_size(self):
+        small = make_block('B1', floors=1, rooms_per_floor=2)
+        large = make_block('B2', floors=4, rooms_per_floor=10)
+        self.assertEqual(self._count_layout_queries(small), self._count_layout_queries(large))
+
+    def test_rooms_show_annotated_occupancy_and_status(self):
+        block = make_block('B1', floors=1, rooms_per_floor=3, capacity=2)
+        rooms = list(Room.objects.filter(floor__block=block).order_by('room_number'))
+        booking.book_room(self.user, rooms[0])
+        booking.book_room(make_user('other'), rooms[0])
+        booking.book_room(make_user('third'), rooms[1])
+
+        response = self.client.get(reverse('block_layout', args=[block.id]))
+        shown = response.context['floors_data'][0]['rooms']
+        self.assertEqual([r['occupancy_status'] for r in shown], ['full', 'partial', 'empty'])
+        self.assertEqual([r['free_spots'] for r in shown], [0, 1, 2])
+
+    def test_layout_is_served_from_cache_until_a_booking_commits(self):
+        block = make_block('B1', floors=1, rooms_per_floor=2, capacity=2)
+        room = Room.objects.filter(floor__block=block).first()
+        url = reverse('block_layout', args=[block.id])
+        self.client.get(url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse(any('"hostel_room"' in query['sql'] for query in ctx.captured_queries))
+
+        hits = availability.stats()['hits']
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.book_room(self.user, room)
+        response = self.client.get(url)
+        self.assertContains(response, 'Block B1')
+        self.assertEqual(response.context['floors_data'][0]['rooms'][0]['occupancy'], 1)
+        self.assertEqual(availability.stats()['hits'], hits)
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('student')
+        self.client.force_login(self.user)
+        self.client.get(reverse('login'))  # picks up a CSRF cookie, as any signed-in browser has
+        self.block = make_block('B1', floors=1, rooms_per_floor=2)
+        self.room, self.other_room = Room.objects.filter(floor__block=self.block).order_by('room_number')
+
+    def _revalidate(self, url, response):
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        touched = [q['sql'] for q in ctx.captured_queries if '"hostel_room"' in q['sql'] or '"hostel_booking"' in q['sql']]
+        return again, touched
+
+    def test_unchanged_pages_are_not_rendered_again(self):
+        for url in (reverse('block_layout', args=[self.block.pk]), reverse('room_detail', args=[self.room.pk])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.has_header('Last-Modified'))
+            again, touched = self._revalidate(url, response)
+            self.assertEqual((again.status_code, touched), (304, []), url)
+
+        url = reverse('block_layout', args=[self.block.pk])
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.book_room(make_user('other'), self.room)
+        self.assertEqual(self._revalidate(url, response)[0].status_code, 200)
+
+    def test_room_page_follows_the_viewers_own_booking(self):
+        elsewhere = Room.objects.get(floor__block=make_block('B2', floors=1, rooms_per_floor=1))
+        url = reverse('room_detail', args=[self.room.pk])
+        response = self.client.get(url)
+        self.assertFalse(response.context['user_has_booking'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.book_room(self.user, elsewhere)
+        again, _ = self._revalidate(url, response)
+        self.assertEqual(again.status_code, 200)
+        self.assertTrue(again.context['user_has_booking'])
+
+    def test_pending_messages_are_always_rendered(self):
+        url = reverse('room_detail', args=[self.room.pk])
+        response = self.client.get(url)
+        self.client.post(reverse('cancel_booking', args=[self.other_room.pk]))  # queues an error message
+        again, _ = self._revalidate(url, response)
+        self.assertEqual(again.status_code, 200)
+        self.assertContains(again, 'You are not booked in this room')
+
+    def test_per_user_and_per_room_keys_expire_but_block_versions_do_not(self):
+        self.assertGreaterEqual(cache._max_entries, 100000)  # Django's default of 300 would cull block versions
+        with patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            availability.bump_many([self.block.pk, availability.user_scope(self.user.pk)])
+        timeouts = {next(iter(values)).split(':')[2]: kwargs['timeout'] for (values,), kwargs in set_many.call_args_list}
+        self.assertEqual(timeouts, {str(self.block.pk): None, 'user': availability._key_timeout()})
+        with patch.object(cache, 'set', wraps=cache.set) as set_:
+            availability.room_block_id(self.room.pk)
+        self.assertEqual(set_.call_args.kwargs['timeout'], availability._key_timeout())
+
+
+@override_settings(ROOT_URLCONF=browsing_urlconf(async_browsing=True))
+class AsyncBrowsingViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('student')
+        self.block = make_block('B1', floors=1, rooms_per_floor=2)
+        self.room = Room.objects.filter(floor__block=self.block).order_by('room_number').first()
+        booking.book_room(make_user('roommate'), self.room)
+
+    async def test_pages_match_the_sync_views(self):
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(reverse('login'))
+        for url in (reverse('blocks_list'), reverse('block_layout', args=[self.block.pk]), reverse('room_detail', args=[self.room.pk])):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            with override_settings(ROOT_URLCONF=browsing_urlconf(async_browsing=False)):
+                expected = await sync_to_async(self._sync_context)(url)
+            for key, value in expected.items():
+                self.assertEqual(response.context[key], value, f'{url} {key}')
+
+        url = reverse('room_detail', args=[self.room.pk])
+        response = await self.async_client.get(url)
+        self.assertEqual([user.username for user in response.context['occupants']], ['roommate'])
+        again = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def _sync_context(self, url):
+        client = self.client_class()
+        client.force_login(self.user)
+        client.get(reverse('login'))
+        context = client.get(url).context
+        return {key: context[key] for key in ('blocks', 'floors_data', 'available_spots', 'user_has_booking', 'occupants') if key in context}
+
+    async def test_other_gender_is_refused(self):
+        await self.async_client.aforce_login(await sync_to_async(make_user)('visitor', 'F'))
+        for url in (reverse('block_layout', args=[self.block.pk]), reverse('room_detail', args=[self.room.pk])):
+            response = await self.async_client.get(url)
+            self.assertRedirects(response, reverse('blocks_list'), fetch_redirect_response=False)
+        response = await self.async_client.get(reverse('room_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class LiveAvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('student')
+        self.block = make_block('B1', floors=1, rooms_per_floor=2)
+        self.room = Room.objects.filter(floor__block=self.block).first()
+
+    def test_booking_publishes_room_delta_on_commit(self):
+        async def subscribe():
+            return live.broker.subscribe(self.block.pk)
+
+        loop = asyncio.new_event_loop()
+        try:
+            subscription = loop.run_until_complete(subscribe())
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.book_room(self.user, self.room)
+            event = loop.run_until_complete(asyncio.wait_for(subscription.queue.get(), 1))
+        finally:
+            live.broker.unsubscribe(subscription)
+            loop.close()
+
+        self.assertEqual((event['id'], event['occupancy'], event['occupancy_status']), (self.room.pk, 1, 'partial'))
+        self.assertFalse(live.broker.has_subscribers())
+
+    async def test_stream_sends_snapshot_then_deltas(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('block_events', args=[self.block.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+
+        snapshot = (await anext(chunks)).decode()
+        self.assertIn('event: snapshot', snapshot)
+        rooms = json.loads(snapshot.split('data: ', 1)[1])['rooms']
+        self.assertEqual(len(rooms), 2)
+
+        live.broker.publish(self.block.pk, {'id': self.room.pk, 'occupancy': 1})
+        delta = (await anext(chunks)).decode()
+        self.assertIn('event: room', delta)
+        await response.streaming_content.aclose()
+
+
+class AvailabilityApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('student')
+        self.client.force_login(self.user)
+        self.block = make_block('B1', floors=2, rooms_per_floor=3)
+
+    def test_rooms_are_paged_by_cursor(self):
+        url = reverse('api_block_rooms', args=[self.block.pk])
+        seen, cursor = [], None
+        while True:
+            data = self.client.get(url, {'limit': 4, **({'cursor': cursor} if cursor else {})}).json()
+            seen.extend((room['floor_number'], room['room_number']) for room in data['rooms'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [(1, '101'), (1, '102'), (1, '103'), (2, '201'), (2, '202'), (2, '203')])
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'}).status_code, 400)
+
+    def test_unchanged_data_revalidates_without_room_queries(self):
+        room = Room.objects.filter(floor__block=self.block).order_by('room_number').first()
+        for url in (
+            reverse('api_blocks'),
+            reverse('api_block_rooms', args=[self.block.pk]),
+            reverse('api_room', args=[room.pk]),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with CaptureQueriesContext(connection) as ctx:
+                revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(revalidated.status_code, 304, url)
+            self.assertFalse(any('"hostel_room"' in query['sql'] for query in ctx.captured_queries), url)
+
+        url = reverse('api_room', args=[room.pk])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.book_room(self.user, room)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['room']['occupancy'], 1)
+
+    def test_other_gender_and_anonymous_are_refused(self):
+        girls = make_block('G1', gender='F', floors=1, rooms_per_floor=1)
+        self.assertEqual(self.client.get(reverse('api_block_rooms', args=[girls.pk])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('api_blocks'), {'gender': 'F'}).status_code, 403)
+        self.assertEqual([b['block_name'] for b in self.client.get(reverse('api_blocks')).json()['blocks']], ['B1'])
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_blocks')).status_code, 401)
+
+
+class UserContextTests(TestCase):
+    def setUp(self):
+        self.user = make_user('student')
+        self.client.force_login(self.user)
+        block = make_block('B1', floors=1, rooms_per_floor=2)
+        self.room, self.other_room = Room.objects.filter(floor__block=block).order_by('room_number')
+        booking.book_room(self.user, self.room)
+
+    def _queries_touching(self, url, table):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return sum(table in query['sql'] for query in ctx.captured_queries), response
+
+    def test_profile_and_room_loaded_once_per_request(self):
+        for url in (
+            reverse('dashboard'),
+            reverse('blocks_list'),
+            reverse('room_detail', args=[self.room.id]),
+            reverse('confirm_booking', args=[self.other_room.id]),
+        ):
+            profile_queries, _ = self._queries_touching(url, '"hostel_userprofile"')
+            self.assertEqual(profile_queries, 1, url)
+
+    def test_room_detail_reflects_current_booking(self):
+        _, response = self._queries_touching(reverse('room_detail', args=[self.room.id]), '')
+        self.assertTrue(response.context['user_in_room'])
+        _, response = self._queries_touching(reverse('room_detail', args=[self.other_room.id]), '')
+        self.assertFalse(response.context['user_in_room'])
+        self.assertTrue(response.context['user_has_booking'])
+        self.assertTrue(response.context['can_book'])
+
+
+class RoomOccupancyCounterTests(TestCase):
+    def setUp(self):
+        block = make_block('B1', floors=1, rooms_per_floor=2, capacity=2)
+        self.room, self.other_room = Room.objects.filter(floor__block=block).order_by('room_number')
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+
+    def _occupancy(self, room):
+        room.refresh_from_db()
+        return room.occupancy, room.is_booked
+
+    def test_resync_counts_only_active_bookings(self):
+        Booking.objects.create(user=self.alice, room=self.room, status=Booking.CANCELLED)
+        Booking.objects.create(user=self.bob, room=self.room)
+        Booking.objects.create(user=self.alice, room=self.room)
+        booking.resync_rooms([self.room.pk])
+        self.assertEqual(self._occupancy(self.room), (2, True))
+        self.assertEqual(self.room.booked_by, self.bob)
+        self.assertEqual(self.room.get_occupants(), [self.bob, self.alice])
+
+    def test_user_can_only_hold_one_active_booking(self):
+        Booking.objects.create(user=self.alice, room=self.room)
+        Booking.objects.create(user=self.alice, room=self.other_room, status=Booking.CANCELLED)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Booking.objects.create(user=self.alice, room=self.other_room)
+        self.assertEqual(list(Room.objects.occupied_by(self.alice)), [self.room])
+
+    def test_save_does_not_overwrite_counter(self):
+        stale = Room.objects.get(pk=self.room.pk)
+        booking.book_room(self.alice, self.room)
+        stale.capacity = 3
+        stale.save()
+        self.assertEqual(self._occupancy(self.room), (1, False))
+
+    def test_check_occupancy_repairs_drift(self):
+        booking.book_room(self.alice, self.room)
+        booking.book_room(self.bob, self.room)
+        Room.objects.filter(pk=self.room.pk).update(occupancy=0, is_booked=False)
+
+        out = StringIO()
+        call_command('check_occupancy', stdout=out)
+        self.assertIn('stored 0, actual 2', out.getvalue())
+        self.assertEqual(self._occupancy(self.room), (0, False))
+
+        call_command('check_occupancy', '--repair', stdout=out)
+        self.assertEqual(self._occupancy(self.room), (2, True))
+
+
+class BookingServiceTests(TestCase):
+    def setUp(self):
+        block = make_block('B1', floors=1, rooms_per_floor=2, capacity=1)
+        self.room, self.other_room = Room.objects.filter(floor__block=block).order_by('room_number')
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+
+    def test_book_and_reject_when_full(self):
+        self.assertEqual(booking.book_room(self.alice, self.room).status, BookingStatus.BOOKED)
+        self.assertEqual((self.room.occupancy, self.room.is_booked, self.room.booked_by), (1, True, self.alice))
+        self.assertEqual(booking.book_room(self.bob, self.room).status, BookingStatus.ROOM_FULL)
+        self.assertEqual(booking.book_room(self.alice, self.room).status, BookingStatus.ALREADY_IN_ROOM)
+
+    def test_switch_moves_user_atomically(self):
+        booking.book_room(self.alice, self.room)
+        result = booking.book_room(self.alice, self.other_room)
+        self.assertEqual(result.status, BookingStatus.HAS_OTHER_BOOKING)
+        self.assertEqual(list(Room.objects.occupied_by(self.alice)), [self.room])
+
+        result = booking.switch_room(self.alice, self.other_room)
+        self.assertEqual((result.status, result.previous_room_id), (BookingStatus.SWITCHED, self.room.pk))
+        self.assertEqual(list(Room.objects.occupied_by(self.alice)), [self.other_room])
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.occupancy, self.room.is_booked, self.room.booked_by), (0, False, None))
+
+    def test_failed_switch_keeps_existing_booking(self):
+        booking.book_room(self.alice, self.room)
+        booking.book_room(self.bob, self.other_room)
+        self.assertEqual(booking.switch_room(self.alice, self.other_room).status, BookingStatus.ROOM_FULL)
+        self.assertEqual(list(Room.objects.occupied_by(self.alice)), [self.room])
+
+    def test_cancel(self):
+        self.assertEqual(booking.cancel_booking(self.alice, self.room).status, BookingStatus.NOT_IN_ROOM)
+        booking.book_room(self.alice, self.room)
+        self.assertEqual(booking.cancel_booking(self.alice, self.room).status, BookingStatus.CANCELLED)
+        self.assertEqual((self.room.occupancy, self.room.booked_by), (0, None))
+        history = Booking.objects.get(user=self.alice)
+        self.assertEqual(history.status, Booking.CANCELLED)
+        self.assertIsNotNone(history.cancelled_at)
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    def test_capacity_never_exceeded_under_contention(self):
+        rooms, users = seed_contended_block(rooms=3, capacity=2, users=24)
+        stats = run_booking_stress(rooms, users, threads=6)
+
+        self.assertEqual(stats['outcomes'][BookingStatus.BOOKED.value], 6)
+        self.assertGreater(stats['attempts_per_second'], 0)
+        self.assertFalse(Room.objects.filter(occupancy__gt=F('capacity')).exists())
+        self.assertFalse(Room.objects.drifted().exists())
+
+
+class GroupBookingTests(TestCase):
+    def setUp(self):
+        block = make_block('B1', floors=1, rooms_per_floor=2, capacity=3)
+        self.room, self.other_room = Room.objects.select_related('floor__block').filter(floor__block=block).order_by('room_number')
+        self.alice, self.bob, self.carol = (make_user(name) for name in ('alice', 'bob', 'carol'))
+
+    def test_books_everyone_with_one_insert(self):
+        with CaptureQueriesContext(connection) as ctx:
+            result = booking.book_group([self.alice, self.bob, self.carol], self.room)
+        self.assertEqual((result.status, result.usernames), (BookingStatus.BOOKED, ('alice', 'bob', 'carol')))
+        self.assertEqual(sum(q['sql'].startswith('INSERT INTO "hostel_booking"') for q in ctx.captured_queries), 1)
+        self.assertEqual((self.room.occupancy, self.room.is_booked, self.room.booked_by), (3, True, self.alice))
+
+    def test_all_or_nothing(self):
+        booking.book_room(make_user('erin'), self.room)
+        result = booking.book_group([self.alice, self.bob, self.carol], self.room)
+        self.assertEqual(result.status, BookingStatus.ROOM_FULL)
+        self.assertFalse(Booking.objects.filter(user__in=[self.alice, self.bob, self.carol]).exists())
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.occupancy, 1)
+
+        result = booking.book_group([self.alice, make_user('gina', gender='F')], self.room)
+        self.assertEqual((result.status, result.usernames), (BookingStatus.WRONG_GENDER, ('gina',)))
+
+    def test_members_booked_elsewhere(self):
+        booking.book_room(self.bob, self.other_room)
+        result = booking.book_group([self.alice, self.bob], self.room)
+        self.assertEqual((result.status, result.usernames), (BookingStatus.HAS_OTHER_BOOKING, ('bob',)))
+
+        result = booking.book_group([self.alice, self.bob], self.room, switch=True)
+        self.assertEqual(result.status, BookingStatus.SWITCHED)
+        self.assertEqual(list(Room.objects.occupied_by(self.bob)), [self.room])
+        self.other_room.refresh_from_db()
+        self.assertEqual((self.other_room.occupancy, self.other_room.booked_by), (0, None))
+        self.assertFalse(Room.objects.drifted().exists())
+
+    def test_view_books_the_student_and_friends(self):
+        self.client.force_login(self.alice)
+        url = reverse('group_booking', args=[self.room.id])
+        self.assertContains(self.client.get(url), 'Book With Friends')
+
+        response = self.client.post(url, {'usernames': 'bob, nobody'})
+        self.assertContains(response, 'No student is called nobody.')
+
+        response = self.client.post(url, {'usernames': 'bob carol'})
+        self.assertRedirects(response, reverse('dashboard'))
+        self.assertEqual(set(self.room.get_occupants()), {self.alice, self.bob, self.carol})
+
+    def test_bulk_api_places_each_group_independently(self):
+        url = reverse('api_group_bookings')
+        payload = {'groups': [
+            {'room': self.room.id, 'usernames': ['alice', 'bob']},
+            {'room': self.room.id, 'usernames': ['carol', 'dave']},  # one spot left
+            {'room': self.other_room.id, 'usernames': ['carol', 'nobody']},
+            {'room': 0, 'usernames': ['carol']},
+        ]}
+        make_user('dave')
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.post(url, payload, content_type='application/json').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('warden', is_staff=True))
+        response = self.client.post(url, {'groups': 'all'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(
+            [(r['status'], r['usernames']) for r in response.json()['results']],
+            [('booked', ['alice', 'bob']), ('room_full', []), ('unknown_user', ['nobody']), ('unknown_room', [])],
+        )
+        self.assertEqual(self.room.get_occupants(), [self.alice, self.bob])
+
+
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.room = Room.objects.get(floor__block=make_block('B1', floors=1, rooms_per_floor=1))
+        self.alice = make_user('alice')
+        self.client.force_login(self.alice)
+
+    @override_settings(HOSTEL_ADMISSION_USER_RATE=1, HOSTEL_ADMISSION_USER_BURST=2)
+    def test_token_bucket_per_student(self):
+        url = reverse('confirm_booking', args=[self.room.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        # Browsing is never limited
+        self.assertEqual(self.client.get(reverse('room_detail', args=[self.room.pk])).status_code, 200)
+
+    @override_settings(HOSTEL_ADMISSION_CONCURRENCY=1)
+    def test_full_house_queues_and_replays_the_booking(self):
+        slot = admission.acquire_slot()
+        self.assertIsNone(admission.acquire_slot())
+        url = reverse('book_room', args=[self.room.pk])
+        response = self.client.post(url, {'confirm_switch': 'yes'})
+        self.assertEqual(response.status_code, 202)
+        self.assertIn(('confirm_switch', 'yes'), response.context['fields'])
+        signed = response.context['signed_ticket']
+        self.assertFalse(Booking.objects.exists())
+
+        # Later arrivals queue behind the ticket, and can't use someone else's
+        self.client.force_login(make_user('bob'))
+        self.assertEqual(self.client.post(url).context['ticket'], 2)
+        self.assertEqual(self.client.post(url, {'admission_ticket': signed}).context['ticket'], 3)
+
+        self.client.force_login(self.alice)
+        with self.assertNumQueries(0):
+            status = self.client.get(reverse('queue_status'), {'ticket': signed}).json()
+        self.assertEqual(status, {'position': 1, 'ready': False})
+        # The booking holding the slot finishes and hands its turn on
+        admission.release_slot(slot)
+        self.assertEqual(self.client.get(reverse('queue_status'), {'ticket': signed}).json(), {'position': 0, 'ready': True})
+        self.assertRedirects(self.client.post(url, {'admission_ticket': signed}), reverse('dashboard'))
+        self.assertEqual(self.room.get_occupants(), [self.alice])
+
+        # Ticket 2 was handed the turn but never came back; pollers pass it on once the queue stalls
+        self.assertEqual(admission.ticket_status(3), (1, False))
+        self.assertEqual(admission.ticket_status(3, now=time.time() + admission.STALL_SECONDS), (0, True))
+
+        self.assertEqual(self.client.get(reverse('queue_status'), {'ticket': 'forged'}).status_code, 400)
+
+    @override_settings(HOSTEL_ADMISSION_CONCURRENCY=1, HOSTEL_ADMISSION_USER_RATE=1, HOSTEL_ADMISSION_USER_BURST=2)
+    def test_a_ticket_admits_one_post(self):
+        slot = admission.acquire_slot()
+        url = reverse('cancel_booking', args=[self.room.pk])
+        signed = self.client.post(url).context['signed_ticket']
+        admission.release_slot(slot)
+        self.assertEqual(self.client.post(url, {'admission_ticket': signed}).status_code, 302)
+
+        # Replayed, the served ticket is charged to the student's bucket and queued behind others again
+        self.assertEqual(self.client.post(url, {'admission_ticket': signed}).status_code, 302)
+        self.assertEqual(self.client.post(url, {'admission_ticket': signed}).status_code, 429)
+        cache.delete(f'hostel:admission:user:{self.alice.pk}')
+        slot = admission.acquire_slot()
+        response = self.client.post(url, {'admission_ticket': signed})
+        self.assertEqual((response.status_code, response.context['ticket']), (202, 2))
+        admission.release_slot(slot)
+
+    def test_writes_need_post(self):
+        self.assertEqual(self.client.get(reverse('book_room', args=[self.room.pk])).status_code, 405)
+        self.assertFalse(Booking.objects.exists())
+
+
+class AutoAssignTests(TestCase):
+    def setUp(self):
+        self.block = make_block('B1', floors=2, rooms_per_floor=2, capacity=2)
+        self.other_block = make_block('B2', floors=1, rooms_per_floor=1, capacity=1)
+        make_block('G1', gender='F', floors=1, rooms_per_floor=1)
+        self.rooms = {room.room_number: room for room in Room.objects.filter(floor__block=self.block)}
+        self.alice = make_user('alice')
+
+    def test_fills_partly_occupied_rooms_first(self):
+        booking.book_room(make_user('erin'), self.rooms['201'])
+        result = assignment.assign_room(self.alice, 'M')
+        self.assertEqual((result.status, result.room), (BookingStatus.BOOKED, self.rooms['201']))
+
+    def test_respects_preferences(self):
+        booking.book_room(make_user('erin'), self.rooms['201'])
+        single = assignment.assign_room(self.alice, 'M', assignment.Preferences(room_type=assignment.SINGLE))
+        self.assertEqual(single.room.floor.block, self.other_block)
+
+        preferences = assignment.Preferences(block_id=self.block.pk, max_floor=1)
+        result = assignment.assign_room(make_user('bob'), 'M', preferences)
+        self.assertEqual(result.room.floor.floor_number, 1)
+
+    def test_joins_roommate(self):
+        booking.book_room(make_user('erin'), self.rooms['102'])
+        booking.book_room(make_user('fred'), self.rooms['201'])
+        result = assignment.assign_room(self.alice, 'M', assignment.Preferences(roommate='erin'))
+        self.assertEqual(result.room, self.rooms['102'])
+        # The roommate's room is now full
+        result = assignment.assign_room(make_user('bob'), 'M', assignment.Preferences(roommate='erin'))
+        self.assertEqual((result.status, result.room), (BookingStatus.NO_ROOM, None))
+
+    def test_no_room_when_nothing_fits(self):
+        result = assignment.assign_room(self.alice, 'M', assignment.Preferences(min_floor=3))
+        self.assertEqual(result.status, BookingStatus.NO_ROOM)
+        self.assertFalse(Booking.objects.filter(user=self.alice).exists())
+
+    def test_skips_rooms_filled_by_others(self):
+        booking.book_room(make_user('erin'), self.rooms['101'])
+        # Another request fills the fullest room between the candidate query and the booking
+        real_book_room = booking.book_room
+
+        def book_room(user, room, switch=False):
+            if room == self.rooms['101']:
+                real_book_room(make_user('zed'), room)
+            return real_book_room(user, room, switch)
+
+        with patch.object(booking, 'book_room', book_room):
+            result = assignment.assign_room(self.alice, 'M')
+        self.assertEqual(result.status, BookingStatus.BOOKED)
+        self.assertNotEqual(result.room, self.rooms['101'])
+
+    def test_view_books_and_reports(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get(reverse('assign_room')).status_code, 200)
+
+        response = self.client.post(reverse('assign_room'), {'min_floor': 2, 'max_floor': 1})
+        self.assertContains(response, 'The lowest floor cannot be above the highest floor.')
+
+        response = self.client.post(reverse('assign_room'), {'block': self.block.pk, 'room_type': 'shared'})
+        self.assertRedirects(response, reverse('dashboard'))
+        room = Room.objects.occupied_by(self.alice).get()
+        self.assertEqual(room.floor.block, self.block)
+
+        response = self.client.post(reverse('assign_room'), {}, follow=True)
+        self.assertContains(response, 'You already have a room booked.')
+
+
+class LotteryTests(TestCase):
+    def setUp(self):
+        self.block = make_block('B1', floors=1, rooms_per_floor=2, capacity=2)
+        self.other_block = make_block('B2', floors=1, rooms_per_floor=2, capacity=2)
+        self.girls_block = make_block('G1', gender='F', floors=1, rooms_per_floor=1, capacity=2)
+        now = timezone.now()
+        self.round = AllocationRound.objects.create(
+            name='Autumn draw', opens_at=now - timedelta(days=1), closes_at=now + timedelta(days=1),
+        )
+
+    def enter(self, username, *choices, gender='M', priority=0, group_code=''):
+        """choices are blocks, or rooms for a specific room"""
+        request = lottery.enter_round(
+            self.round, make_user(username, gender),
+            [(choice, None) if isinstance(choice, Block) else (None, choice) for choice in choices], group_code,
+        )
+        if priority:
+            RoomRequest.objects.filter(pk=request.pk).update(priority=priority)
+        return request
+
+    def placements(self):
+        return dict(self.round.requests.values_list('user__username', 'assigned_room__room_number'))
+
+    def test_same_seed_same_draw(self):
+        for num in range(6):
+            self.enter(f'student{num}', self.block)
+        first = lottery.run_lottery(self.round, seed=7, dry_run=True)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.round.status, AllocationRound.OPEN)
+
+        result = lottery.run_lottery(self.round, seed=7)
+        self.assertEqual((result.placed, result.by_choice), (first.placed, first.by_choice))
+        # Four fit in the block they asked for, the other two go wherever there is room
+        self.assertEqual(result.by_choice, {1: 4, lottery.ANYWHERE: 2})
+        self.round.refresh_from_db()
+        self.assertEqual((self.round.status, self.round.seed), (AllocationRound.ALLOCATED, 7))
+        self.assertEqual(Booking.objects.active().count(), 6)
+        self.assertFalse(Room.objects.drifted().exists())
+        self.assertEqual(
+            {request.user_id: request.assigned_room_id for request in self.round.requests.all()},
+            dict(Booking.objects.active().values_list('user_id', 'room_id')),
+        )
+        with self.assertRaises(lottery.LotteryError):
+            lottery.run_lottery(self.round)
+
+    def test_a_stale_round_is_not_drawn_twice(self):
+        for num in range(3):
+            self.enter(f'student{num}', self.block)
+        stale = AllocationRound.objects.get(pk=self.round.pk)
+        lottery.run_lottery(self.round, seed=7)
+        self.round.refresh_from_db()
+        drawn = self.placements()
+
+        self.assertEqual(stale.status, AllocationRound.OPEN)
+        for dry_run in (True, False):
+            with self.assertRaises(lottery.LotteryError):
+                lottery.run_lottery(stale, seed=8, dry_run=dry_run)
+        self.assertEqual(self.placements(), drawn)
+        self.assertEqual(
+            AllocationRound.objects.filter(pk=self.round.pk).values_list('seed', 'allocated_at').get(),
+            (7, self.round.allocated_at),
+        )
+        self.assertEqual(Booking.objects.active().count(), 3)
+
+    def test_priority_goes_first(self):
+        room = Room.objects.get(floor__block=self.block, room_number='101')
+        self.enter('senior', room, priority=2)
+        self.enter('junior', room)
+        self.enter('third', room)
+        lottery.run_lottery(self.round, seed=1, place_anywhere=False)
+        placements = self.placements()
+        self.assertEqual(placements['senior'], '101')
+        self.assertEqual(sorted(placements.values(), key=str), ['101', '101', None])
+
+    def test_groups_share_a_room_within_their_gender(self):
+        self.enter('alice', self.other_block, group_code='A')
+        self.enter('bob', self.girls_block, group_code='A')
+        self.enter('carol', self.block, gender='F', group_code='A')
+        self.enter('dave', self.block)
+        result = lottery.run_lottery(self.round, seed=3)
+        self.assertEqual(result.placed, 4)
+
+        rooms = dict(Booking.objects.active().values_list('user__username', 'room__floor__block__block_name'))
+        self.assertEqual(Room.objects.occupied_by(User.objects.get(username='alice')).get(),
+                         Room.objects.occupied_by(User.objects.get(username='bob')).get())
+        # The group follows its first member's choice; choices in the other gender's blocks are never used
+        self.assertEqual(rooms['alice'], 'B2')
+        self.assertEqual((rooms['carol'], rooms['dave']), ('G1', 'B1'))
+
+    def test_leaves_housed_students_and_full_rooms_alone(self):
+        room = Room.objects.get(floor__block=self.girls_block)
+        booking.book_room(make_user('resident', 'F'), room)
+        self.enter('gina', self.girls_block, gender='F')
+        self.enter('hana', self.girls_block, gender='F')
+        housed = make_user('ivan')
+        booking.book_room(housed, Room.objects.get(floor__block=self.block, room_number='101'))
+        lottery.enter_round(self.round, housed, [(self.other_block, None)])
+
+        result = lottery.run_lottery(self.round, seed=5)
+        self.assertEqual((result.placed, result.unplaced, result.already_housed), (1, 1, 1))
+        room.refresh_from_db()
+        self.assertEqual((room.occupancy, room.is_booked), (2, True))
+        self.assertEqual(self.round.requests.get(user=housed).assigned_room, None)
+
+    def test_command_and_student_page(self):
+        student = make_user('alice')
+        self.client.force_login(student)
+        url = reverse('lottery')
+        self.assertContains(self.client.get(url), 'Enter the Lottery')
+        response = self.client.post(url, {'block_1': self.block.pk, 'room_1': '999'})
+        self.assertContains(response, 'B1 has no room 999.')
+        response = self.client.post(url, {'block_1': self.block.pk, 'room_1': '102', 'block_2': self.other_block.pk})
+        self.assertRedirects(response, url)
+        self.assertEqual(
+            [(p.rank, p.room_id, p.block_id) for p in self.round.requests.get(user=student).preferences.all()],
+            [(1, Room.objects.get(floor__block=self.block, room_number='102').pk, None), (2, None, self.other_block.pk)],
+        )
+
+        out = StringIO()
+        call_command('run_lottery', self.round.pk, '--seed', '11', stdout=out)
+        self.assertIn('Placed 1 student(s), 0 unplaced', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('run_lottery', self.round.pk, stdout=StringIO())
+        response = self.client.get(url)
+        self.assertContains(response, 'Room 102, B1')
+        self.assertNotContains(response, 'Enter the Lottery')
+
+
+class OccupancySummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.block = make_block('B1', floors=2, rooms_per_floor=2, capacity=2)
+        self.rooms = {room.room_number: room for room in Room.objects.select_related('floor__block').filter(floor__block=self.block)}
+
+    def summary(self):
+        floors = dict(FloorOccupancy.objects.filter(block=self.block).values_list('floor__floor_number', 'occupied'))
+        block = BlockOccupancy.objects.get(block=self.block)
+        return floors, (block.rooms, block.beds, block.occupied)
+
+    def test_booking_paths_keep_the_summary_in_step(self):
+        self.assertEqual(self.summary(), ({1: 0, 2: 0}, (4, 8, 0)))
+        alice, bob, carol = make_user('alice'), make_user('bob'), make_user('carol')
+        booking.book_room(alice, self.rooms['101'])
+        booking.book_group([bob, carol], self.rooms['201'])
+        booking.book_room(alice, self.rooms['202'], switch=True)
+        booking.book_group([bob, carol], self.rooms['102'], switch=True)
+        booking.cancel_booking(carol, self.rooms['102'])
+        self.assertEqual(self.summary(), ({1: 1, 2: 1}, (4, 8, 2)))
+        # Refused bookings roll their summary update back with them
+        self.assertEqual(booking.book_room(alice, self.rooms['101']).status, BookingStatus.HAS_OTHER_BOOKING)
+        self.assertEqual(occupancy.rebuild(), (0, 0))
+
+    def test_structure_changes_and_rebuild(self):
+        Room.objects.create(floor=self.rooms['101'].floor, room_number='103', capacity=3)
+        self.assertEqual(self.summary()[1], (5, 11, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rooms['201'].delete()
+        self.assertEqual(self.summary()[1], (4, 9, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            Floor.objects.get(block=self.block, floor_number=2).delete()
+        self.assertEqual(self.summary(), ({1: 0}, (3, 7, 0)))
+
+        FloorOccupancy.objects.update(occupied=5)
+        out = StringIO()
+        call_command('rebuild_occupancy', stdout=out)
+        self.assertIn('Corrected 1 floor and 0 block summary row(s).', out.getvalue())
+        self.assertEqual(self.summary(), ({1: 0}, (3, 7, 0)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.block.delete()
+        self.assertFalse(BlockOccupancy.objects.exists())
+
+    def test_deleting_a_booked_student_frees_the_bed(self):
+        alice, bob = make_user('alice'), make_user('bob')
+        booking.book_group([alice, bob], self.rooms['101'])
+        with self.captureOnCommitCallbacks(execute=True):
+            alice.delete()
+        room = Room.objects.get(pk=self.rooms['101'].pk)
+        self.assertEqual((room.occupancy, room.is_booked, room.booked_by), (1, False, bob))
+        self.assertEqual(self.summary(), ({1: 1, 2: 0}, (4, 8, 1)))
+        self.assertFalse(Room.objects.drifted().exists())
+        self.assertEqual(journal.check(), ({}, {}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bob.delete()
+        room.refresh_from_db()
+        self.assertEqual((room.occupancy, room.is_booked, room.booked_by), (0, False, None))
+        self.assertEqual(self.summary(), ({1: 0, 2: 0}, (4, 8, 0)))
+        self.assertEqual(journal.check(), ({}, {}))
+
+    def test_blocks_list_and_warden_dashboard_read_only_the_summary(self):
+        booking.book_room(make_user('alice'), self.rooms['101'])
+        self.client.force_login(make_user('bob'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('blocks_list'))
+        self.assertContains(response, '7 of 8 beds free')
+        self.assertFalse([q for q in ctx.captured_queries if '"hostel_room"' in q['sql']])
+        self.assertRedirects(self.client.get(reverse('warden_dashboard')), reverse('dashboard'))
+
+        self.client.force_login(User.objects.create_user('warden', is_staff=True))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('warden_dashboard'))
+        self.assertContains(response, '1 of 8 beds taken, 7 free')
+        self.assertFalse([q for q in ctx.captured_queries if '"hostel_room"' in q['sql']])
+
+
+class BookingJournalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.block = make_block('B1', floors=1, rooms_per_floor=3, capacity=2)
+        self.rooms = {room.room_number: room for room in Room.objects.select_related('floor__block').filter(floor__block=self.block)}
+
+    def events(self):
+        return list(BookingEvent.objects.values_list('kind', 'user__username', 'room__room_number', 'source'))
+
+    def test_booking_paths_are_journaled_and_replay_matches(self):
+        alice, bob, carol = make_user('alice'), make_user('bob'), make_user('carol')
+        booking.book_room(alice, self.rooms['101'])
+        booking.book_group([bob, carol], self.rooms['102'])
+        booking.book_room(alice, self.rooms['103'], switch=True)
+        booking.cancel_booking(bob, self.rooms['102'])
+        # Refused attempts leave nothing behind
+        self.assertEqual(booking.book_room(carol, self.rooms['101']).status, BookingStatus.HAS_OTHER_BOOKING)
+        self.assertEqual(booking.book_group([alice, bob], self.rooms['101']).status, BookingStatus.HAS_OTHER_BOOKING)
+        self.assertEqual(self.events(), [
+            (BookingEvent.BOOKED, 'alice', '101', 'student'),
+            (BookingEvent.BOOKED, 'bob', '102', 'group'),
+            (BookingEvent.BOOKED, 'carol', '102', 'group'),
+            (BookingEvent.SWITCHED, 'alice', '103', 'student'),
+            (BookingEvent.CANCELLED, 'bob', '102', 'student'),
+        ])
+        self.assertEqual(BookingEvent.objects.get(kind=BookingEvent.SWITCHED).from_room_id, self.rooms['101'].pk)
+
+        occupants, rooms = journal.replay()
+        self.assertEqual(occupants, {self.rooms['102'].pk: 1, self.rooms['103'].pk: 1})
+        self.assertEqual(rooms, {alice.pk: self.rooms['103'].pk, carol.pk: self.rooms['102'].pk})
+        self.assertEqual(journal.check(), ({}, {}))
+        out = StringIO()
+        call_command('replay_journal', stdout=out)
+        self.assertIn(f'Journal up to event {journal.last_event_id()} matches the live tables', out.getvalue())
+
+        # A change made behind the journal's back shows up as drift
+        Booking.objects.filter(user=carol).update(status=Booking.CANCELLED)
+        Room.objects.filter(pk=self.rooms['102'].pk).update(occupancy=0)
+        self.assertEqual(journal.check(), ({self.rooms['102'].pk: (1, 0)}, {carol.pk: (self.rooms['102'].pk, None)}))
+        out = StringIO()
+        call_command('replay_journal', stdout=out)
+        self.assertIn('1 room(s) and 1 student(s) differ from the journal.', out.getvalue())
+
+    def test_batches_write_in_bulk_and_only_on_success(self):
+        alice = make_user('alice')
+        room_id = self.rooms['101'].pk
+        with transaction.atomic():
+            with self.assertNumQueries(1), journal.batch():
+                journal.record_many(BookingEvent.BOOKED, [(alice.pk, room_id)] * 5, 'import')
+        self.assertEqual(BookingEvent.objects.count(), 5)
+
+        with patch.object(journal, 'BATCH_SIZE', 2), self.assertNumQueries(3), journal.batch():
+            journal.record_many(BookingEvent.ENDED, [(alice.pk, room_id)] * 5, 'archive')
+        self.assertEqual(BookingEvent.objects.count(), 10)
+
+        with transaction.atomic(), journal.batch():
+            journal.record(BookingEvent.CANCELLED, alice.pk, room_id)
+            transaction.set_rollback(True)
+        with self.assertRaises(ValueError), transaction.atomic(), journal.batch():
+            journal.record(BookingEvent.CANCELLED, alice.pk, room_id)
+            raise ValueError
+        # An inner batch rolled back to its savepoint drops only its own events
+        with transaction.atomic(), journal.batch():
+            journal.record(BookingEvent.BOOKED, alice.pk, room_id)
+            with transaction.atomic(), journal.batch():
+                journal.record(BookingEvent.CANCELLED, alice.pk, room_id)
+                transaction.set_rollback(True)
+        self.assertEqual(BookingEvent.objects.count(), 11)
+        self.assertFalse(BookingEvent.objects.filter(kind=BookingEvent.CANCELLED).exists())
+
+    def test_events_api_tails_the_journal_for_staff(self):
+        users = [make_user(f'student{n}') for n in range(3)]
+        for user in users:
+            booking.book_room(user, self.rooms['101'] if user is users[0] else self.rooms['102'])
+        url = reverse('api_booking_events')
+        self.client.force_login(users[0])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('warden', is_staff=True))
+        page = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual([event['user'] for event in page['events']], [users[0].pk, users[1].pk])
+        self.assertTrue(page['more'])
+        page = self.client.get(url, {'after': page['last_id'], 'limit': 2}).json()
+        self.assertEqual([(event['user'], event['kind']) for event in page['events']], [(users[2].pk, 'booked')])
+        self.assertFalse(page['more'])
+
+        booking.cancel_booking(users[2], self.rooms['102'])
+        page = self.client.get(url, {'after': page['last_id']}).json()
+        self.assertEqual([event['kind'] for event in page['events']], ['cancelled'])
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 400)
+
+
+class WriteTransactionTests(TransactionTestCase):
+    @skipUnless(connection.vendor == 'sqlite' and connection.settings_dict['OPTIONS'], 'SQLite production profile only')
+    def test_only_write_transactions_take_the_write_lock_up_front(self):
+        with CaptureQueriesContext(connection) as ctx:
+            with transaction.atomic():
+                Room.objects.count()
+            with booking.write_transaction():
+                Room.objects.count()
+                with booking.write_transaction():  # nested: a savepoint
+                    Room.objects.count()
+        begins = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('BEGIN')]
+        self.assertEqual(begins, ['BEGIN', 'BEGIN IMMEDIATE'])
+        self.assertIsNone(connection.transaction_mode)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_journal_check_reads_without_the_write_lock(self):
+        connection.ensure_connection()
+        previous, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(journal.check(), ({}, {}))
+        finally:
+            connection.transaction_mode = previous
+        begins = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('BEGIN')]
+        self.assertEqual(begins, ['BEGIN DEFERRED'])
+
+
+class DatabaseProfileTests(TestCase):
+    @skipUnless(connection.vendor == 'sqlite' and connection.settings_dict['OPTIONS'], 'SQLite production profile only')
+    def test_connections_use_the_production_pragmas(self):
+        self.assertIsNone(connection.transaction_mode)  # only write_transaction() begins IMMEDIATE
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -65536)
+
+    @override_settings(HOSTEL_READ_DATABASE='read')
+    def test_read_only_views_read_from_the_read_alias(self):
+        seen = []
+
+        @read_only_view
+        def view(request):
+            seen.append((Room.objects.all().db, UserProfile.objects.none().db, router.db_for_write(Room)))
+            return None
+
+        view(None)
+        self.assertEqual(seen, [('read', 'read', 'default')])
+        self.assertEqual(Room.objects.all().db, 'default')
+
+    @override_settings(HOSTEL_READ_DATABASE='read')
+    async def test_async_views_too(self):
+        @read_only_view
+        async def view(request):
+            return await sync_to_async(lambda: Room.objects.all().db)()
+
+        self.assertEqual(await view(None), 'read')
+
+
+@override_settings(HOSTEL_READ_DATABASE='replica')
+class PrimaryPinTests(TestCase):
+    """There is no 'replica' alias here: any query routed to it fails the test"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('student')
+        self.client.force_login(self.user)
+        self.block = make_block('B1', floors=1, rooms_per_floor=1)
+        self.room = Room.objects.get(floor__block=self.block)
+
+    def _routed(self, cookies):
+        @read_only_view
+        def view(request):
+            return HttpResponse(Room.objects.all().db)
+
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        return PrimaryPinMiddleware(view)(request).content.decode()
+
+    def test_booking_and_cancelling_pin_the_user_to_the_primary(self):
+        booked = self.client.post(reverse('book_room', args=[self.room.pk]))
+        self.assertIn(routers.PIN_COOKIE, booked.cookies)
+        self.client.cookies.clear()
+        self.client.force_login(self.user)
+        cancelled = self.client.post(reverse('cancel_booking', args=[self.room.pk]))
+        self.assertIn(routers.PIN_COOKIE, cancelled.cookies)
+        refused = self.client.post(reverse('cancel_booking', args=[self.room.pk]))
+        self.assertNotIn(routers.PIN_COOKIE, refused.cookies)
+
+        pin = booked.cookies[routers.PIN_COOKIE].value
+        self.assertEqual(self._routed({}), 'replica')
+        self.assertEqual(self._routed({routers.PIN_COOKIE: pin}), 'default')
+        self.assertEqual(self._routed({routers.PIN_COOKIE: 'forged'}), 'replica')
+        with override_settings(HOSTEL_PRIMARY_STICKY_SECONDS=-1):
+            self.assertEqual(self._routed({routers.PIN_COOKIE: pin}), 'replica')
+
+    def test_snapshots_are_built_from_the_primary(self):
+        with routers.reading_from('replica'):
+            self.assertEqual(availability.get_block_layout(self.block.pk)['block']['id'], self.block.pk)
+            self.assertEqual(availability.room_block_id(self.room.pk), self.block.pk)
+
+
+@override_settings(HOSTEL_CURRENT_TERM='2026-27')
+class ArchiveBookingsTests(TestCase):
+    def setUp(self):
+        block = make_block('B1', floors=1, rooms_per_floor=1, capacity=2)
+        self.room = Room.objects.get(floor__block=block)
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+
+    def test_closed_terms_move_to_archive(self):
+        with self.settings(HOSTEL_CURRENT_TERM='2025-26'):
+            booking.book_room(self.alice, self.room)
+            booking.book_room(self.bob, self.room)
+            booking.cancel_booking(self.bob, self.room)
+        booking.book_room(self.bob, self.room)
+
+        call_command('archive_bookings', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(Booking.objects.values_list('user__username', 'term')), [('bob', '2026-27')])
+        archived = dict(ArchivedBooking.objects.values_list('user_id', 'status'))
+        self.assertEqual(archived, {self.alice.pk: Booking.ENDED, self.bob.pk: Booking.CANCELLED})
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.occupancy, self.room.booked_by), (1, self.bob))
+
+    def test_current_term_is_refused(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_bookings', term=['2026-27'], stdout=StringIO())
+
+
+class AllocationImportExportTests(TestCase):
+    def setUp(self):
+        self.block = make_block('B1', floors=1, rooms_per_floor=2, capacity=2)
+        make_block('G1', gender='F', floors=1, rooms_per_floor=1)
+        self.room = Room.objects.get(floor__block=self.block, room_number='101')
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        for name in ('alice', 'bob', 'carol', 'dave'):
+            make_user(name)
+        make_user('gina', gender='F')
+        booking.book_room(make_user('erin'), self.room)
+
+    def _path(self, name, content=None):
+        path = os.path.join(self.workdir, name)
+        if content is not None:
+            with open(path, 'w') as fh:
+                fh.write(content)
+        return path
+
+    def test_valid_rows_are_booked_and_the_rest_reported(self):
+        source = self._path('in.csv', (
+            'username,block,floor,room\n'
+            'alice,B1,1,101\n'
+            'bob,B1,1,101\n'      # the room's last spot went to alice
+            'alice,B1,1,102\n'    # alice is placed already
+            'carol,B1,1,102\n'
+            'gina,B1,1,102\n'
+            'erin,B1,1,102\n'
+            'nobody,B1,1,102\n'
+            'dave,B9,1,101\n'
+            'dave,B1,one,102\n'
+        ))
+        rejects = self._path('rejects.csv')
+        call_command('import_allocations', source, batch_size=3, rejects=rejects, stdout=StringIO())
+
+        self.assertEqual(
+            dict(Booking.objects.active().values_list('user__username', 'room__room_number')),
+            {'erin': '101', 'alice': '101', 'carol': '102'},
+        )
+        self.assertFalse(Room.objects.drifted().exists())
+        with open(rejects) as fh:
+            reasons = {(row['line'], row['reason']) for row in csv.DictReader(fh)}
+        self.assertEqual(reasons, {
+            ('3', 'room is full'), ('4', 'student already has a room'), ('6', 'block is for the other gender'),
+            ('7', 'student already has a room'), ('8', 'unknown user'), ('9', 'unknown room'), ('10', 'invalid row'),
+        })
+
+    def test_export_round_trips_through_a_dry_run_import(self):
+        booking.book_room(User.objects.get(username='alice'), self.room)
+        exported = self._path('out.jsonl')
+        call_command('export_allocations', format='jsonl', output=exported, stdout=StringIO())
+        with open(exported) as fh:
+            rows = [json.loads(line) for line in fh]
+        self.assertEqual([row['username'] for row in rows], ['erin', 'alice'])
+        self.assertEqual(rows[0], {'username': 'erin', 'block': 'B1', 'floor': 1, 'room': '101', 'term': current_term()})
+
+        Booking.objects.all().delete()
+        Room.objects.sync_occupancy()
+        out = StringIO()
+        call_command('import_allocations', exported, dry_run=True, stdout=out)
+        self.assertIn('Would book 2 student(s)', out.getvalue())
+        self.assertFalse(Booking.objects.exists())
+
+
+class RoomAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('warden', password='pass12345'))
+        self.url = reverse('admin:hostel_room_changelist')
+
+    def _changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rooms(self):
+        block = make_block('B1', floors=1, rooms_per_floor=2)
+        booking.book_room(make_user('alice'), Room.objects.filter(floor__block=block).first())
+        small = self._changelist_queries()
+        make_block('B2', floors=4, rooms_per_floor=10)
+        for num, room in enumerate(Room.objects.filter(floor__block__block_name='B2')[:10]):
+            booking.book_room(make_user(f'student{num}'), room)
+        self.assertEqual(self._changelist_queries(), small)
+        self.assertLessEqual(self._changelist_queries(o='-6', occupancy_status='partial'), small)
+
+    def test_evict_and_change_capacity_are_set_based(self):
+        block = make_block('B1', floors=1, rooms_per_floor=3, capacity=2)
+        first, second, third = Room.objects.filter(floor__block=block).order_by('room_number')
+        for name in ('alice', 'bob'):
+            booking.book_room(make_user(name), first)
+        booking.book_room(make_user('carol'), second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'action': 'change_capacity', '_selected_action': [first.pk, third.pk], 'apply': '1', 'capacity': 1})
+        self.assertEqual(dict(Room.objects.values_list('room_number', 'capacity')), {'101': 2, '102': 2, '103': 1})
+
+        confirm = self.client.post(self.url, {'action': 'change_capacity', '_selected_action': [second.pk]})
+        self.assertContains(confirm, 'New capacity for 1 room')
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(self.url, {'action': 'evict_occupants', '_selected_action': [first.pk, second.pk]})
+        self.assertFalse(Booking.objects.active().exists())
+        self.assertEqual(set(Room.objects.values_list('occupancy', 'is_booked', 'booked_by')), {(0, False, None)})
+        self.assertEqual(len([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]), 3)
+
+    def test_booking_admin_refuses_a_full_room(self):
+        room = Room.objects.filter(floor__block=make_block('B1', floors=1, rooms_per_floor=1, capacity=1)).get()
+        booking.book_room(make_user('alice'), room)
+        bob = make_user('bob')
+        cancelled = Booking.objects.create(user=bob, room=room, status=Booking.CANCELLED)
+
+        def post(url, user, status):
+            return self.client.post(url, {
+                'user': user.pk, 'room': room.pk, 'term': current_term(), 'status': status,
+                'created_at_0': '2026-01-01', 'created_at_1': '10:00:00',
+            })
+
+        response = post(reverse('admin:hostel_booking_add'), make_user('carol'), Booking.ACTIVE)
+        self.assertContains(response, 'is full (1 of 1 beds taken)')
+        response = post(reverse('admin:hostel_booking_change', args=[cancelled.pk]), bob, Booking.ACTIVE)
+        self.assertContains(response, 'is full (1 of 1 beds taken)')
+        self.assertEqual(Booking.objects.active().count(), 1)
+        # The booking already in the room does not count against itself
+        alice_booking = Booking.objects.active().get()
+        response = post(reverse('admin:hostel_booking_change', args=[alice_booking.pk]), alice_booking.user, Booking.ACTIVE)
+        self.assertEqual(response.status_code, 302)
+        room.refresh_from_db()
+        self.assertEqual(room.occupancy, 1)
+
+    def test_large_unfiltered_lists_use_the_row_estimate(self):
+        make_block('B1', floors=1, rooms_per_floor=3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with patch('hostel.admin.ESTIMATED_COUNT_THRESHOLD', 1), CaptureQueriesContext(connection) as ctx:
+            self.client.get(self.url)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(*)' in q['sql'] and '"hostel_room"' in q['sql']])
+
+
+class PopulateSampleDataTests(TestCase):
+    def test_generates_students_and_bookings_idempotently(self):
+        out = StringIO()
+        options = {'blocks': 1, 'floors': 2, 'rooms': 3, 'users': 10, 'booked_ratio': 1.0, 'stdout': out}
+        call_command('populate_sample_data', **options)
+        call_command('populate_sample_data', **options)
+
+        self.assertEqual(Room.objects.count(), 12)
+        self.assertEqual(UserProfile.objects.filter(gender='M').count(), 5)
+        self.assertEqual(Booking.objects.active().count(), 10)
+        self.assertFalse(Room.objects.drifted().exists())
+        for room in Room.objects.filter(occupancy__gt=0).select_related('floor__block', 'booked_by__profile'):
+            self.assertEqual(room.booked_by.profile.gender, room.floor.block.gender)
+
+
+class ViewQueryBudgetTests(TestCase):
+    def test_booking_paths_stay_within_query_budgets(self):
+        cache.clear()
+        seed_hostel(blocks=1, floors=3, rooms=10, users=40)
+        results = run_view_benchmarks(iterations=2)
+        over = {row['view']: row['max_queries'] for row in results if row['over_budget']}
+        self.assertEqual(over, {})
+
+    @override_settings(HOSTEL_ADMISSION_ENABLED=True, HOSTEL_ADMISSION_USER_BURST=3)
+    def test_admission_control_does_not_throttle_the_harness(self):
+        cache.clear()
+        seed_hostel(blocks=1, floors=1, rooms=4, users=8)
+        results = run_view_benchmarks(iterations=4)
+        self.assertEqual({row['requests'] for row in results}, {4})
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.user = make_user('student')
+        self.block = make_block('B1', floors=1, rooms_per_floor=2)
+        self.client.force_login(self.user)
+
+    def test_views_are_recorded_and_exposed(self):
+        self.client.get(reverse('block_layout', args=[self.block.pk]))
+        self.client.get(reverse('block_layout', args=[self.block.pk]))
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn('hostel_requests_total{view="block_layout",status="200"} 2', body)
+        self.assertIn('hostel_request_duration_seconds_count{view="block_layout"} 2', body)
+        self.assertIn('hostel_availability_cache_requests_total{view="block_layout",result="hit"} 1', body)
+        self.assertIn('hostel_availability_cache_requests_total{view="block_layout",result="miss"} 1', body)
+        self.assertRegex(body, r'hostel_request_template_duration_seconds_sum\{view="block_layout"\} 0\.\d*[1-9]')
+
+    @override_settings(HOSTEL_METRICS_TOKEN='scrape-secret')
+    def test_token_protects_endpoint(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(HOSTEL_SLOW_REQUEST_QUERIES=1)
+    def test_slow_requests_are_logged_with_queries(self):
+        with self.assertLogs('hostel.metrics', level='WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        self.assertIn('view dashboard', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    async def test_sync_views_under_asgi_count_their_queries(self):
+        await self.async_client.aforce_login(self.user)
+        self.assertEqual((await self.async_client.get(reverse('dashboard'))).status_code, 200)
+        body = metrics.registry.render()
+        self.assertRegex(body, r'hostel_request_sql_queries_sum\{view="dashboard"\} [1-9]')
+        self.assertRegex(body, r'hostel_request_sql_duration_seconds_sum\{view="dashboard"\} 0\.\d*[1-9]')
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.directory = tempfile.mkdtemp(prefix='hostel-profiles-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.block = make_block('B1', floors=1, rooms_per_floor=2)
+        self.user = make_user('student')
+        self.client.force_login(self.user)
+
+    def test_sampled_and_signed_requests_are_dumped_and_reported(self):
+        url = reverse('block_layout', args=[self.block.pk])
+        self.client.get(url, HTTP_X_HOSTEL_PROFILE=profiling.sign_token())
+        self.assertEqual(profiling.dumps_by_view(self.directory), {})  # off unless enabled
+
+        with self.settings(HOSTEL_PROFILING_ENABLED=True, HOSTEL_PROFILING_SAMPLE_RATE=0, HOSTEL_PROFILING_DIR=self.directory):
+            client = self.client_class()
+            client.force_login(make_user('other'))
+            client.get(url)
+            client.get(url, HTTP_X_HOSTEL_PROFILE='profile:forged:signature')
+            self.assertEqual(profiling.dumps_by_view(self.directory), {})
+            client.get(url, HTTP_X_HOSTEL_PROFILE=profiling.sign_token())
+            with self.settings(HOSTEL_PROFILING_SAMPLE_RATE=1):
+                client.get(reverse('blocks_list'))
+
+        dumps = profiling.dumps_by_view(self.directory)
+        self.assertEqual(sorted(dumps), ['block_layout', 'blocks_list'])
+        out = StringIO()
+        call_command('profile_report', dir=self.directory, view='block_layout', stdout=out)
+        self.assertIn('block_layout: 1 profile(s)', out.getvalue())
+        self.assertIn('block_layout_view', out.getvalue())
+        self.assertNotIn('blocks_list', out.getvalue())
+        body = metrics.registry.render()
+        self.assertIn('hostel_profiled_requests_total{view="block_layout",trigger="header"} 1', body)
+        self.assertIn('hostel_profiled_requests_total{view="blocks_list",trigger="sample"} 1', body)
+
+    def test_profiled_views_still_pass_the_csrf_check(self):
+        room = Room.objects.filter(floor__block=self.block).first()
+        with self.settings(HOSTEL_PROFILING_ENABLED=True, HOSTEL_PROFILING_SAMPLE_RATE=1, HOSTEL_PROFILING_DIR=self.directory):
+            client = self.client_class(enforce_csrf_checks=True)
+            client.force_login(self.user)
+            self.assertEqual(client.post(reverse('book_room', args=[room.pk])).status_code, 403)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(profiling.dumps_by_view(self.directory), {})
+
+    async def test_under_asgi_sync_views_are_profiled_and_async_views_pass_through(self):
+        await self.async_client.aforce_login(self.user)
+        header = {profiling.HEADER: profiling.sign_token()}
+        with self.settings(
+            ROOT_URLCONF=browsing_urlconf(async_browsing=True), HOSTEL_ASYNC_VIEWS=True, HOSTEL_PROFILING_ENABLED=True,
+            HOSTEL_PROFILING_SAMPLE_RATE=0, HOSTEL_PROFILING_DIR=self.directory,
+        ):
+            with self.assertLogs('hostel.profiling', level='WARNING') as logs:
+                self.assertEqual((await self.async_client.get(reverse('dashboard'), headers=header)).status_code, 200)
+                response = await self.async_client.get(reverse('block_layout', args=[self.block.pk]), headers=header)
+                self.assertEqual(response.status_code, 200)
+        self.assertIn('async browsing views (HOSTEL_ASYNC_VIEWS) are not profiled', logs.output[0])
+        self.assertIn('async views are not profiled', logs.output[1])
+        self.assertEqual(sorted(profiling.dumps_by_view(self.directory)), ['dashboard'])
+
+    def test_budget_and_rotation_bound_the_cost(self):
+        budget = profiling.Budget(per_minute=2)
+        self.assertTrue(budget.acquire(now=0))
+        self.assertFalse(budget.acquire(now=0))  # one profile at a time
+        budget.release()
+        self.assertTrue(budget.acquire(now=1))
+        budget.release()
+        self.assertFalse(budget.acquire(now=2))  # two a minute
+        self.assertTrue(budget.acquire(now=61))
+        budget.release()
+
+        self.assertEqual(profiling.parse_dump_name(profiling.dump_name('admin:index', 0.25, when=0, pid=7)), ('admin.index', 250))
+        profiler = cProfile.Profile()
+        profiler.enable()
+        profiler.disable()
+        paths = [profiling.write_dump(profiler, 'book_room', 0.1 * n, self.directory, keep=2) for n in range(3)]
+        self.assertEqual(sorted(os.listdir(self.directory)), [path.name for path in paths[1:]])
+        # Fewer dumps than keep are all kept, and keep=0 still keeps the new one
+        profiling.write_dump(profiler, 'book_room', 0.4, self.directory, keep=5)
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        path = profiling.write_dump(profiler, 'book_room', 0.5, self.directory, keep=0)
+        self.assertEqual(os.listdir(self.directory), [path.name])
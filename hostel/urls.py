@@ -1,16 +1,41 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, async_views, views
 
-urlpatterns = [
-    path('register/', views.register_view, name='register'),
-    path('login/', auth_views.LoginView.as_view(template_name='hostel/login.html'), name='login'),
-    path('logout/', views.logout_view, name='logout'),
-    path('dashboard/', views.dashboard_view, name='dashboard'),
-    path('blocks/', views.blocks_list_view, name='blocks_list'),
-    path('block/<int:block_id>/', views.block_layout_view, name='block_layout'),
-    path('room/<int:room_id>/', views.room_detail_view, name='room_detail'),
-    path('room/<int:room_id>/confirm/', views.confirm_booking_view, name='confirm_booking'),
-    path('room/<int:room_id>/book/', views.book_room_view, name='book_room'),
-    path('room/<int:room_id>/cancel/', views.cancel_booking_view, name='cancel_booking'),
-]
+
+def browsing_patterns(module):
+    """The read-only browsing pages, served by views or async_views"""
+    return [
+        path('blocks/', module.blocks_list_view, name='blocks_list'),
+        path('block/<int:block_id>/', module.block_layout_view, name='block_layout'),
+        path('room/<int:room_id>/', module.room_detail_view, name='room_detail'),
+    ]
+
+
+def build_urlpatterns(async_browsing=False):
+    return [
+        path('register/', views.register_view, name='register'),
+        path('login/', auth_views.LoginView.as_view(template_name='hostel/login.html'), name='login'),
+        path('logout/', views.logout_view, name='logout'),
+        path('dashboard/', views.dashboard_view, name='dashboard'),
+        path('warden/', views.warden_dashboard_view, name='warden_dashboard'),
+        *browsing_patterns(async_views if async_browsing else views),
+        path('block/<int:block_id>/events/', views.block_events_view, name='block_events'),
+        path('room/assign/', views.assign_room_view, name='assign_room'),
+        path('room/<int:room_id>/confirm/', views.confirm_booking_view, name='confirm_booking'),
+        path('room/<int:room_id>/group/', views.group_booking_view, name='group_booking'),
+        path('room/<int:room_id>/book/', views.book_room_view, name='book_room'),
+        path('room/<int:room_id>/cancel/', views.cancel_booking_view, name='cancel_booking'),
+        path('lottery/', views.lottery_view, name='lottery'),
+        path('queue/status/', views.queue_status_view, name='queue_status'),
+        path('metrics/', views.metrics_view, name='metrics'),
+        path('api/blocks/', api.blocks_api, name='api_blocks'),
+        path('api/blocks/<int:block_id>/rooms/', api.block_rooms_api, name='api_block_rooms'),
+        path('api/rooms/<int:room_id>/', api.room_api, name='api_room'),
+        path('api/groups/', api.group_bookings_api, name='api_group_bookings'),
+        path('api/events/', api.booking_events_api, name='api_booking_events'),
+    ]
+
+
+urlpatterns = build_urlpatterns(settings.HOSTEL_ASYNC_VIEWS)
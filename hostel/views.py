@@ -1,11 +1,31 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q
-from django.http import HttpResponseForbidden
-from .models import Block, Floor, Room, UserProfile
-from .forms import CustomUserCreationForm
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.views.decorators.http import condition, require_POST
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from .models import Block, BlockOccupancy, FloorOccupancy, Room, RoomRequest, UserProfile
+from . import availability, live, metrics
+from . import admission
+from .admission import admission_controlled
+from .routers import pin_to_primary, read_only_view
+from .forms import AssignRoomForm, CustomUserCreationForm, GroupBookingForm, LotteryEntryForm
+from .services import assignment, booking, lottery
+from .services.booking import BookingStatus
+
+
+# Live availability stream: comment line interval and client reconnect delay
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_RETRY_MS = 3000
 
 
 def register_view(request):
@@ -32,26 +52,161 @@ def logout_view(request):
     return redirect('login')
 
 
+def _user_gender_or_redirect(request):
+    """Return (gender, None), or (None, redirect) if the user may not browse rooms yet"""
+    user_profile = request.user_context.profile
+    if user_profile is None:
+        UserProfile.objects.create(user=request.user)
+        messages.error(request, 'Your profile was missing. Please update your gender information.')
+        return None, redirect('dashboard')
+    
+    # CRITICAL: Deny access if gender is not set
+    if not user_profile.gender:
+        messages.error(request, 'Gender information is required. Access denied.')
+        return None, redirect('dashboard')
+    
+    return user_profile.gender, None
+
+
+def _page_validators(request, block):
+    """
+    (ETag, Last-Modified) of a page built from a block's availability
+    snapshots, as this viewer sees it, or (None, None) when the page has to be
+    rendered: flash messages are waiting, there is no CSRF cookie yet, or the
+    view is about to refuse access. Costs cache lookups and the viewer's
+    profile; never a room or booking query.
+    """
+    csrf_secret = request.META.get('CSRF_COOKIE')
+    if (
+        block is None or not csrf_secret
+        or len(messages.get_messages(request))
+        or request.user_context.gender != block['gender']
+    ):
+        return None, None
+
+    user = request.user
+    # The page shows the viewer's name and embeds a token derived from their CSRF secret
+    viewer = salted_hmac(
+        'hostel.views.page_validators', f'{user.pk}:{user.username}:{user.get_full_name()}:{csrf_secret}',
+    ).hexdigest()[:16]
+    user_scope = availability.user_scope(user.pk)
+    etag = availability.etag(block['id'], user.pk, availability.get_version(user_scope), viewer)
+    changed = max(availability.last_changed(block['id']), availability.last_changed(user_scope))
+    return etag, datetime.fromtimestamp(changed, tz=timezone.utc)
+
+
+def _memoized_validators(request, key, get_block):
+    memo = request.__dict__.setdefault('_page_validators', {})
+    if key not in memo:
+        memo[key] = _page_validators(request, get_block())
+    return memo[key]
+
+
+def _block_layout(request, block_id):
+    """The block's layout snapshot, looked up once per request"""
+    layouts = request.__dict__.setdefault('_block_layouts', {})
+    if block_id not in layouts:
+        layouts[block_id] = availability.get_block_layout(block_id)
+    return layouts[block_id]
+
+
+def _layout_validators(request, block_id):
+    # The view renders this same snapshot, so looking it up first costs nothing extra
+    def get_block():
+        layout = _block_layout(request, block_id)
+        return layout['block'] if layout else None
+    return _memoized_validators(request, ('layout', block_id), get_block)
+
+
+def _room_validators(request, room_id):
+    def get_block():
+        block_id = availability.room_block_id(room_id)
+        return availability.get_block(block_id) if block_id is not None else None
+    return _memoized_validators(request, ('room', room_id), get_block)
+
+
+def _layout_etag(request, block_id):
+    return _layout_validators(request, block_id)[0]
+
+
+def _layout_last_modified(request, block_id):
+    return _layout_validators(request, block_id)[1]
+
+
+def _room_etag(request, room_id):
+    return _room_validators(request, room_id)[0]
+
+
+def _room_last_modified(request, room_id):
+    return _room_validators(request, room_id)[1]
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint for this worker's request metrics"""
+    token = settings.HOSTEL_METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def queue_status_view(request):
+    """Waiting room poll: the ticket's place in the queue, from the cache alone (no session, no query)"""
+    ticket = admission.read_ticket(request.GET.get('ticket', ''))
+    if ticket is None:
+        return JsonResponse({'error': 'Invalid or expired ticket.'}, status=400)
+    position, ready = admission.ticket_status(ticket)
+    response = JsonResponse({'position': position, 'ready': ready})
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
 @login_required
+@read_only_view
 def dashboard_view(request):
-    # Find room where user is an occupant
-    user_room = Room.objects.filter(booked_by_users=request.user).first()
+    # Room where user is an occupant, already loaded with its floor and block
     context = {
         'user': request.user,
-        'user_room': user_room,
+        'user_room': request.user_context.room,
     }
     return render(request, 'hostel/dashboard.html', context)
 
 
 @login_required
+@read_only_view
+def warden_dashboard_view(request):
+    """Beds and occupants per block and floor, for staff, read from the occupancy summary alone"""
+    if not request.user.is_staff:
+        messages.error(request, 'Only wardens can see the occupancy dashboard.')
+        return redirect('dashboard')
+    
+    floors = {}
+    for floor in FloorOccupancy.objects.select_related('floor').order_by('floor__floor_number'):
+        floors.setdefault(floor.block_id, []).append(floor)
+    blocks = list(BlockOccupancy.objects.select_related('block').order_by('block__gender', 'block__block_name'))
+    for block in blocks:
+        block.floor_rows = floors.get(block.block_id, [])
+    
+    context = {
+        'blocks': blocks,
+        'beds': sum(block.beds for block in blocks),
+        'occupied': sum(block.occupied for block in blocks),
+        'free_beds': sum(block.free_beds for block in blocks),
+    }
+    return render(request, 'hostel/warden_dashboard.html', context)
+
+
+@login_required
+@read_only_view
 def blocks_list_view(request):
     """Show list of blocks filtered by user's gender"""
     # Get user's gender from profile - with proper error handling
-    try:
-        user_profile = request.user.profile
-    except UserProfile.DoesNotExist:
+    user_profile = request.user_context.profile
+    if user_profile is None:
         # Create profile if it doesn't exist
-        user_profile = UserProfile.objects.create(user=request.user)
+        UserProfile.objects.create(user=request.user)
         messages.warning(request, 'Your profile was missing. Please update your gender information.')
         return redirect('dashboard')
     
@@ -62,7 +217,7 @@ def blocks_list_view(request):
         messages.error(request, 'Gender information is required to view blocks. Please contact administrator or re-register with gender information.')
         return redirect('dashboard')
     
-    blocks = Block.objects.filter(gender=user_gender).order_by('block_name')
+    blocks = availability.get_blocks_list(user_gender)
     
     context = {
         'blocks': blocks,
@@ -72,80 +227,100 @@ def blocks_list_view(request):
 
 
 @login_required
+@read_only_view
+@condition(etag_func=_layout_etag, last_modified_func=_layout_last_modified)
 def block_layout_view(request, block_id):
     """Show layout of a specific block"""
-    block = get_object_or_404(Block, id=block_id)
+    # Floors, rooms and occupancy come from the versioned availability cache
+    layout = _block_layout(request, block_id)
+    if layout is None:
+        raise Http404('No Block matches the given query.')
+    block = layout['block']
     
     # STRICT Check if user has access to this block based on gender
-    try:
-        user_profile = request.user.profile
-    except UserProfile.DoesNotExist:
-        user_profile = UserProfile.objects.create(user=request.user)
-        messages.error(request, 'Your profile was missing. Please update your gender information.')
-        return redirect('dashboard')
-    
-    user_gender = user_profile.gender
-    
-    # CRITICAL: Deny access if gender doesn't match or is not set
-    if not user_gender:
-        messages.error(request, 'Gender information is required. Access denied.')
-        return redirect('dashboard')
+    user_gender, denied = _user_gender_or_redirect(request)
+    if denied:
+        return denied
     
-    if block.gender != user_gender:
-        messages.error(request, f'Access denied: You do not have permission to view {block.block_name} block. This block is for {block.get_gender_display()}s only.')
+    if block['gender'] != user_gender:
+        messages.error(request, f"Access denied: You do not have permission to view {block['block_name']} block. This block is for {block['gender_display']}s only.")
         return redirect('blocks_list')
     
-    floors = Floor.objects.filter(block=block).order_by('floor_number')
-    
-    # Organize rooms by floor
-    floors_data = []
-    for floor in floors:
-        rooms = Room.objects.filter(floor=floor).order_by('room_number')
-        floors_data.append({
-            'floor': floor,
-            'rooms': rooms
-        })
-    
+    # Not 'block': inside {% block %} tags that name refers to the template block itself
     context = {
-        'block': block,
-        'floors_data': floors_data,
+        'hostel_block': block,
+        'floors_data': layout['floors'],
     }
     return render(request, 'hostel/block_layout.html', context)
 
 
 @login_required
+async def block_events_view(request, block_id):
+    """Server-Sent Events stream of room occupancy changes for a block (ASGI only)"""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be held for the whole connection; 204 tells EventSource not to retry
+        return HttpResponse(status=204)
+    
+    user = await request.auser()
+    user_profile = await UserProfile.objects.filter(user_id=user.pk).afirst()
+    block = await Block.objects.filter(pk=block_id).afirst()
+    if block is None:
+        raise Http404('No Block matches the given query.')
+    if user_profile is None or block.gender != user_profile.gender:
+        return HttpResponseForbidden()
+    
+    subscription = live.broker.subscribe(block.pk)
+    
+    async def stream():
+        try:
+            # Start from the current state so nothing between page render and connect is missed
+            layout = await sync_to_async(availability.get_block_layout)(block.pk)
+            floors = layout['floors'] if layout else []
+            rooms = [room for floor in floors for room in floor['rooms']]
+            yield f"retry: {LIVE_RETRY_MS}\nevent: snapshot\ndata: {json.dumps({'rooms': rooms})}\n\n"
+            while True:
+                if subscription.overflowed:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                try:
+                    room = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'event: room\ndata: {json.dumps(room)}\n\n'
+        finally:
+            live.broker.unsubscribe(subscription)
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@read_only_view
+@condition(etag_func=_room_etag, last_modified_func=_room_last_modified)
 def room_detail_view(request, room_id):
-    room = get_object_or_404(Room, id=room_id)
+    room = get_object_or_404(Room.objects.select_related('floor__block'), id=room_id)
     
     # STRICT Check if user has access to this room's block
-    try:
-        user_profile = request.user.profile
-    except UserProfile.DoesNotExist:
-        user_profile = UserProfile.objects.create(user=request.user)
-        messages.error(request, 'Your profile was missing. Please update your gender information.')
-        return redirect('dashboard')
-    
-    user_gender = user_profile.gender
-    
-    # CRITICAL: Deny access if gender doesn't match or is not set
-    if not user_gender:
-        messages.error(request, 'Gender information is required. Access denied.')
-        return redirect('dashboard')
+    user_gender, denied = _user_gender_or_redirect(request)
+    if denied:
+        return denied
     
     if room.floor.block.gender != user_gender:
         messages.error(request, f'Access denied: You cannot access rooms in {room.floor.block.block_name} block. This block is for {room.floor.block.get_gender_display()}s only.')
         return redirect('blocks_list')
     
-    # Check if user is already in this room
-    user_in_room = room.booked_by_users.filter(id=request.user.id).exists()
-    # Check if user has any booking
-    user_has_booking = Room.objects.filter(booked_by_users=request.user).exists()
+    # Check if user is already in this room / has any booking
+    user_in_room = request.user_context.is_in_room(room)
+    user_has_booking = request.user_context.has_booking
     # Check if room has available spots
     available_spots = room.get_available_spots()
     can_book = available_spots > 0 and not user_in_room
     
     # Get all occupants
-    occupants = room.booked_by_users.all()
+    occupants = room.get_occupants()
     
     context = {
         'room': room,
@@ -160,24 +335,15 @@ def room_detail_view(request, room_id):
 
 
 @login_required
+@admission_controlled
 def confirm_booking_view(request, room_id):
     """Confirmation page before booking"""
-    room = get_object_or_404(Room, id=room_id)
+    room = get_object_or_404(Room.objects.select_related('floor__block'), id=room_id)
     
     # STRICT Check if user has access to this room's block
-    try:
-        user_profile = request.user.profile
-    except UserProfile.DoesNotExist:
-        user_profile = UserProfile.objects.create(user=request.user)
-        messages.error(request, 'Your profile was missing. Please update your gender information.')
-        return redirect('dashboard')
-    
-    user_gender = user_profile.gender
-    
-    # CRITICAL: Deny access if gender doesn't match or is not set
-    if not user_gender:
-        messages.error(request, 'Gender information is required. Access denied.')
-        return redirect('dashboard')
+    user_gender, denied = _user_gender_or_redirect(request)
+    if denied:
+        return denied
     
     if room.floor.block.gender != user_gender:
         messages.error(request, f'Access denied: You cannot book rooms in {room.floor.block.block_name} block. This block is for {room.floor.block.get_gender_display()}s only.')
@@ -189,115 +355,183 @@ def confirm_booking_view(request, room_id):
         return redirect('room_detail', room_id=room.id)
     
     # Check if user is already in this room
-    if room.booked_by_users.filter(id=request.user.id).exists():
+    if request.user_context.is_in_room(room):
         messages.error(request, 'You are already booked in this room.')
         return redirect('room_detail', room_id=room.id)
     
-    user_has_booking = Room.objects.filter(booked_by_users=request.user).exists()
-    available_spots = room.get_available_spots()
-    
     context = {
         'room': room,
-        'user_has_booking': user_has_booking,
-        'available_spots': available_spots,
+        'user_has_booking': request.user_context.has_booking,
+        'available_spots': room.get_available_spots(),
         'current_occupancy': room.get_current_occupancy(),
     }
     return render(request, 'hostel/confirm_booking.html', context)
 
 
 @login_required
+@require_POST
+@admission_controlled
 def book_room_view(request, room_id):
-    room = get_object_or_404(Room, id=room_id)
+    room = get_object_or_404(Room.objects.select_related('floor__block'), id=room_id)
     
     # STRICT Check if user has access to this room's block
-    try:
-        user_profile = request.user.profile
-    except UserProfile.DoesNotExist:
-        user_profile = UserProfile.objects.create(user=request.user)
-        messages.error(request, 'Your profile was missing. Please update your gender information.')
-        return redirect('dashboard')
-    
-    user_gender = user_profile.gender
-    
-    # CRITICAL: Deny access if gender doesn't match or is not set
-    if not user_gender:
-        messages.error(request, 'Gender information is required. Access denied.')
-        return redirect('dashboard')
+    user_gender, denied = _user_gender_or_redirect(request)
+    if denied:
+        return denied
     
     if room.floor.block.gender != user_gender:
         messages.error(request, f'Access denied: You cannot book rooms in {room.floor.block.block_name} block. This block is for {room.floor.block.get_gender_display()}s only.')
         return redirect('blocks_list')
     
-    # Check if room is full
-    if room.is_full():
+    # Capacity, membership and the room switch are all checked inside one transaction
+    result = booking.book_room(request.user, room, switch=request.POST.get('confirm_switch') == 'yes')
+    
+    if result.status == BookingStatus.ROOM_FULL:
         messages.error(request, 'This room is at full capacity.')
         return redirect('room_detail', room_id=room.id)
     
-    # Check if user is already in this room
-    if room.booked_by_users.filter(id=request.user.id).exists():
+    if result.status == BookingStatus.ALREADY_IN_ROOM:
         messages.error(request, 'You are already booked in this room.')
         return redirect('room_detail', room_id=room.id)
     
-    # Check if user already has a booking in another room
-    user_other_room = Room.objects.filter(booked_by_users=request.user).exclude(id=room.id).first()
-    if user_other_room:
-        # Allow booking if they want to switch (we'll cancel the old one)
-        if request.POST.get('confirm_switch') == 'yes':
-            # Remove user from old room
-            user_other_room.booked_by_users.remove(request.user)
-            # Refresh from database
-            user_other_room.refresh_from_db()
-            # Update old room's booked_by and is_booked
-            if user_other_room.booked_by == request.user:
-                if user_other_room.booked_by_users.exists():
-                    user_other_room.booked_by = user_other_room.booked_by_users.first()
-                else:
-                    user_other_room.booked_by = None
-            user_other_room.is_booked = user_other_room.is_full()
-            user_other_room.save()
-        else:
-            messages.error(request, 'You already have a room booked. Please cancel it first or confirm to switch rooms.')
-            return redirect('room_detail', room_id=room.id)
-    
-    # Add user to the room
-    room.booked_by_users.add(request.user)
-    # Refresh from database to get updated count
-    room.refresh_from_db()
-    # Update is_booked and booked_by
-    room.is_booked = room.is_full()
-    if not room.booked_by:
-        room.booked_by = request.user
-    room.save()
-    
-    current_occupancy = room.get_current_occupancy()
-    messages.success(request, f'Successfully booked room {room.room_number} in {room.floor.block.block_name}! ({current_occupancy}/{room.capacity} occupants)')
+    if result.status == BookingStatus.HAS_OTHER_BOOKING:
+        messages.error(request, 'You already have a room booked. Please cancel it first or confirm to switch rooms.')
+        return redirect('room_detail', room_id=room.id)
+    
+    # A replica may not have this booking yet; show the student their own change from the primary
+    pin_to_primary(request)
+    messages.success(request, f'Successfully booked room {room.room_number} in {room.floor.block.block_name}! ({room.occupancy}/{room.capacity} occupants)')
     return redirect('dashboard')
 
 
 @login_required
+@admission_controlled
+def group_booking_view(request, room_id):
+    """Book a room for the student and their friends together, in one transaction"""
+    room = get_object_or_404(Room.objects.select_related('floor__block'), id=room_id)
+    
+    user_gender, denied = _user_gender_or_redirect(request)
+    if denied:
+        return denied
+    
+    if room.floor.block.gender != user_gender:
+        messages.error(request, f'Access denied: You cannot book rooms in {room.floor.block.block_name} block. This block is for {room.floor.block.get_gender_display()}s only.')
+        return redirect('blocks_list')
+    
+    form = GroupBookingForm(request.POST if request.method == 'POST' else None, user=request.user)
+    if form.is_valid():
+        friends = form.cleaned_data['usernames']
+        # Everyone gets a spot or nobody does: no stranger can take a spot halfway through
+        result = booking.book_group([request.user, *friends], room)
+        names = ', '.join(result.usernames)
+        
+        if result.status == BookingStatus.ROOM_FULL:
+            messages.error(request, f'This room does not have {len(friends) + 1} free spots.')
+        elif result.status == BookingStatus.HAS_OTHER_BOOKING:
+            messages.error(request, f'Already booked in another room: {names or "someone in your group"}. They must cancel first.')
+        elif result.status == BookingStatus.WRONG_GENDER:
+            messages.error(request, f'Cannot live in {room.floor.block.block_name} block: {names}.')
+        elif result.status == BookingStatus.ALREADY_IN_ROOM:
+            messages.error(request, 'Your whole group is already booked in this room.')
+        else:
+            pin_to_primary(request)
+            messages.success(request, f'Successfully booked room {room.room_number} in {room.floor.block.block_name} for {names}! ({room.occupancy}/{room.capacity} occupants)')
+            return redirect('dashboard')
+    
+    context = {
+        'room': room,
+        'form': form,
+        'available_spots': room.get_available_spots(),
+        'current_occupancy': room.get_current_occupancy(),
+    }
+    return render(request, 'hostel/group_booking.html', context)
+
+
+@login_required
+@admission_controlled
+def assign_room_view(request):
+    """Let the system pick the best free room matching the student's preferences"""
+    user_gender, denied = _user_gender_or_redirect(request)
+    if denied:
+        return denied
+    
+    form = AssignRoomForm(request.POST if request.method == 'POST' else None, gender=user_gender)
+    if form.is_valid():
+        preferences = form.preferences()
+        result = assignment.assign_room(request.user, user_gender, preferences)
+        
+        if result.status == BookingStatus.HAS_OTHER_BOOKING:
+            messages.error(request, 'You already have a room booked. Please cancel it first.')
+            return redirect('dashboard')
+        
+        if result.status == BookingStatus.NO_ROOM:
+            if preferences.roommate:
+                messages.error(request, f'{preferences.roommate} has no room with a free spot you can join.')
+            else:
+                messages.error(request, 'No free room matches your preferences. Try widening them.')
+        else:
+            room = Room.objects.select_related('floor__block').get(pk=result.room.pk)
+            pin_to_primary(request)
+            messages.success(request, f'You have been assigned room {room.room_number} in {room.floor.block.block_name}! ({room.occupancy}/{room.capacity} occupants)')
+            return redirect('dashboard')
+    
+    return render(request, 'hostel/assign_room.html', {'form': form})
+
+
+@login_required
+def lottery_view(request):
+    """Enter the current allocation round with ranked choices, and see where the draw put the student"""
+    user_gender, denied = _user_gender_or_redirect(request)
+    if denied:
+        return denied
+    
+    allocation_round = lottery.current_round()
+    if allocation_round is None:
+        messages.error(request, 'No room allocation round has opened yet.')
+        return redirect('dashboard')
+    
+    entry = (
+        RoomRequest.objects.filter(round=allocation_round, user=request.user)
+        .select_related('assigned_room__floor__block').first()
+    )
+    accepting = allocation_round.is_accepting()
+    if request.method == 'POST' and not accepting:
+        messages.error(request, f'{allocation_round.name} is no longer taking entries.')
+        return redirect('lottery')
+    
+    form = None
+    if accepting:
+        form = LotteryEntryForm(request.POST if request.method == 'POST' else None, gender=user_gender)
+        if form.is_valid():
+            lottery.enter_round(
+                allocation_round, request.user, form.cleaned_data['choices'], form.cleaned_data['group_code'],
+            )
+            pin_to_primary(request)
+            messages.success(request, f'Your choices for {allocation_round.name} are saved. You can change them until {allocation_round.closes_at:%d %b %H:%M}.')
+            return redirect('lottery')
+    
+    context = {
+        'round': allocation_round,
+        'entry': entry,
+        'preferences': entry.preferences.select_related('block', 'room__floor__block') if entry else [],
+        'form': form,
+    }
+    return render(request, 'hostel/lottery.html', context)
+
+
+@login_required
+@require_POST
+@admission_controlled
 def cancel_booking_view(request, room_id):
     """Cancel a booking"""
     room = get_object_or_404(Room, id=room_id)
     
-    # Check if user is in this room
-    if not room.booked_by_users.filter(id=request.user.id).exists():
+    result = booking.cancel_booking(request.user, room)
+    
+    if result.status == BookingStatus.NOT_IN_ROOM:
         messages.error(request, 'You are not booked in this room.')
         return redirect('dashboard')
     
-    # Remove user from room
-    room.booked_by_users.remove(request.user)
-    # Refresh from database to get updated count
-    room.refresh_from_db()
-    
-    # Update booked_by and is_booked
-    if room.booked_by == request.user:
-        if room.booked_by_users.exists():
-            room.booked_by = room.booked_by_users.first()
-        else:
-            room.booked_by = None
-    
-    room.is_booked = room.is_full()
-    room.save()
-    
+    pin_to_primary(request)
     messages.success(request, f'Successfully cancelled booking for room {room.room_number}.')
     return redirect('dashboard')
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hostel_booking.settings')
+# Browse with the async views, so a page waiting on the database doesn't hold a thread
+os.environ.setdefault('HOSTEL_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
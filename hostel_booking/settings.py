@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,13 +42,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'hostel.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'hostel.routers.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'hostel.middleware.UserContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hostel.middleware.ProfilingMiddleware',  # last: it calls the view itself
 ]
 
 ROOT_URLCONF = 'hostel_booking.urls'
@@ -62,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'hostel.context_processors.user_context',
             ],
         },
     },
@@ -73,12 +79,156 @@ WSGI_APPLICATION = 'hostel_booking.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+#
+# HOSTEL_SQLITE_PROFILE=production (the default) opens SQLite in WAL mode, so
+# readers carry on while a booking commits. Writers wait up to 'timeout' seconds
+# for each other (SQLite's busy timeout) rather than raising "database is locked".
+# HOSTEL_SQLITE_IMMEDIATE_WRITES makes the booking service's transactions
+# (hostel.services.booking.write_transaction) begin with BEGIN IMMEDIATE, so
+# they take the write lock up front instead of failing to upgrade a read lock
+# later; every other transaction stays deferred, so read-only atomic blocks
+# (reports, admin pages, replay_journal) never queue behind bookings.
+# HOSTEL_SQLITE_PROFILE=default keeps Django's stock settings.
+#
+# HOSTEL_READ_CONNECTION=1 adds a 'read' alias, a query-only connection to the
+# same file, which hostel.routers sends the read-only pages' queries to.
+#
+# HOSTEL_REPLICA_NAME=<path> sends them to a 'replica' alias at that file
+# instead, kept up to date by `manage.py sync_replica --interval 1` as a local
+# stand-in for replication. A student who has just booked or cancelled reads
+# from the primary for HOSTEL_PRIMARY_STICKY_SECONDS, so replication lag never
+# hides their own change.
+
+HOSTEL_SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',  # durable at checkpoints; a power cut can lose only the last commits
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',  # 256 MiB
+    'PRAGMA cache_size=-65536',  # 64 MiB per connection
+)
+
+HOSTEL_SQLITE_OPTIONS = {
+    'init_command': ';'.join(HOSTEL_SQLITE_PRAGMAS),
+    'timeout': 20,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': HOSTEL_SQLITE_OPTIONS if os.environ.get('HOSTEL_SQLITE_PROFILE', 'production') == 'production' else {},
+    }
+}
+
+HOSTEL_SQLITE_IMMEDIATE_WRITES = os.environ.get('HOSTEL_SQLITE_PROFILE', 'production') == 'production'
+
+DATABASE_ROUTERS = ['hostel.routers.ReadWriteRouter']
+
+HOSTEL_READ_DATABASE = None
+
+if os.environ.get('HOSTEL_READ_CONNECTION') == '1':
+    DATABASES['read'] = {
+        **DATABASES['default'],
+        'OPTIONS': {
+            'init_command': ';'.join((*HOSTEL_SQLITE_PRAGMAS, 'PRAGMA query_only=ON')),
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    HOSTEL_READ_DATABASE = 'read'
+
+if os.environ.get('HOSTEL_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['HOSTEL_REPLICA_NAME'],
+        'OPTIONS': {
+            'init_command': ';'.join((*HOSTEL_SQLITE_PRAGMAS, 'PRAGMA query_only=ON')),
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    HOSTEL_READ_DATABASE = 'replica'
+
+HOSTEL_PRIMARY_STICKY_SECONDS = int(os.environ.get('HOSTEL_PRIMARY_STICKY_SECONDS', '15'))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# Local memory by default. Set HOSTEL_CACHE_BACKEND/HOSTEL_CACHE_LOCATION (e.g.
+# django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379) to share
+# the cache between worker processes.
+#
+# Local memory culls a third of its keys once it holds MAX_ENTRIES (Django's
+# default is 300). The availability cache keeps a version per block, the block
+# of every room seen and two keys per student who booked, so size it for
+# blocks + rooms + students plus the snapshots; a culled block version
+# invalidates every snapshot and ETag of that block.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('HOSTEL_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('HOSTEL_CACHE_LOCATION', 'hostel-booking'),
     }
 }
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('HOSTEL_CACHE_MAX_ENTRIES', '200000'))}
+
+# Sessions are read on every request, so with the database backend every page
+# view (browsing included) would reach SQLite during the allocation window.
+# cached_db serves them from the cache and still writes them through to the
+# database, so a cache restart or eviction loses no logins.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Cache alias and lifetime (seconds) for block availability snapshots
+HOSTEL_AVAILABILITY_CACHE = 'default'
+HOSTEL_AVAILABILITY_TIMEOUT = 300
+# Lifetime of the per-student version keys and per-room block lookups; block versions never expire
+HOSTEL_AVAILABILITY_KEY_TIMEOUT = 86400
+
+# Serve the browsing pages (blocks, block layout, room detail) from hostel/async_views.py.
+# hostel_booking/asgi.py turns this on; under WSGI the sync views are cheaper.
+HOSTEL_ASYNC_VIEWS = os.environ.get('HOSTEL_ASYNC_VIEWS', '') == '1'
+
+
+# Admission control for the booking views (see hostel/admission.py). Concurrency and
+# rate are across all workers, so they need a shared cache when running more than one.
+HOSTEL_ADMISSION_ENABLED = os.environ.get('HOSTEL_ADMISSION_ENABLED', '1') == '1'
+HOSTEL_ADMISSION_CACHE = 'default'
+HOSTEL_ADMISSION_USER_RATE = float(os.environ.get('HOSTEL_ADMISSION_USER_RATE', '1'))  # per student, per second
+HOSTEL_ADMISSION_USER_BURST = int(os.environ.get('HOSTEL_ADMISSION_USER_BURST', '10'))
+HOSTEL_ADMISSION_CONCURRENCY = int(os.environ.get('HOSTEL_ADMISSION_CONCURRENCY', '4'))  # booking POSTs in flight
+HOSTEL_ADMISSION_SLOT_SECONDS = 30
+
+
+# Request metrics (served at /metrics/ in the Prometheus text format)
+#
+# Requests at or over either threshold are logged to 'hostel.metrics' with their
+# slowest queries. The endpoint accepts 'Authorization: Bearer <token>' when a token
+# is configured; otherwise only staff users may read it.
+
+HOSTEL_SLOW_REQUEST_SECONDS = float(os.environ.get('HOSTEL_SLOW_REQUEST_SECONDS', '0.5'))
+HOSTEL_SLOW_REQUEST_QUERIES = int(os.environ.get('HOSTEL_SLOW_REQUEST_QUERIES', '50'))
+HOSTEL_METRICS_TOKEN = os.environ.get('HOSTEL_METRICS_TOKEN', '')
+
+
+# Request profiling (off unless HOSTEL_PROFILING_ENABLED=1)
+#
+# Profiles the view of a random sample of requests, plus of any request sending
+# a signed 'X-Hostel-Profile' header (python manage.py profile_report --header),
+# with cProfile. Under ASGI sync views are profiled on their worker thread;
+# async views (HOSTEL_ASYNC_VIEWS) are not profiled. At most one request per
+# process is profiled at a time and at most HOSTEL_PROFILING_MAX_PER_MINUTE a
+# minute; the directory keeps the newest HOSTEL_PROFILING_MAX_DUMPS files (at
+# least 1).
+# python manage.py profile_report reads them.
+
+HOSTEL_PROFILING_ENABLED = os.environ.get('HOSTEL_PROFILING_ENABLED', '') == '1'
+HOSTEL_PROFILING_SAMPLE_RATE = float(os.environ.get('HOSTEL_PROFILING_SAMPLE_RATE', '0.01'))
+HOSTEL_PROFILING_MAX_PER_MINUTE = int(os.environ.get('HOSTEL_PROFILING_MAX_PER_MINUTE', '6'))
+HOSTEL_PROFILING_DIR = os.environ.get('HOSTEL_PROFILING_DIR', str(BASE_DIR / 'profiles'))
+HOSTEL_PROFILING_MAX_DUMPS = int(os.environ.get('HOSTEL_PROFILING_MAX_DUMPS', '500'))
+HOSTEL_PROFILING_TOKEN_MAX_AGE = 3600  # seconds a --header token stays valid
 
 
 # Password validation